@@ -1,5 +1,7 @@
-import yaml
-from utils_hf import read_parquet_hf
+from utils_hf import read_parquet_metadata_hf
+from hf_cache import ParquetCache
+from instrument import instrumented, span
+from utils_config import load_config
 
 REQUIRED_PR_COLS = {
     "id", "repo_id", "created_at", "closed_at", "state", "merged_at", "agent"
@@ -8,19 +10,26 @@ REQUIRED_REPO_COLS = {
     "id", "full_name", "stars"
 }
 
+@instrumented("00")
 def main():
-    cfg = yaml.safe_load(open("config/config.yaml", "r", encoding="utf-8"))
+    cfg = load_config()
     dataset_path = cfg["aidev_hf_dataset"]
     tables = cfg["tables"]
+    cache = ParquetCache.from_config(cfg)
 
     print("=== AIDev sanity check ===")
     print("HF dataset:", dataset_path)
 
-    pr = read_parquet_hf(dataset_path, tables["pull_request"])
-    repo = read_parquet_hf(dataset_path, tables["repository"])
+    # Footer metadata only: schema + row counts, no data pages decoded
+    with span("load_metadata") as sp:
+        pr = read_parquet_metadata_hf(dataset_path, tables["pull_request"], cache=cache)
+        repo = read_parquet_metadata_hf(dataset_path, tables["repository"], cache=cache)
+        sp.rows_out = pr.num_rows + repo.num_rows
+    pr_cols = pr.schema.to_arrow_schema().names
+    repo_cols = repo.schema.to_arrow_schema().names
 
-    missing_pr = REQUIRED_PR_COLS - set(pr.columns)
-    missing_repo = REQUIRED_REPO_COLS - set(repo.columns)
+    missing_pr = REQUIRED_PR_COLS - set(pr_cols)
+    missing_repo = REQUIRED_REPO_COLS - set(repo_cols)
 
     if missing_pr:
         raise ValueError(f"Missing PR columns: {sorted(missing_pr)}")
@@ -28,10 +37,10 @@ def main():
         raise ValueError(f"Missing repository columns: {sorted(missing_repo)}")
 
     print("✅ Schema sanity checks passed.")
-    print("PR rows:", len(pr))
-    print("Repo rows:", len(repo))
-    print("PR columns:", len(pr.columns))
-    print("Repo columns:", len(repo.columns))
+    print("PR rows:", pr.num_rows)
+    print("Repo rows:", repo.num_rows)
+    print("PR columns:", len(pr_cols))
+    print("Repo columns:", len(repo_cols))
 
 if __name__ == "__main__":
     main()
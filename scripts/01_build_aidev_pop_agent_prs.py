@@ -1,11 +1,24 @@
+import argparse
 import os
-import yaml
+import re
 import numpy as np
 import pandas as pd
-from utils_hf import read_parquet_hf
+import pyarrow as pa
+from utils_hf import read_parquet_hf, read_parquet_metadata_hf
+from hf_cache import ParquetCache
+from derived_io import apply_dtypes, export_csv, incremental, partitioned_dataset, upsert_derived, write_derived
+from key_index import load_key_index, update_key_index
+from instrument import record_frame, span, stage_report
+import sql_backend
+from utils_config import load_config
 
+OUT_NAME = "aidev_pop_ge500_agent_prs"
+SWEEP_NAME = "aidev_sweep_agent_prs"
+SWEEP_SUMMARY = "aidev_sweep_summary"
+VARIANT_KEYS = {"name", "min_stars", "agents", "end"}
 AGENT_COL_CANDIDATES = ["agent", "agent_type"]
 REPO_ID_COL = "repo_id"
+CHANGE_COLS = ["closed_at", "merged_at"]
 
 def derive_outcome(df: pd.DataFrame) -> pd.Series:
     # MERGED if merged_at exists, REJECTED if closed and not merged, else OPEN
@@ -17,95 +30,356 @@ def derive_outcome(df: pd.DataFrame) -> pd.Series:
 def to_datetime_safe(s: pd.Series) -> pd.Series:
     return pd.to_datetime(s, errors="coerce", utc=True)
 
-def main():
-    cfg = yaml.safe_load(open("config/config.yaml", "r", encoding="utf-8"))
+def time_window_end(cfg: dict):
+    # Opt-in (time_window.apply); end is inclusive ("through 2025-08-01"): keep created_at < end + 1 day
+    window = cfg.get("time_window") or {}
+    end = window.get("end")
+    if not end or not window.get("apply", False):
+        return None
+    return pd.Timestamp(end, tz="UTC") + pd.Timedelta(days=1)
+
+def time_window_filters(pr_schema: pa.Schema, cfg: dict) -> list:
+    # Only push down when created_at is stored as a timestamp; string columns
+    # are filtered after parsing instead.
+    end = time_window_end(cfg)
+    if end is None or "created_at" not in pr_schema.names:
+        return []
+    typ = pr_schema.field("created_at").type
+    if not pa.types.is_timestamp(typ):
+        return []
+    if typ.tz is None:
+        end = end.tz_localize(None)
+    return [("created_at", "<", end)]
+
+def build_rows(pr: pd.DataFrame, popular_repo: pd.DataFrame, agent_col: str, cfg: dict, index=None) -> pd.DataFrame:
+    """
+    Raw PR rows -> the PR-level dataset (timestamps, outcome, repo metadata, pr_key).
+    New PRs are added to the key index unless a fixed `index` is given.
+    """
+    # Preserve dataset PR id if present (helps join with comments)
+    if "id" in pr.columns:
+    	pr = pr.rename(columns={"id": "id_pr"})
+
+    # Standardize agent column -> agent_type
+    pr["agent_type"] = pr[agent_col].astype(str)
+    print("Agent PRs in popular repos (target agents):", len(pr))
+
+    with span("derive", rows_in=len(pr)) as sp:
+        # Parse timestamps
+        for col in ["created_at", "closed_at", "merged_at"]:
+            if col in pr.columns:
+                pr[col] = to_datetime_safe(pr[col])
+
+        # Time window (exact row-level check; pushdown above only covers timestamp columns)
+        window_end = time_window_end(cfg)
+        if window_end is not None:
+            pr = pr.loc[pr["created_at"] < window_end].copy()
+            print("Agent PRs within time window:", len(pr))
+
+        # Turnaround time (hours)
+        pr["turnaround_time_hours"] = (pr["closed_at"] - pr["created_at"]).dt.total_seconds() / 3600.0
+
+        # Outcome
+        pr["pr_outcome"] = derive_outcome(pr)
+        sp.rows_out = len(pr)
+
+    # Attach repo metadata
+    # PR table uses repo_id; repository table uses id
+    with span("join_repos", rows_in=len(pr)) as sp:
+        pr = pr.merge(popular_repo, left_on="repo_id", right_on="id", how="left", suffixes=("", "_repo"))
+        sp.rows_out = len(pr)
+    # Avoid confusion: keep repo id as repo_id, drop duplicate "id" from repo table
+    if "id_repo" in pr.columns:
+        pr = pr.drop(columns=["id_repo"], errors="ignore")
+    pr = pr.drop(columns=["id"], errors="ignore")  # repo id column from repo table merge
+
+    # Dense integer PR key used for joins in later steps (persisted, append-only)
+    with span("key_index", rows_in=len(pr)):
+        index = update_key_index(cfg, pr) if index is None else index
+        pr["pr_key"] = index.pr_keys(pr["full_name"], pr["number"])
+
+    # Reorder key columns first (keep the rest)
+    key_cols = [
+    "pr_key", "id_pr", "repo_id", "full_name", "stars",
+    "number",
+    "agent_type",
+    "created_at", "closed_at", "merged_at",
+    "turnaround_time_hours",
+    "state", "pr_outcome",
+    "title", "body"]
+
+    existing_key_cols = [c for c in key_cols if c in pr.columns]
+    remaining_cols = [c for c in pr.columns if c not in existing_key_cols]
+    return pr[existing_key_cols + remaining_cols]
+
+
+def same_time(a: pd.Series, b: pd.Series) -> np.ndarray:
+    return ((a == b) | (a.isna() & b.isna())).to_numpy()
+
+
+def ingest(cfg: dict, cache: ParquetCache, pr_filters: list, popular_repo: pd.DataFrame, agent_col: str) -> bool:
+    """
+    Update the partitioned PR dataset from a new snapshot. PRs are matched on
+    id_pr: new ones and those whose closed_at/merged_at changed are derived
+    again, PRs no longer selected (stars, agents, window) are dropped, and only
+    the partitions holding them are rewritten. False if a full rebuild is
+    needed instead (no id column, or the columns changed).
+    """
+    ds, t = cfg["aidev_hf_dataset"], cfg["tables"]
+    parts = partitioned_dataset(cfg, OUT_NAME)
+    if "id_pr" not in parts.columns:
+        return False
+
+    with span("scan_changes") as sp:
+        snap = read_parquet_hf(ds, t["pull_request"], cache=cache, columns=["id", "created_at"] + CHANGE_COLS,
+                               filters=pr_filters)
+        snap = snap.rename(columns={"id": "id_pr"})
+        for col in ["created_at"] + CHANGE_COLS:
+            snap[col] = to_datetime_safe(snap[col])
+        window_end = time_window_end(cfg)
+        if window_end is not None:
+            snap = snap.loc[snap["created_at"] < window_end]
+        old = parts.read(columns=["id_pr"] + CHANGE_COLS)
+        both = snap.merge(old, on="id_pr", how="left", suffixes=("", "_old"), indicator=True)
+        is_new = (both["_merge"] == "left_only").to_numpy()
+        unchanged = np.logical_and.reduce([same_time(both[c], both[c + "_old"]) for c in CHANGE_COLS])
+        delta_ids = both.loc[is_new | ~unchanged, "id_pr"].astype("int64")
+        gone = old.loc[~old["id_pr"].isin(snap["id_pr"]), "id_pr"].astype("int64")
+        sp.rows_in = len(snap) + len(old)
+        sp.rows_out = len(delta_ids) + len(gone)
+    print(f"Snapshot: {len(snap)} PRs; {int(is_new.sum())} new, {len(delta_ids) - int(is_new.sum())} changed, "
+          f"{len(gone)} no longer selected")
+
+    if len(delta_ids):
+        with span("load_prs") as sp:
+            pr = read_parquet_hf(ds, t["pull_request"], cache=cache,
+                                 filters=pr_filters + [("id", "in", delta_ids.tolist())])
+            sp.rows_out = len(pr)
+        record_frame("agent_prs_raw", pr)
+        pr = build_rows(pr, popular_repo, agent_col, cfg)
+    else:
+        pr = parts.read(partitions=[])  # no rows, same columns
+    pr = apply_dtypes(pr)
+    if list(pr.columns) != parts.columns:
+        print("PR columns changed since the last build; rebuilding all partitions.")
+        return False
+
+    record_frame("agent_prs", pr)
+    with span("upsert", rows_in=len(pr)):
+        stats = upsert_derived(pr, cfg, OUT_NAME, delete=gone.tolist())
+    counts = parts.read(columns=["pr_outcome", "agent_type"])
+    print("✅ Wrote:", parts.path)
+    print(f"Rewrote {stats['partitions']} of {stats['total_partitions']} partitions "
+          f"(+{stats['inserted']} inserted, {stats['updated']} updated, -{stats['deleted']} deleted)")
+    print("Rows:", len(counts), "Cols:", len(parts.columns))
+    print("Outcome counts:\n", counts["pr_outcome"].value_counts(dropna=False))
+    print("Agent counts:\n", counts["agent_type"].value_counts(dropna=False))
+    return True
+
+
+def sweep_variants(cfg: dict) -> list:
+    """
+    The base settings ("base") plus every `sweep.variants` entry: a name and
+    overrides of min_stars, agents and/or end (null = no window). A variant's
+    own end always applies; the base one only with time_window.apply.
+    """
+    window = cfg.get("time_window") or {}
+    base = {
+        "name": "base",
+        "min_stars": int(cfg["min_stars"]),
+        "agents": sorted(cfg["agents"]),
+        "end": window.get("end") if window.get("apply", False) else None,
+    }
+    variants = {"base": base}
+    for v in (cfg.get("sweep") or {}).get("variants") or []:
+        unknown = set(v) - VARIANT_KEYS
+        if unknown:
+            raise ValueError(f"Unknown sweep variant keys {sorted(unknown)}; allowed: {sorted(VARIANT_KEYS)}")
+        name = str(v.get("name", ""))
+        if not re.fullmatch(r"\w+", name):
+            raise ValueError(f"sweep.variants names must be identifiers (letters, digits, _), got {name!r}")
+        variants[name] = {**base, **v, "min_stars": int(v.get("min_stars", base["min_stars"])),
+                          "agents": sorted(v.get("agents", base["agents"]))}
+    return list(variants.values())
+
+
+def sweep_summary(pr: pd.DataFrame, variants: list) -> pd.DataFrame:
+    """PR counts per variant x agent_type (plus "ALL") x pr_outcome, from one groupby over the masks."""
+    flags = ["in_" + v["name"] for v in variants]
+    counts = pr.groupby(["agent_type", "pr_outcome"], observed=True)[flags].sum()
+    counts.columns = [v["name"] for v in variants]
+    long = counts.rename_axis(columns="variant").stack().rename("n_prs").reset_index()
+    total = long.groupby(["variant", "pr_outcome"], as_index=False)["n_prs"].sum().assign(agent_type="ALL")
+    long = pd.concat([long.astype({"agent_type": str, "pr_outcome": str}), total], ignore_index=True)
+    long["share"] = long["n_prs"] / long.groupby(["variant", "agent_type"])["n_prs"].transform("sum")
+
+    params = pd.DataFrame({
+        "variant": [v["name"] for v in variants],
+        "min_stars": [v["min_stars"] for v in variants],
+        "agents": [",".join(v["agents"]) for v in variants],
+        "end": [v["end"] for v in variants],
+    })
+    order = {v["name"]: i for i, v in enumerate(variants)}
+    long = long.sort_values(["variant", "agent_type", "pr_outcome"],
+                            key=lambda c: c.map(order) if c.name == "variant" else c)
+    out = params.merge(long, on="variant")
+    return out[["variant", "min_stars", "agents", "end", "agent_type", "pr_outcome", "n_prs", "share"]]
+
+
+def sweep(cfg: dict, cache: ParquetCache, pr_schema: pa.Schema, agent_col: str):
+    """
+    Robustness sweep: read and join the PR/repo tables once under the widest
+    settings of all variants, then evaluate each variant as a boolean mask.
+    Writes the shared PR-level table with one `in_<variant>` column per
+    variant (a variant's PRs: read_derived(..., filters=[("in_<variant>", "==", True)]))
+    and the outcome/agent summary of every variant.
+    """
+    ds, t = cfg["aidev_hf_dataset"], cfg["tables"]
+    variants = sweep_variants(cfg)
+    ends = {v["name"]: time_window_end({"time_window": {"end": v["end"], "apply": True}}) for v in variants}
+    widest_end = None if None in ends.values() else max(variants, key=lambda v: ends[v["name"]])["end"]
+    wide = dict(cfg, time_window={"end": widest_end, "apply": True})
+    min_stars = min(v["min_stars"] for v in variants)
+    agents = sorted(set().union(*(v["agents"] for v in variants)))
+    print(f"Sweep: {len(variants)} variants over one scan (stars >= {min_stars}, agents {agents}, "
+          f"end {widest_end or 'none'})")
+
+    with span("load_repos") as sp:
+        popular_repo = read_parquet_hf(ds, t["repository"], cache=cache, columns=["id", "full_name", "stars"],
+                                       filters=[("stars", ">=", min_stars)])
+        sp.rows_out = len(popular_repo)
+    pr_filters = [
+        (agent_col, "in", agents),
+        (REPO_ID_COL, "in", sorted(set(popular_repo["id"].astype("int64")))),
+    ]
+    pr_filters += time_window_filters(pr_schema, wide)
+    with span("load_prs") as sp:
+        pr = read_parquet_hf(ds, t["pull_request"], cache=cache, filters=pr_filters)
+        sp.rows_out = len(pr)
+    record_frame("agent_prs_raw", pr)
+
+    # Keys of the base build; PRs only some variants select have none (the index is not extended)
+    pr = build_rows(pr, popular_repo, agent_col, wide, index=load_key_index(cfg))
+    pr["pr_key"] = pr["pr_key"].where(pr["pr_key"] >= 0)
+
+    with span("masks", rows_in=len(pr)):
+        for v in variants:
+            mask = (pr["stars"] >= v["min_stars"]) & pr["agent_type"].isin(v["agents"])
+            if ends[v["name"]] is not None:
+                mask &= pr["created_at"] < ends[v["name"]]
+            pr["in_" + v["name"]] = mask.to_numpy()
+        summary = sweep_summary(pr, variants)
+    record_frame("sweep_agent_prs", pr)
+
+    with span("write", rows_in=len(pr)):
+        out_path = write_derived(pr, cfg, SWEEP_NAME)
+        summary_path = write_derived(summary, cfg, SWEEP_SUMMARY)
+        csv_path = export_csv(summary, cfg, SWEEP_SUMMARY)
+    print("✅ Wrote:", out_path)
+    print("✅ Wrote:", summary_path)
+    if csv_path and csv_path != summary_path:
+        print("✅ Wrote:", csv_path)
+    overall = summary[summary["agent_type"] == "ALL"].pivot(index="variant", columns="pr_outcome", values="n_prs")
+    overall = overall.reindex([v["name"] for v in variants]).fillna(0).astype("int64")
+    overall["total"] = overall.sum(axis=1)
+    print("PRs per variant and outcome:\n", overall.to_string())
+
+
+def build(cfg: dict, sweep_mode: bool = False):
     ds = cfg["aidev_hf_dataset"]
     t = cfg["tables"]
     min_stars = int(cfg["min_stars"])
     agents = set(cfg["agents"])
     derived_dir = cfg["paths"]["derived_dir"]
     os.makedirs(derived_dir, exist_ok=True)
+    cache = ParquetCache.from_config(cfg)
 
     print("=== Build AIDev-POP Agent PRs (>=500 stars) ===")
     print("HF dataset:", ds)
     print("MIN_STARS:", min_stars)
     print("Agents:", sorted(list(agents)))
 
-    # Load core tables
-    pr = read_parquet_hf(ds, t["pull_request"])
-    # Preserve dataset PR id if present (helps join with comments)
-    if "id" in pr.columns:
-    	pr = pr.rename(columns={"id": "id_pr"})
-
-    repo = read_parquet_hf(ds, t["repository"])
-    
+    # Read footers first so predicates can be pushed down to the Parquet reader
+    pr_schema = read_parquet_metadata_hf(ds, t["pull_request"], cache=cache).schema.to_arrow_schema()
+    repo_schema = read_parquet_metadata_hf(ds, t["repository"], cache=cache).schema.to_arrow_schema()
 
     # Identify agent column
     agent_col = None
     for c in AGENT_COL_CANDIDATES:
-        if c in pr.columns:
+        if c in pr_schema.names:
             agent_col = c
             break
     if agent_col is None:
         raise ValueError(f"Could not find agent column. Tried: {AGENT_COL_CANDIDATES}. "
-                         f"Available columns: {list(pr.columns)}")
+                         f"Available columns: {pr_schema.names}")
 
     # Filter popular repos
-    if "stars" not in repo.columns:
+    if "stars" not in repo_schema.names:
         raise ValueError("Repository table missing 'stars' column.")
-    popular_repo = repo.loc[repo["stars"] >= min_stars, ["id", "full_name", "stars"]].copy()
-    popular_repo_ids = set(popular_repo["id"].astype("int64"))
-
-    print("Popular repos:", len(popular_repo))
 
-    # Filter PRs to popular repos (AIDev-POP)
-    pr = pr.loc[pr[REPO_ID_COL].isin(popular_repo_ids)].copy()
-    print("PRs in popular repos:", len(pr))
-
-    # Standardize agent column -> agent_type and filter to target agents
-    pr["agent_type"] = pr[agent_col].astype(str)
-    pr = pr.loc[pr["agent_type"].isin(agents)].copy()
-    print("Agent PRs (target agents):", len(pr))
+    if sweep_mode:
+        sweep(cfg, cache, pr_schema, agent_col)
+        return
 
-    # Parse timestamps
-    for col in ["created_at", "closed_at", "merged_at"]:
-        if col in pr.columns:
-            pr[col] = to_datetime_safe(pr[col])
+    if sql_backend.enabled(cfg):
+        print("Backend: duckdb")
+        out_path, n_rows, columns, outcome_counts, agent_counts = sql_backend.build_agent_prs(
+            cfg, cache, agent_col, time_window_end(cfg)
+        )
+        print("✅ Wrote:", out_path)
+        print("Rows:", n_rows, "Cols:", len(columns))
+        print("Outcome counts:\n", outcome_counts)
+        print("Agent counts:\n", agent_counts)
+        return
 
-    # Turnaround time (hours)
-    pr["turnaround_time_hours"] = (pr["closed_at"] - pr["created_at"]).dt.total_seconds() / 3600.0
+    with span("load_repos") as sp:
+        popular_repo = read_parquet_hf(
+            ds, t["repository"], cache=cache,
+            columns=["id", "full_name", "stars"],
+            filters=[("stars", ">=", min_stars)],
+        )
+        sp.rows_out = len(popular_repo)
+    popular_repo_ids = set(popular_repo["id"].astype("int64"))
 
-    # Outcome
-    pr["pr_outcome"] = derive_outcome(pr)
+    print("Popular repos:", len(popular_repo))
 
-    # Attach repo metadata
-    # PR table uses repo_id; repository table uses id
-    pr = pr.merge(popular_repo, left_on="repo_id", right_on="id", how="left", suffixes=("", "_repo"))
-    # Avoid confusion: keep repo id as repo_id, drop duplicate "id" from repo table
-    if "id_repo" in pr.columns:
-        pr = pr.drop(columns=["id_repo"], errors="ignore")
-    pr = pr.drop(columns=["id"], errors="ignore")  # repo id column from repo table merge
+    # Load only PRs by target agents in popular repos (AIDev-POP)
+    pr_filters = [
+        (agent_col, "in", sorted(agents)),
+        (REPO_ID_COL, "in", sorted(popular_repo_ids)),
+    ]
+    pr_filters += time_window_filters(pr_schema, cfg)
 
-    # Reorder key columns first (keep the rest)
-    key_cols = [
-    "id_pr", "repo_id", "full_name", "stars",
-    "number",
-    "agent_type",
-    "created_at", "closed_at", "merged_at",
-    "turnaround_time_hours",
-    "state", "pr_outcome",
-    "title", "body"]
+    # Partitioned layout: a new snapshot only rewrites the partitions it changes
+    parts = partitioned_dataset(cfg, OUT_NAME)
+    if incremental(cfg) and parts.exists() and "id" in pr_schema.names:
+        if ingest(cfg, cache, pr_filters, popular_repo, agent_col):
+            return
 
-    existing_key_cols = [c for c in key_cols if c in pr.columns]
-    remaining_cols = [c for c in pr.columns if c not in existing_key_cols]
-    pr = pr[existing_key_cols + remaining_cols]
+    with span("load_prs") as sp:
+        pr = read_parquet_hf(ds, t["pull_request"], cache=cache, filters=pr_filters)
+        sp.rows_out = len(pr)
+    record_frame("agent_prs_raw", pr)
+    pr = build_rows(pr, popular_repo, agent_col, cfg)
 
-    out_path = os.path.join(derived_dir, "aidev_pop_ge500_agent_prs.csv")
-    pr.to_csv(out_path, index=False)
+    record_frame("agent_prs", pr)
+    with span("write", rows_in=len(pr)):
+        out_path = write_derived(pr, cfg, OUT_NAME)
     print("✅ Wrote:", out_path)
     print("Rows:", len(pr), "Cols:", len(pr.columns))
     print("Outcome counts:\n", pr["pr_outcome"].value_counts(dropna=False))
     print("Agent counts:\n", pr["agent_type"].value_counts(dropna=False))
 
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Build the AIDev-POP agent PR dataset.")
+    ap.add_argument("--sweep", action="store_true",
+                    help="Evaluate the sweep.variants settings over one shared scan instead")
+    args = ap.parse_args(argv)
+
+    cfg = load_config()
+    # Stage names as in run_pipeline.py
+    with stage_report(cfg, "01-sweep" if args.sweep else "01"):
+        build(cfg, args.sweep)
+
 if __name__ == "__main__":
     main()
@@ -1,45 +1,79 @@
 import os
 import re
-import yaml
 import pandas as pd
-from utils_hf import read_parquet_hf
-from task_type_rules import infer_task_type
+import pyarrow as pa
+import pyarrow.compute as pc
+from utils_hf import iter_parquet_batches_hf, read_parquet_hf, read_parquet_metadata_hf
+from hf_cache import ParquetCache
+from derived_io import (DerivedWriter, apply_dtypes, derived_columns, derived_path, incremental,
+                        partitioned_dataset, read_derived, upsert_derived, write_derived)
+from task_type_rules import infer_task_types
+from key_index import KeyIndex, load_key_index
+from text_store import TextStoreWriter
+from instrument import instrumented, record_frame, span
+import sql_backend
+from utils_config import load_config
 
+OUT_NAME = "aidev_pop_ge500_pr_review_comments_with_task_type"
 
-def main():
-    cfg = yaml.safe_load(open("config/config.yaml", "r", encoding="utf-8"))
-    ds = cfg["aidev_hf_dataset"]
-    t = cfg["tables"]
-    derived_dir = cfg["paths"]["derived_dir"]
-    os.makedirs(derived_dir, exist_ok=True)
+# PR columns carried on each comment row; the rest are looked up by pr_key
+PR_COLS = ["full_name", "number", "pr_key", "agent_type", "title"]
 
-    pr_path = os.path.join(derived_dir, "aidev_pop_ge500_agent_prs.csv")
-    if not os.path.exists(pr_path):
-        raise FileNotFoundError(f"Missing {pr_path}. Run script 01 first.")
+# Example: https://api.github.com/repos/OWNER/REPO/pulls/123
+PR_URL_PATTERN = r"repos/(?P<full_name>[^/]+/[^/]+)/pulls/(?P<number>\d+)"
 
-    print("=== Build review comments dataset + task_type ===")
-    print("HF dataset:", ds)
-    print("Loading PR-level CSV:", pr_path)
 
-    pr = pd.read_csv(pr_path, low_memory=False)
+def extract_pr_keys(comments: pd.DataFrame) -> pd.DataFrame:
+    """Add full_name/number parsed from pull_request_url; drop comments without a PR key."""
+    extracted = comments["pull_request_url"].astype(str).str.extract(re.compile(PR_URL_PATTERN))
 
-    # --- Keep rejected PRs (RAPRs) ---
-    if "pr_outcome" not in pr.columns:
-        raise ValueError(f"PR CSV missing pr_outcome. Columns: {list(pr.columns)}")
-    if "full_name" not in pr.columns or "number" not in pr.columns:
-        raise ValueError(f"PR CSV must include full_name and number. Columns: {list(pr.columns)}")
+    comments["full_name"] = extracted["full_name"]
+    comments["number"] = pd.to_numeric(extracted["number"], errors="coerce")
 
-    rapr = pr.loc[pr["pr_outcome"] == "REJECTED"].copy()
-    rapr["full_name"] = rapr["full_name"].astype(str)
-    rapr["number"] = pd.to_numeric(rapr["number"], errors="coerce")
-    rapr = rapr.dropna(subset=["number"])
-    rapr["number"] = rapr["number"].astype("int64")
+    comments = comments.dropna(subset=["full_name", "number"])
+    comments["full_name"] = comments["full_name"].astype(str)
+    comments["number"] = comments["number"].astype("int64")
+    return comments
+
+
+def comment_renames(comment_cols, pr_cols) -> dict:
+    """Comment columns that share a name with a PR column keep a _comment suffix (body_comment, ...)."""
+    shared = set(pr_cols) - {"full_name", "number", "pr_key"}
+    return {c: c + "_comment" for c in comment_cols if c in shared}
 
-    print("Rejected APRs (RAPRs):", len(rapr))
-    rapr_key = rapr[["full_name", "number"]].drop_duplicates()
+
+def attach_rapr(comments: pd.DataFrame, rapr: pd.DataFrame, index: KeyIndex, renames: dict) -> pd.DataFrame:
+    """Keep comments on RAPRs and attach agent_type/task_type; other PR columns stay in the PR table."""
+    # --- Keep only comments on RAPRs (single int key instead of full_name/number) ---
+    with span("filter_raprs", rows_in=len(comments)) as sp:
+        comments["pr_key"] = index.pr_keys(comments["full_name"], comments["number"])
+        comments = comments.loc[comments["pr_key"].isin(rapr["pr_key"])]
+        sp.rows_out = len(comments)
+
+    # --- Reference the PR by pr_key; only the labels used downstream are copied ---
+    with span("join_prs", rows_in=len(comments)) as sp:
+        merged = comments.rename(columns=renames).merge(
+            rapr[[c for c in ["pr_key", "agent_type", "task_type"] if c in rapr.columns]], on="pr_key", how="left"
+        )
+        sp.rows_out = len(merged)
+    return merged
+
+
+def derive_task_type(rapr: pd.DataFrame) -> pd.DataFrame:
+    """task_type from the PR title, once per RAPR rather than once per comment."""
+    with span("derive_task_type", rows_in=len(rapr)):
+        rapr["task_type"] = infer_task_types(rapr["title"]) if "title" in rapr.columns else "unknown"
+    return rapr
+
+
+def build_in_memory(cfg: dict, cache: ParquetCache, rapr: pd.DataFrame, index: KeyIndex, pr_cols: list):
+    ds, t = cfg["aidev_hf_dataset"], cfg["tables"]
 
     # --- Load review comments table ---
-    comments = read_parquet_hf(ds, t["review_comments"]).copy()
+    with span("load_comments") as sp:
+        comments = read_parquet_hf(ds, t["review_comments"], cache=cache)
+        sp.rows_out = len(comments)
+    record_frame("comments_raw", comments)
 
     if "pull_request_url" not in comments.columns:
         raise ValueError(
@@ -47,42 +81,207 @@ def main():
             f"Available columns: {list(comments.columns)}"
         )
 
-    # --- Extract full_name and number from pull_request_url ---
-    # Example: https://api.github.com/repos/OWNER/REPO/pulls/123
-    pat = re.compile(r"repos/([^/]+/[^/]+)/pulls/(\d+)")
-    extracted = comments["pull_request_url"].astype(str).str.extract(pat)
+    with span("extract_pr_keys", rows_in=len(comments)) as sp:
+        comments = extract_pr_keys(comments)
+        sp.rows_out = len(comments)
+    merged = attach_rapr(comments, rapr, index, comment_renames(comments.columns, pr_cols))
+    print("Review comments on RAPRs:", len(merged))
 
-    comments["full_name"] = extracted[0]
-    comments["number"] = pd.to_numeric(extracted[1], errors="coerce")
+    # --- Move heavy text (bodies, diff hunks) to the deduplicated side store ---
+    store = TextStoreWriter(cfg)
+    with span("text_store", rows_in=len(merged)) as sp:
+        merged = store.externalize(merged)
+        store_path = store.close()
+        sp.rows_out = store.rows
+    print("✅ Wrote:", store_path)
+    print("Text store:", store.summary())
+    record_frame("comments_with_task_type", merged)
+
+    with span("write", rows_in=len(merged)):
+        out_path = write_derived(merged, cfg, OUT_NAME)
+    return out_path, len(merged), list(merged.columns), merged["task_type"].value_counts(dropna=False)
+
+
+def build_streaming(cfg: dict, cache: ParquetCache, rapr: pd.DataFrame, index: KeyIndex, pr_cols: list,
+                    batch_size: int):
+    """
+    Same output as build_in_memory, but the comments table is read one record
+    batch at a time: each batch is semi-joined against a hashed RAPR key set in
+    Arrow before anything is converted to pandas, and matches are appended to
+    the output file. Peak memory is bounded by batch_size, not table size.
+    """
+    ds, t = cfg["aidev_hf_dataset"], cfg["tables"]
+
+    comment_schema = read_parquet_metadata_hf(ds, t["review_comments"], cache=cache).schema.to_arrow_schema()
+    if "pull_request_url" not in comment_schema.names:
+        raise ValueError(
+            "Expected 'pull_request_url' in comments table.\n"
+            f"Available columns: {comment_schema.names}"
+        )
+
+    # "OWNER/REPO#123" strings hashed once into the value set for pc.is_in
+    rapr_key = rapr[["full_name", "number"]].drop_duplicates()
+    key_set = pa.array((rapr_key["full_name"] + "#" + rapr_key["number"].astype(str)).tolist(), type=pa.string())
+
+    # Types for columns that happen to be all-null in the first batch
+    renames = comment_renames(comment_schema.names, pr_cols)
+    fallback_fields = [f.with_name(renames.get(f.name, f.name)) for f in comment_schema]
+    writer = DerivedWriter(cfg, OUT_NAME, fallback_schema=pa.schema(fallback_fields))
+    store = TextStoreWriter(cfg)
+
+    task_counts = pd.Series(dtype="int64")
+    columns = None
+    n_batches = 0
+    for batch in iter_parquet_batches_hf(ds, t["review_comments"], cache=cache, batch_size=batch_size):
+        n_batches += 1
+        with span("semi_join_batch", rows_in=batch.num_rows) as sp:
+            keys = pc.extract_regex(pc.cast(batch.column("pull_request_url"), pa.string()), PR_URL_PATTERN)
+            batch_keys = pc.binary_join_element_wise(
+                pc.struct_field(keys, "full_name"), pc.struct_field(keys, "number"), "#"
+            )
+            hit = pc.fill_null(pc.is_in(batch_keys, value_set=key_set), False)
+            matched = batch.filter(hit)
+            sp.rows_out = matched.num_rows
+        if matched.num_rows == 0 and columns is not None:
+            continue
+
+        with span("extract_pr_keys", rows_in=matched.num_rows):
+            comments = extract_pr_keys(matched.to_pandas())
+        merged = attach_rapr(comments, rapr, index, renames)
+        with span("text_store", rows_in=len(merged)):
+            merged = store.externalize(merged)
+        with span("write", rows_in=len(merged)):
+            writer.write(merged)
+        columns = list(merged.columns)
+        task_counts = task_counts.add(merged["task_type"].value_counts(dropna=False), fill_value=0)
+
+    if columns is None:
+        raise ValueError(f"Comments table {t['review_comments']} is empty.")
+    with span("write"):
+        out_path = writer.close()
+        print("✅ Wrote:", store.close())
+    print("Text store:", store.summary())
+    print(f"Streamed {n_batches} batches of up to {batch_size} rows")
+    print("Review comments on RAPRs:", writer.rows)
+    return out_path, writer.rows, columns, task_counts.astype("int64").sort_values(ascending=False)
 
-    comments = comments.dropna(subset=["full_name", "number"])
-    comments["full_name"] = comments["full_name"].astype(str)
-    comments["number"] = comments["number"].astype("int64")
 
-    # --- Keep only comments on RAPRs ---
-    comments = comments.merge(rapr_key, on=["full_name", "number"], how="inner")
-    print("Review comments on RAPRs:", len(comments))
-
-    # --- Merge PR-level metadata into each comment row ---
-    merged = comments.merge(
-        rapr,
-        on=["full_name", "number"],
-        how="left",
-        suffixes=("_comment", "_pr")
-    )
-
-    # --- Derive task_type from PR title ---
-    if "title" in merged.columns:
-        merged["task_type"] = merged["title"].apply(infer_task_type)
+def ingest(cfg: dict, cache: ParquetCache, rapr: pd.DataFrame, index: KeyIndex, pr_cols: list) -> bool:
+    """
+    Update the partitioned comment dataset from a new snapshot. Only the id and
+    pull_request_url columns are scanned in full: comments on current RAPRs that
+    are not stored yet (new comments, or comments on PRs that became RAPRs) are
+    loaded and added, stored comments that no longer belong to a RAPR are
+    dropped, and only the partitions involved are rewritten. False if a full
+    rebuild is needed instead (no comment id, or the columns changed).
+    """
+    ds, t = cfg["aidev_hf_dataset"], cfg["tables"]
+    parts = partitioned_dataset(cfg, OUT_NAME)
+    comment_schema = read_parquet_metadata_hf(ds, t["review_comments"], cache=cache).schema.to_arrow_schema()
+    if "id" not in comment_schema.names or "id" not in parts.columns or "pull_request_url" not in comment_schema.names:
+        return False
+
+    with span("scan_changes") as sp:
+        snap = read_parquet_hf(ds, t["review_comments"], cache=cache, columns=["id", "pull_request_url"])
+        sp.rows_in = len(snap)
+        snap = extract_pr_keys(snap)
+        snap["pr_key"] = index.pr_keys(snap["full_name"], snap["number"])
+        wanted = snap.loc[snap["pr_key"].isin(rapr["pr_key"]), "id"].astype("int64")
+        old = parts.read(columns=["id"])["id"].astype("int64")
+        new_ids = wanted[~wanted.isin(old)]
+        gone = old[~old.isin(wanted)]
+        sp.rows_out = len(new_ids) + len(gone)
+    print(f"Snapshot: {len(wanted)} comments on RAPRs; {len(new_ids)} new, {len(gone)} no longer on a RAPR")
+
+    store = TextStoreWriter(cfg, append=True)
+    if len(new_ids):
+        with span("load_comments") as sp:
+            comments = read_parquet_hf(ds, t["review_comments"], cache=cache, filters=[("id", "in", new_ids.tolist())])
+            sp.rows_out = len(comments)
+        record_frame("comments_raw", comments)
+        comments = extract_pr_keys(comments)
+        merged = attach_rapr(comments, rapr, index, comment_renames(comments.columns, pr_cols))
+        with span("text_store", rows_in=len(merged)):
+            merged = store.externalize(merged)
     else:
-        merged["task_type"] = "unknown"
+        merged = parts.read(partitions=[])  # no rows, same columns
+    print("✅ Wrote:", store.close())
+    print("Text store:", store.summary())
+    merged = apply_dtypes(merged)
+    if list(merged.columns) != parts.columns:
+        print("Comment columns changed since the last build; rebuilding all partitions.")
+        return False
+
+    record_frame("comments_with_task_type", merged)
+    with span("upsert", rows_in=len(merged)):
+        stats = upsert_derived(merged, cfg, OUT_NAME, delete=gone.tolist())
+    task_counts = parts.read(columns=["task_type"])["task_type"].value_counts(dropna=False)
+    print("✅ Wrote:", parts.path)
+    print(f"Rewrote {stats['partitions']} of {stats['total_partitions']} partitions "
+          f"(+{stats['inserted']} inserted, -{stats['deleted']} deleted)")
+    print("Rows:", parts.rows(), "Cols:", len(parts.columns))
+    print("Task type counts:\n", task_counts.head(20))
+    return True
+
+
+@instrumented("02")
+def main():
+    cfg = load_config()
+    ds = cfg["aidev_hf_dataset"]
+    derived_dir = cfg["paths"]["derived_dir"]
+    os.makedirs(derived_dir, exist_ok=True)
+    cache = ParquetCache.from_config(cfg)
+    streaming = cfg.get("streaming") or {}
+
+    pr_path = derived_path(cfg, "aidev_pop_ge500_agent_prs")
+    if not os.path.exists(pr_path):
+        raise FileNotFoundError(f"Missing {pr_path}. Run script 01 first.")
+
+    print("=== Build review comments dataset + task_type ===")
+    print("HF dataset:", ds)
+    print("Loading PR-level dataset:", pr_path)
 
-    out_path = os.path.join(derived_dir, "aidev_pop_ge500_pr_review_comments_with_task_type.csv")
-    merged.to_csv(out_path, index=False)
+    if sql_backend.enabled(cfg):
+        print("Backend: duckdb")
+        out_path, n_rows, columns, task_counts = sql_backend.build_review_comments(cfg, cache, OUT_NAME)
+        print("✅ Wrote:", out_path)
+        print("Rows:", n_rows, "Cols:", len(columns))
+        print("Task type counts:\n", task_counts.head(20))
+        return
+
+    pr_cols = derived_columns(cfg, "aidev_pop_ge500_agent_prs")
+    if "pr_outcome" not in pr_cols:
+        raise ValueError(f"PR dataset missing pr_outcome. Columns: {pr_cols}")
+    if "full_name" not in pr_cols or "number" not in pr_cols:
+        raise ValueError(f"PR dataset must include full_name and number. Columns: {pr_cols}")
+    if "pr_key" not in pr_cols:
+        raise ValueError("PR dataset missing pr_key. Rerun script 01 to build the key index.")
+
+    # --- Keep rejected PRs (RAPRs); only the columns needed here are read ---
+    with span("load_prs") as sp:
+        rapr = read_derived(cfg, "aidev_pop_ge500_agent_prs", columns=PR_COLS,
+                            filters=[("pr_outcome", "==", "REJECTED")])
+        sp.rows_out = len(rapr)
+    rapr = rapr.dropna(subset=["number"]).astype({"full_name": str, "number": "int64"})
+    rapr = derive_task_type(rapr)
+    index = load_key_index(cfg)
+
+    print("Rejected APRs (RAPRs):", len(rapr))
+
+    # Partitioned layout: a new snapshot only rewrites the partitions it changes
+    parts = partitioned_dataset(cfg, OUT_NAME)
+    if incremental(cfg) and parts.exists() and ingest(cfg, cache, rapr, index, pr_cols):
+        return
+
+    if streaming.get("enabled", False):
+        batch_size = int(streaming.get("batch_size", 100_000))
+        out_path, n_rows, columns, task_counts = build_streaming(cfg, cache, rapr, index, pr_cols, batch_size)
+    else:
+        out_path, n_rows, columns, task_counts = build_in_memory(cfg, cache, rapr, index, pr_cols)
 
     print("✅ Wrote:", out_path)
-    print("Rows:", len(merged), "Cols:", len(merged.columns))
-    print("Task type counts:\n", merged["task_type"].value_counts(dropna=False).head(20))
+    print("Rows:", n_rows, "Cols:", len(columns))
+    print("Task type counts:\n", task_counts.head(20))
 
 
 if __name__ == "__main__":
@@ -1,14 +1,34 @@
 import os
-import yaml
+import numpy as np
 import pandas as pd
+from derived_io import derived_columns, derived_path, read_derived, write_derived
+from instrument import instrumented, record_frame, span
+import sql_backend
+from utils_config import load_config
 
+def task_type_mode(dfc: pd.DataFrame) -> pd.Series:
+    """
+    Most frequent task_type per pr_key, ties broken by first occurrence: the
+    same result as s.value_counts().index[0] per group, from one groupby on
+    (pr_key, task_type) instead of a Series per PR.
+    """
+    tt = dfc[["pr_key", "task_type"]].assign(pos=np.arange(len(dfc))).dropna(subset=["task_type"])
+    counts = (
+        tt.groupby(["pr_key", "task_type"], sort=False, observed=True)["pos"]
+          .agg(["size", "min"])
+          .reset_index()
+          .sort_values(["pr_key", "size", "min"], ascending=[True, False, True], kind="stable")
+    )
+    return counts.drop_duplicates("pr_key").set_index("pr_key")["task_type"]
+
+@instrumented("03")
 def main():
-    cfg = yaml.safe_load(open("config/config.yaml", "r", encoding="utf-8"))
+    cfg = load_config()
     derived_dir = cfg["paths"]["derived_dir"]
     os.makedirs(derived_dir, exist_ok=True)
 
-    comments_path = os.path.join(derived_dir, "aidev_pop_ge500_pr_review_comments_with_task_type.csv")
-    pr_path = os.path.join(derived_dir, "aidev_pop_ge500_agent_prs.csv")
+    comments_path = derived_path(cfg, "aidev_pop_ge500_pr_review_comments_with_task_type")
+    pr_path = derived_path(cfg, "aidev_pop_ge500_agent_prs")
 
     if not os.path.exists(comments_path):
         raise FileNotFoundError(f"Missing {comments_path}. Run script 02 first.")
@@ -16,51 +36,74 @@ def main():
         raise FileNotFoundError(f"Missing {pr_path}. Run script 01 first.")
 
     print("=== Build PR-level commented RAPRs dataset ===")
-    print("Reading:", comments_path)
-    dfc = pd.read_csv(comments_path, low_memory=False)
+    if sql_backend.enabled(cfg):
+        print("Backend: duckdb")
+        out_path, n_rows, majority_counts = sql_backend.build_commented_raprs(
+            cfg, "aidev_pop_ge500_pr_review_comments_with_task_type", "aidev_pop_ge500_agent_prs",
+            "aidev_pop_ge500_commented_raprs_pr_level",
+        )
+        print("✅ Wrote:", out_path)
+        print("Rows (unique commented RAPRs):", n_rows)
+        print("Top task types:\n", majority_counts.head(15))
+        return
 
-    # Required keys
-    for col in ["full_name", "number"]:
-        if col not in dfc.columns:
-            raise ValueError(f"Comments CSV missing '{col}'. Columns: {list(dfc.columns)}")
+    print("Reading:", comments_path)
+    # Only the columns used by the aggregation below (comment bodies stay in the text store)
+    with span("load_comments") as sp:
+        dfc = read_derived(
+            cfg, "aidev_pop_ge500_pr_review_comments_with_task_type",
+            columns=["pr_key", "task_type", "created_at_comment", "user_comment", "body_comment_ref", "body_comment"],
+        )
+        sp.rows_out = len(dfc)
+    record_frame("comments", dfc)
 
-    dfc["full_name"] = dfc["full_name"].astype(str)
-    dfc["number"] = pd.to_numeric(dfc["number"], errors="coerce")
-    dfc = dfc.dropna(subset=["number"])
-    dfc["number"] = dfc["number"].astype("int64")
+    # Body reference (text store) or the inline body when text_store.enabled is off
+    body_col = "body_comment_ref" if "body_comment_ref" in dfc.columns else "body_comment"
+    required = ["pr_key", "task_type", "created_at_comment", "user_comment", body_col]
+    missing = [c for c in required if c not in dfc.columns]
+    if missing:
+        raise ValueError(f"Comments dataset missing {missing}. Columns: {list(dfc.columns)}")
+    dfc["created_at_comment"] = pd.to_datetime(dfc["created_at_comment"], errors="coerce", utc=True)
 
     # Build per-PR aggregates from comment-level
-    per_pr = (
-        dfc.groupby(["full_name", "number"], as_index=False)
-           .agg(
-               n_comments=("body", "count") if "body" in dfc.columns else ("full_name", "count"),
-               n_unique_commenters=("user", "nunique") if "user" in dfc.columns else ("full_name", "count"),
-               first_comment_at=("created_at", "min") if "created_at" in dfc.columns else ("full_name", "count"),
-               last_comment_at=("created_at", "max") if "created_at" in dfc.columns else ("full_name", "count"),
-               task_type_majority=("task_type", lambda s: s.value_counts().index[0]) if "task_type" in dfc.columns else ("full_name", "count"),
-           )
-    )
+    with span("aggregate", rows_in=len(dfc)) as sp:
+        per_pr = (
+            dfc.groupby("pr_key", as_index=False)
+               .agg(
+                   n_comments=(body_col, "count"),
+                   n_unique_commenters=("user_comment", "nunique"),
+                   first_comment_at=("created_at_comment", "min"),
+                   last_comment_at=("created_at_comment", "max"),
+               )
+               .astype({"n_comments": "int64", "n_unique_commenters": "int64"})  # counts of nullable columns
+        )
+        per_pr["task_type_majority"] = per_pr["pr_key"].map(task_type_mode(dfc))
+        sp.rows_out = len(per_pr)
 
     # Merge PR-level metadata from Script 01 output
     print("Reading:", pr_path)
-    pr = pd.read_csv(pr_path, low_memory=False)
-
-    if "full_name" not in pr.columns or "number" not in pr.columns:
-        raise ValueError(f"PR CSV missing full_name/number. Columns: {list(pr.columns)}")
+    pr_cols = derived_columns(cfg, "aidev_pop_ge500_agent_prs")
+    if "pr_key" not in pr_cols:
+        raise ValueError(f"PR dataset missing pr_key. Columns: {pr_cols}")
 
-    pr["full_name"] = pr["full_name"].astype(str)
-    pr["number"] = pd.to_numeric(pr["number"], errors="coerce")
-    pr = pr.dropna(subset=["number"])
-    pr["number"] = pr["number"].astype("int64")
+    # Keep only rejected PRs (filter pushed down into the Parquet scan)
+    with span("load_prs") as sp:
+        pr = read_derived(cfg, "aidev_pop_ge500_agent_prs",
+                          filters=[("pr_outcome", "==", "REJECTED")] if "pr_outcome" in pr_cols else None)
+        sp.rows_out = len(pr)
 
-    # Keep only rejected PRs
-    if "pr_outcome" in pr.columns:
-        pr = pr.loc[pr["pr_outcome"] == "REJECTED"].copy()
+    with span("join_prs", rows_in=len(per_pr)) as sp:
+        out = per_pr.merge(pr, on="pr_key", how="left", suffixes=("", "_pr"))
 
-    out = per_pr.merge(pr, on=["full_name", "number"], how="left", suffixes=("", "_pr"))
+        # Readable keys first; row order by (full_name, number) keeps the step 05 sample reproducible
+        lead = ["pr_key", "full_name", "number"]
+        out = out[lead + [c for c in out.columns if c not in lead]]
+        out = out.sort_values(["full_name", "number"], kind="stable").reset_index(drop=True)
+        sp.rows_out = len(out)
+    record_frame("commented_raprs", out)
 
-    out_path = os.path.join(derived_dir, "aidev_pop_ge500_commented_raprs_pr_level.csv")
-    out.to_csv(out_path, index=False)
+    with span("write", rows_in=len(out)):
+        out_path = write_derived(out, cfg, "aidev_pop_ge500_commented_raprs_pr_level")
 
     print("✅ Wrote:", out_path)
     print("Rows (unique commented RAPRs):", len(out))
@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from hf_cache import ParquetCache
+from derived_io import derived_path, export_csv, read_derived, write_derived
+from commit_features import aggregate_shard
+from instrument import instrumented, record_frame, span
+from utils_config import load_config
+
+OUT_NAME = "aidev_pop_ge500_pr_features"
+
+# Column names expected by repo_fixed_effects.ipynb
+ALIASES = {
+    "id": "pr_id",
+    "diff_size": "total_changes",
+    "touches_tests": "touched_tests",
+    "touches_docs": "touched_docs",
+}
+
+
+def shard_ids(pr_ids: np.ndarray, shard_size: int) -> list:
+    # Contiguous pr_id ranges of at most shard_size PRs each
+    pr_ids = np.unique(pr_ids)
+    return [pr_ids[i:i + shard_size].tolist() for i in range(0, len(pr_ids), shard_size)]
+
+
+@instrumented("04")
+def main():
+    cfg = load_config()
+    ds = cfg["aidev_hf_dataset"]
+    t = cfg["tables"]
+    derived_dir = cfg["paths"]["derived_dir"]
+    os.makedirs(derived_dir, exist_ok=True)
+    cache = ParquetCache.from_config(cfg)
+    opts = cfg.get("commit_features") or {}
+    workers = max(1, int(opts.get("workers", os.cpu_count() or 1)))
+    shard_size = max(1, int(opts.get("shard_size", 5000)))
+
+    pr_path = derived_path(cfg, "aidev_pop_ge500_agent_prs")
+    if not os.path.exists(pr_path):
+        raise FileNotFoundError(f"Missing {pr_path}. Run script 01 first.")
+
+    print("=== Build per-PR commit features ===")
+    print("HF dataset:", ds)
+    print("Loading PR-level dataset:", pr_path)
+    with span("load_prs") as sp:
+        pr = read_derived(cfg, "aidev_pop_ge500_agent_prs", columns=["pr_key", "id_pr"])
+        sp.rows_out = len(pr)
+    if "id_pr" not in pr.columns:
+        raise ValueError(f"PR dataset missing id_pr (AIDev PR id). Columns: {list(pr.columns)}")
+    pr = pr.dropna(subset=["id_pr"]).astype({"id_pr": "int64"})
+
+    # Workers read the cached local copy directly
+    commits_path = cache.path_for(ds, t["commit_details"])
+    shards = shard_ids(pr["id_pr"].to_numpy(), shard_size)
+    print(f"PRs: {len(pr)}  shards: {len(shards)}  workers: {min(workers, len(shards))}")
+
+    # Worker processes' reads and memory are not included in this process's numbers
+    with span("aggregate_shards", rows_in=len(pr)) as sp:
+        if workers == 1 or len(shards) <= 1:
+            parts = [aggregate_shard(commits_path, ids) for ids in shards]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as pool:
+                parts = list(pool.map(aggregate_shard, [commits_path] * len(shards), shards))
+        feat = pd.concat(parts, ignore_index=True) if parts else aggregate_shard(commits_path, [-1])
+        sp.rows_out = len(feat)
+        sp.extra["shards"] = len(shards)
+
+    with span("join_prs", rows_in=len(feat)) as sp:
+        feat = feat.merge(pr.rename(columns={"id_pr": "pr_id"}), on="pr_id", how="left")
+        for alias, col in ALIASES.items():
+            feat[alias] = feat[col]
+        feat = feat[["pr_key"] + [c for c in feat.columns if c != "pr_key"]]
+        sp.rows_out = len(feat)
+    record_frame("pr_features", feat)
+
+    with span("write", rows_in=len(feat)):
+        out_path = write_derived(feat, cfg, OUT_NAME)
+        csv_path = export_csv(feat, cfg, OUT_NAME)
+
+    print("✅ Wrote:", out_path)
+    if csv_path and csv_path != out_path:
+        print("✅ Wrote:", csv_path)
+    print("Rows (PRs with commit details):", len(feat), "of", len(pr))
+    print("Touched tests rate:", round(feat["touched_tests"].mean(), 3) if len(feat) else "n/a")
+    print("Touched docs rate:", round(feat["touched_docs"].mean(), 3) if len(feat) else "n/a")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,22 @@
+import argparse
 import os
-import yaml
+import numpy as np
 import pandas as pd
+from derived_io import derived_path, read_derived, write_derived
+from instrument import span, stage_report
+from utils_config import load_config
 
-SEED = 2025  # fixed seed for reproducibility
+SEED = 2025  # default seed for reproducibility (config: ground_truth_seed)
+N_TOTAL = 200
+REPLICATES_FILE = "ground_truth_200_replicates.npz"
+CHUNK_CELLS = 8_000_000  # replicate x row keys sorted at once (~64 MB of float64)
 
-def stratified_sample(df: pd.DataFrame, group_col: str, n_total: int, seed: int) -> pd.DataFrame:
+def allocate(counts: pd.Series, n_total: int) -> pd.Series:
     """
-    Proportional stratified sampling by group_col.
+    Proportional allocation of n_total rows over groups with `counts` rows.
     Guarantees sum to n_total by distributing rounding remainder by largest fractional parts.
     """
-    counts = df[group_col].value_counts(dropna=False)
-    props = counts / len(df)
+    props = counts / counts.sum()
     raw_targets = props * n_total
 
     base = raw_targets.apply(lambda x: int(x))  # floor
@@ -20,6 +26,11 @@ def stratified_sample(df: pd.DataFrame, group_col: str, n_total: int, seed: int)
     frac = (raw_targets - base).sort_values(ascending=False)
     for g in frac.index[:remainder]:
         base.loc[g] += 1
+    return base
+
+def stratified_sample(df: pd.DataFrame, group_col: str, n_total: int, seed: int) -> pd.DataFrame:
+    """Proportional stratified sampling by group_col (one draw)."""
+    base = allocate(df[group_col].value_counts(dropna=False), n_total)
 
     # sample per group
     parts = []
@@ -36,16 +47,88 @@ def stratified_sample(df: pd.DataFrame, group_col: str, n_total: int, seed: int)
     out = out.sample(frac=1.0, random_state=seed).reset_index(drop=True)
     return out
 
-def main():
-    cfg = yaml.safe_load(open("config/config.yaml", "r", encoding="utf-8"))
+def replicate_samples(df: pd.DataFrame, strata: list, n_total: int, n_replicates: int, seed: int) -> np.ndarray:
+    """
+    n_replicates proportional stratified samples of n_total rows each, returned
+    as an (n_replicates, n_total) matrix of row positions in df. Strata are the
+    combinations of the `strata` columns (e.g. agent_type x task_type).
+
+    The allocation is computed once. Each replicate draws one uniform key per
+    row; sorting rows by (stratum, key) lays out a random permutation of every
+    stratum in a fixed segment, so the sample is the first alloc[g] positions of
+    each segment: the same columns of the argsort for every replicate.
+    """
+    groups = df.groupby(strata, sort=False, dropna=False, observed=True)
+    codes = groups.ngroup().to_numpy()
+    sizes = groups.size().reset_index(drop=True)
+
+    alloc = allocate(sizes.sort_values(ascending=False, kind="stable"), n_total).sort_index()
+    short = alloc > sizes
+    if short.any():
+        g = groups.size().index[np.flatnonzero(short)[0]]
+        raise ValueError(f"Stratum {g} has only {sizes[short].iloc[0]} rows, cannot sample {alloc[short].iloc[0]}.")
+
+    starts = np.concatenate([[0], np.cumsum(sizes.to_numpy())[:-1]])
+    take = np.concatenate([np.arange(s, s + k) for s, k in zip(starts, alloc.to_numpy())])
+
+    rng = np.random.default_rng(seed)
+    out = np.empty((n_replicates, len(take)), dtype=np.int32 if len(df) < 2**31 else np.int64)
+    step = max(1, CHUNK_CELLS // max(len(df), 1))
+    for lo in range(0, n_replicates, step):
+        hi = min(lo + step, n_replicates)
+        keys = codes + rng.random((hi - lo, len(df)))  # stratum code + U[0, 1)
+        out[lo:hi] = np.argsort(keys, axis=1)[:, take]
+    return out
+
+def label_shares(labels: pd.Series, rows: np.ndarray) -> pd.DataFrame:
+    """Per-label share of each replicate: mean and 2.5/97.5% quantiles across replicates."""
+    codes, uniques = pd.factorize(labels.astype(str))
+    lab = codes[rows]
+    n_rep, n_lab = rows.shape[0], len(uniques)
+    counts = np.bincount((lab + n_lab * np.arange(n_rep)[:, None]).ravel(), minlength=n_rep * n_lab)
+    shares = counts.reshape(n_rep, n_lab) / rows.shape[1]
+    return pd.DataFrame({
+        "mean": shares.mean(axis=0),
+        "q025": np.quantile(shares, 0.025, axis=0),
+        "q975": np.quantile(shares, 0.975, axis=0),
+    }, index=pd.Index(uniques, name=labels.name)).sort_values("mean", ascending=False)
+
+def write_replicates(cfg: dict, df: pd.DataFrame, in_path: str, seed: int):
+    """Draw ground_truth_replicates.n samples and save their pr_keys as one index matrix."""
+    opts = cfg.get("ground_truth_replicates") or {}
+    n_rep = int(opts.get("n", 1000))
+    strata = list(opts.get("strata") or ["agent_type"])
+    missing = [c for c in strata + ["pr_key"] if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing {missing} in {in_path}. Columns: {list(df.columns)}")
+
+    with span("sample_replicates", rows_in=len(df)) as sp:
+        rows = replicate_samples(df, strata, N_TOTAL, n_rep, seed)
+        sp.rows_out = rows.size
+    pr_keys = df["pr_key"].to_numpy()[rows]
+
+    out_path = os.path.join(cfg["paths"]["derived_dir"], REPLICATES_FILE)
+    with span("write", rows_in=rows.size):
+        np.savez_compressed(out_path, pr_key=pr_keys, strata=np.array(strata), seed=seed,
+                            source=os.path.basename(in_path))
+    print("✅ Wrote:", out_path)
+    print(f"Replicates: {n_rep} x {rows.shape[1]} PRs, strata: {' x '.join(strata)}")
+    if "task_type_majority" in df.columns:
+        print("task_type_majority share across replicates:")
+        print(label_shares(df["task_type_majority"], rows).round(3).to_string())
+
+def build(cfg: dict, replicates: bool):
     derived_dir = cfg["paths"]["derived_dir"]
     os.makedirs(derived_dir, exist_ok=True)
 
-    in_path = os.path.join(derived_dir, "aidev_pop_ge500_commented_raprs_pr_level.csv")
+    in_path = derived_path(cfg, "aidev_pop_ge500_commented_raprs_pr_level")
     if not os.path.exists(in_path):
         raise FileNotFoundError(f"Missing {in_path}. Run script 03 first.")
 
-    df = pd.read_csv(in_path, low_memory=False)
+    with span("load") as sp:
+        df = read_derived(cfg, "aidev_pop_ge500_commented_raprs_pr_level")
+        sp.rows_out = len(df)
+    seed = int(cfg.get("ground_truth_seed", SEED))
 
     # Expect agent column in PR metadata (from script 01 merge)
     # In your PR CSV, agent column appears as 'agent_type'
@@ -55,24 +138,30 @@ def main():
     # Basic cleaning
     df["agent_type"] = df["agent_type"].astype(str)
 
+    if replicates:
+        write_replicates(cfg, df, in_path, seed)
+        return
+
     # Sample 200 PRs
-    gt = stratified_sample(df, group_col="agent_type", n_total=200, seed=SEED)
+    with span("sample", rows_in=len(df)) as sp:
+        gt = stratified_sample(df, group_col="agent_type", n_total=N_TOTAL, seed=seed)
+        sp.rows_out = len(gt)
 
     # Minimal manifest columns (stable identifiers)
     keep_cols = []
-    for c in ["full_name", "number", "repo_id", "html_url", "repo_url", "agent_type", "created_at", "closed_at", "title", "body"]:
+    for c in ["pr_key", "full_name", "number", "repo_id", "html_url", "repo_url", "agent_type", "created_at", "closed_at", "title", "body"]:
         if c in gt.columns:
             keep_cols.append(c)
 
     # Always keep the main join keys
-    for c in ["full_name", "number", "agent_type"]:
+    for c in ["pr_key", "full_name", "number", "agent_type"]:
         if c not in keep_cols and c in gt.columns:
             keep_cols.append(c)
 
     gt_out = gt[keep_cols].copy() if keep_cols else gt.copy()
 
-    out_path = os.path.join(derived_dir, "ground_truth_200_commented_raprs_pr_level.csv")
-    gt_out.to_csv(out_path, index=False)
+    with span("write", rows_in=len(gt_out)):
+        out_path = write_derived(gt_out, cfg, "ground_truth_200_commented_raprs_pr_level")
 
     # Save counts + seed for replication
     manifest_path = os.path.join(derived_dir, "ground_truth_200_manifest.txt")
@@ -80,8 +169,8 @@ def main():
 
     with open(manifest_path, "w", encoding="utf-8") as f:
         f.write("Ground-truth sampling manifest\n")
-        f.write(f"Seed: {SEED}\n")
-        f.write("Source: aidev_pop_ge500_commented_raprs_pr_level.csv\n")
+        f.write(f"Seed: {seed}\n")
+        f.write(f"Source: {os.path.basename(in_path)}\n")
         f.write("Stratified by: agent_type (proportional)\n\n")
         f.write("Counts per agent:\n")
         f.write(counts + "\n")
@@ -90,5 +179,16 @@ def main():
     print("✅ Wrote:", manifest_path)
     print("\nCounts per agent:\n", gt_out["agent_type"].value_counts())
 
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Stratified ground-truth sample of commented RAPRs.")
+    ap.add_argument("--replicates", action="store_true",
+                    help="Write ground_truth_replicates.n replicate samples (pr_key matrix) instead")
+    args = ap.parse_args(argv)
+
+    cfg = load_config()
+    # Stage names as in run_pipeline.py
+    with stage_report(cfg, "05-replicates" if args.replicates else "05"):
+        build(cfg, args.replicates)
+
 if __name__ == "__main__":
     main()
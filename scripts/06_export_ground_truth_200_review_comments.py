@@ -1,14 +1,16 @@
 import os
-import yaml
-import pandas as pd
+from derived_io import derived_columns, derived_path, read_derived, write_derived
+from instrument import instrumented, record_frame, span
+from utils_config import load_config
 
+@instrumented("06")
 def main():
-    cfg = yaml.safe_load(open("config/config.yaml", "r", encoding="utf-8"))
+    cfg = load_config()
     derived_dir = cfg["paths"]["derived_dir"]
     os.makedirs(derived_dir, exist_ok=True)
 
-    sample_path = os.path.join(derived_dir, "ground_truth_200_commented_raprs_pr_level.csv")
-    comments_path = os.path.join(derived_dir, "aidev_pop_ge500_pr_review_comments_with_task_type.csv")
+    sample_path = derived_path(cfg, "ground_truth_200_commented_raprs_pr_level")
+    comments_path = derived_path(cfg, "aidev_pop_ge500_pr_review_comments_with_task_type")
 
     if not os.path.exists(sample_path):
         raise FileNotFoundError(f"Missing {sample_path}. Run script 05 first.")
@@ -19,47 +21,42 @@ def main():
     print("Sample:", sample_path)
     print("Comments:", comments_path)
 
-    sample = pd.read_csv(sample_path, low_memory=False)
-    comments = pd.read_csv(comments_path, low_memory=False)
+    with span("load") as sp:
+        sample = read_derived(cfg, "ground_truth_200_commented_raprs_pr_level", columns=["pr_key"])
 
-    # Required join keys
-    for col in ["full_name", "number"]:
-        if col not in sample.columns:
-            raise ValueError(f"Sample missing '{col}'. Columns: {list(sample.columns)}")
-        if col not in comments.columns:
-            raise ValueError(f"Comments missing '{col}'. Columns: {list(comments.columns)}")
+        # Required join key (dense integer PR key from the key index, see script 01)
+        if "pr_key" not in sample.columns:
+            raise ValueError(f"Sample missing 'pr_key'. Columns: {list(sample.columns)}")
+        comment_cols = derived_columns(cfg, "aidev_pop_ge500_pr_review_comments_with_task_type")
+        if "pr_key" not in comment_cols:
+            raise ValueError(f"Comments missing 'pr_key'. Columns: {comment_cols}")
 
-    # Normalize types
-    sample["full_name"] = sample["full_name"].astype(str)
-    comments["full_name"] = comments["full_name"].astype(str)
-
-    sample["number"] = pd.to_numeric(sample["number"], errors="coerce")
-    comments["number"] = pd.to_numeric(comments["number"], errors="coerce")
-    sample = sample.dropna(subset=["number"])
-    comments = comments.dropna(subset=["number"])
-    sample["number"] = sample["number"].astype("int64")
-    comments["number"] = comments["number"].astype("int64")
-
-    keys = sample[["full_name", "number"]].drop_duplicates()
+        # Only comments on sampled PRs are read (filter pushed down into the Parquet scan)
+        comments = read_derived(cfg, "aidev_pop_ge500_pr_review_comments_with_task_type",
+                                filters=[("pr_key", "in", sample["pr_key"].dropna().astype(int).tolist())])
+        sp.rows_out = len(comments)
+    record_frame("comments", comments)
 
     # Filter comments down to only those PRs
-    gt_comments = comments.merge(keys, on=["full_name", "number"], how="inner")
+    with span("filter", rows_in=len(comments)) as sp:
+        gt_comments = comments.loc[comments["pr_key"].isin(sample["pr_key"])]
 
-    # Optional: sort chronologically if timestamps exist
-    if "created_at_comment" in gt_comments.columns:
-        gt_comments = gt_comments.sort_values(["full_name", "number", "created_at_comment"])
-    elif "created_at" in gt_comments.columns:
-        gt_comments = gt_comments.sort_values(["full_name", "number", "created_at"])
+        # Optional: sort chronologically if timestamps exist
+        if "created_at_comment" in gt_comments.columns:
+            gt_comments = gt_comments.sort_values(["full_name", "number", "created_at_comment"])
+        elif "created_at" in gt_comments.columns:
+            gt_comments = gt_comments.sort_values(["full_name", "number", "created_at"])
+        sp.rows_out = len(gt_comments)
 
-    out_path = os.path.join(derived_dir, "ground_truth_200_review_comments.csv")
-    gt_comments.to_csv(out_path, index=False)
+    with span("write", rows_in=len(gt_comments)):
+        out_path = write_derived(gt_comments, cfg, "ground_truth_200_review_comments")
 
     print("✅ Wrote:", out_path)
     print("Rows (comments):", len(gt_comments))
-    print("Unique PRs:", gt_comments[["full_name", "number"]].drop_duplicates().shape[0])
+    print("Unique PRs:", gt_comments["pr_key"].nunique())
 
     # quick check of comment volume distribution
-    per_pr = gt_comments.groupby(["full_name", "number"]).size()
+    per_pr = gt_comments.groupby("pr_key").size()
     print("\nComment count per PR (summary):")
     print(per_pr.describe())
 
@@ -1,7 +1,12 @@
+import argparse
 import os
 import re
-import yaml
+import numpy as np
 import pandas as pd
+from derived_io import derived_columns, derived_path, export_csv, read_derived, write_derived
+from instrument import record_frame, span, stage_report
+from text_store import TextStore, attach_text, store_path, stored_columns
+from utils_config import load_config
 
 TRIVIAL_PATTERNS = [
     r"^\s*$",
@@ -11,101 +16,123 @@ TRIVIAL_PATTERNS = [
     r"^\s*(\+1|👍)\s*$",
 ]
 
-def is_substantive(text: str) -> bool:
-    if text is None:
-        return False
-    t = str(text).strip()
-    if not t:
-        return False
-    low = t.lower()
-    for p in TRIVIAL_PATTERNS:
-        if re.match(p, low):
-            return False
-    # Too short is usually not useful as a "blocking reason"
-    if len(t) < 20:
-        return False
-    return True
-
-def pick_final_substantive(group: pd.DataFrame, body_col: str, time_col: str) -> pd.Series:
-    # group already sorted by time
-    # Walk backwards and pick last substantive comment
-    for i in range(len(group) - 1, -1, -1):
-        row = group.iloc[i]
-        if is_substantive(row.get(body_col, "")):
-            return row
-    # fallback: last row even if trivial (rare)
-    return group.iloc[-1]
-
-def main():
-    cfg = yaml.safe_load(open("config/config.yaml", "r", encoding="utf-8"))
+# All trivial patterns as one regex (re.match of the alternation == any pattern matches)
+TRIVIAL_RE = re.compile("|".join(f"(?:{p})" for p in TRIVIAL_PATTERNS))
+
+# Input/output datasets per scope: the ground-truth 200 sample or every commented RAPR
+SCOPES = {
+    "ground_truth": ("ground_truth_200_review_comments", "ground_truth_200_final_blocking_comment", "06"),
+    "all": ("aidev_pop_ge500_pr_review_comments_with_task_type", "aidev_pop_ge500_final_blocking_comment", "02"),
+}
+
+TIME_COL_CANDIDATES = ["created_at_comment", "created_at", "updated_at", "updated_at_comment"]
+BODY_COL_CANDIDATES = ["body_comment", "body", "comment_body"]
+KEEP_COLS = ["pr_key", "full_name", "number", "agent_type", "task_type", "path", "diff_hunk", "position"]
+
+def substantive_mask(bodies: pd.Series) -> np.ndarray:
+    """
+    Per comment body: not missing, not a trivial ack (TRIVIAL_PATTERNS) and at
+    least 20 characters after stripping; too short is usually not useful as a
+    "blocking reason".
+    """
+    present = bodies.notna().to_numpy()
+    # object dtype keeps Python `re` semantics; missing bodies are masked out by `present`
+    t = bodies.astype(object).where(present, "").astype(str).str.strip()
+    trivial = t.str.lower().str.match(TRIVIAL_RE).to_numpy(dtype=bool)
+    return present & ~trivial & (t.str.len() >= 20).to_numpy()
+
+def pick_final_substantive(df: pd.DataFrame, body_col: str, keys: list) -> pd.DataFrame:
+    """
+    Per PR, the last substantive comment, falling back to the last comment.
+    `df` must be sorted by keys + time.
+    """
+    pos = np.arange(len(df))
+    group = df.groupby(keys, sort=False).ngroup().to_numpy()
+    last_any = pd.Series(pos).groupby(group).max()
+    last_sub = pd.Series(np.where(substantive_mask(df[body_col]), pos, -1)).groupby(group).max()
+    return df.iloc[np.where(last_sub >= 0, last_sub, last_any)]
+
+def build(cfg: dict, scope: str):
+    in_name, out_name, producer = SCOPES[scope]
     derived_dir = cfg["paths"]["derived_dir"]
     os.makedirs(derived_dir, exist_ok=True)
 
-    in_path = os.path.join(derived_dir, "ground_truth_200_review_comments.csv")
+    in_path = derived_path(cfg, in_name)
     if not os.path.exists(in_path):
-        raise FileNotFoundError(f"Missing {in_path}. Run script 06 first.")
+        raise FileNotFoundError(f"Missing {in_path}. Run script {producer} first.")
 
-    df = pd.read_csv(in_path, low_memory=False)
+    # Text moved to the side store by script 02 is available through its *_ref column
+    stored = stored_columns(derived_columns(cfg, in_name))
+    columns = derived_columns(cfg, in_name) + list(stored)
 
     # Keys
-    for c in ["full_name", "number"]:
-        if c not in df.columns:
-            raise ValueError(f"Missing '{c}' in {in_path}. Columns: {list(df.columns)}")
+    for c in ["pr_key", "full_name", "number"]:
+        if c not in columns:
+            raise ValueError(f"Missing '{c}' in {in_path}. Columns: {columns}")
 
     # Choose the best available timestamp column
-    time_col = None
-    for cand in ["created_at_comment", "created_at", "updated_at", "updated_at_comment"]:
-        if cand in df.columns:
-            time_col = cand
-            break
+    time_col = next((c for c in TIME_COL_CANDIDATES if c in columns), None)
     if time_col is None:
         raise ValueError(
             "No timestamp column found. Need one of: created_at_comment, created_at, updated_at, updated_at_comment"
         )
 
     # Choose body column
-    body_col = None
-    for cand in ["body_comment", "body", "comment_body"]:
-        if cand in df.columns:
-            body_col = cand
-            break
+    body_col = next((c for c in BODY_COL_CANDIDATES if c in columns), None)
     if body_col is None:
-        raise ValueError(f"No comment body column found. Columns: {list(df.columns)}")
+        raise ValueError(f"No comment body column found. Columns: {columns}")
+
+    # Only the columns of the labeling view are loaded
+    keep_cols = [c for c in KEEP_COLS[:5] + [time_col, body_col] + KEEP_COLS[5:] if c in columns]
+    with span("load") as sp:
+        df = read_derived(cfg, in_name, columns=[stored.get(c, c) for c in keep_cols])
+        store = TextStore(store_path(cfg)) if stored else None
+        # Every comment body is needed to find the substantive ones; other text only for the picks
+        df = attach_text(cfg, df, [body_col], store=store)
+        sp.rows_out = len(df)
+    record_frame("comments", df)
 
     # Normalize
-    df["full_name"] = df["full_name"].astype(str)
-    df["number"] = pd.to_numeric(df["number"], errors="coerce").dropna().astype("int64")
-    df[time_col] = pd.to_datetime(df[time_col], errors="coerce")
+    with span("normalize", rows_in=len(df)) as sp:
+        df = df.dropna(subset=["number"]).astype({"full_name": str, "number": "int64"})
+        df[time_col] = pd.to_datetime(df[time_col], errors="coerce", utc=True)
+        df = df.dropna(subset=[time_col])
+        sp.rows_out = len(df)
 
     # Sort and pick final substantive per PR
-    df = df.sort_values(["full_name", "number", time_col])
-
-    picked_rows = []
-    for (repo, num), g in df.groupby(["full_name", "number"], sort=False):
-        g = g.dropna(subset=[time_col])
-        if len(g) == 0:
-            continue
-        picked = pick_final_substantive(g, body_col=body_col, time_col=time_col)
-        picked_rows.append(picked)
-
-    out = pd.DataFrame(picked_rows).copy()
-
-    # Keep a clean minimal view for labeling
-    keep_cols = []
-    for c in ["full_name", "number", "agent_type", "task_type", time_col, body_col, "path", "diff_hunk", "position"]:
-        if c in out.columns:
-            keep_cols.append(c)
-
-    out_min = out[keep_cols].copy() if keep_cols else out.copy()
+    with span("pick_final", rows_in=len(df)) as sp:
+        df = df.sort_values(["full_name", "number", time_col], kind="stable")
+        out = pick_final_substantive(df, body_col=body_col, keys=["pr_key"])
+        sp.rows_out = len(out)
+
+    with span("fetch_text", rows_in=len(out)):
+        out = attach_text(cfg, out, store=store)
+    out_min = out[keep_cols].reset_index(drop=True)
     out_min = out_min.rename(columns={body_col: "final_blocking_comment", time_col: "final_comment_time"})
 
-    out_path = os.path.join(derived_dir, "ground_truth_200_final_blocking_comment.csv")
-    out_min.to_csv(out_path, index=False)
-
+    with span("write", rows_in=len(out_min)):
+        out_path = write_derived(out_min, cfg, out_name)
     print("✅ Wrote:", out_path)
+
+    # CSV copy used to build the labeling sheet (Step 8)
+    if scope == "ground_truth":
+        csv_path = export_csv(out_min, cfg, out_name)
+        if csv_path and csv_path != out_path:
+            print("✅ Wrote:", csv_path)
     print("Rows (PRs):", len(out_min))
     print("Example rows:")
     print(out_min.head(3).to_string(index=False))
 
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Pick the final blocking (substantive) review comment per PR.")
+    ap.add_argument("--scope", choices=sorted(SCOPES), default="ground_truth",
+                    help="ground_truth: the 200-PR sample (default); all: every commented RAPR")
+    args = ap.parse_args(argv)
+
+    cfg = load_config()
+    # Stage names as in run_pipeline.py
+    with stage_report(cfg, "07" if args.scope == "ground_truth" else "07-all"):
+        build(cfg, args.scope)
+
 if __name__ == "__main__":
     main()
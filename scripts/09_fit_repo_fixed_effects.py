@@ -0,0 +1,157 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from derived_io import derived_path, export_csv, read_derived, write_derived
+from scipy.stats import norm
+from fixed_effects import bootstrap_chunk, fit_logit, init_bootstrap, null_loglik, wald_cov
+from instrument import instrumented, record_frame, span
+from utils_config import load_config
+
+OUT_NAME = "rejection_model_odds_ratios"
+
+# Predictors of PR_Commit_details.ipynb / repo_fixed_effects.ipynb -> factor labels used in the plots
+FACTORS = {
+    "month_index": "Month index",
+    "log_total_changes": "Size (log_total_changes)",
+    "touched_tests": "Touched tests",
+    "touched_docs": "Touched docs",
+}
+MODELS = ["pooled", "repo_fe"]  # rejected ~ predictors; same + repo fixed effects
+
+
+def load_closed_prs(cfg: dict) -> pd.DataFrame:
+    """Closed PRs (MERGED/REJECTED) with commit features, y = rejected."""
+    with span("load") as sp:
+        prs = read_derived(cfg, "aidev_pop_ge500_agent_prs",
+                           columns=["pr_key", "repo_id", "created_at", "pr_outcome"],
+                           filters=[("pr_outcome", "in", ["MERGED", "REJECTED"])])
+        feat = read_derived(cfg, "aidev_pop_ge500_pr_features",
+                            columns=["pr_key", "total_changes", "touched_tests", "touched_docs"])
+        df = prs.merge(feat, on="pr_key", how="inner")
+        sp.rows_out = len(df)
+
+    df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce", utc=True)
+    df = df.dropna(subset=["created_at", "repo_id"]).reset_index(drop=True)
+    df["rejected"] = (df["pr_outcome"] == "REJECTED").astype("int64")
+    month_key = df["created_at"].dt.year * 12 + df["created_at"].dt.month
+    df["month_index"] = month_key - month_key.min()
+    df["log_total_changes"] = np.log1p(df["total_changes"].clip(lower=0).fillna(0))
+    return df
+
+
+def design(df: pd.DataFrame) -> tuple:
+    """
+    Intercept + predictors scaled to unit variance (StandardScaler(with_mean=False),
+    as in repo_fixed_effects.ipynb), and the repo codes of the one-hot block.
+    """
+    X = df[list(FACTORS)].to_numpy(dtype=float)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    X = np.column_stack([np.ones(len(X)), X / scale])
+    groups, repos = pd.factorize(df["repo_id"])
+    return X, scale, groups.astype(np.int64), len(repos)
+
+
+def bootstrap(data: dict, n_boot: int, seed: int, workers: int) -> np.ndarray:
+    """(n_boot, 2, k) coefficients; one child seed per replicate, so results do not depend on workers."""
+    seeds = np.random.SeedSequence(seed).spawn(n_boot)
+    n_chunks = min(n_boot, workers * 4)
+    chunks = [list(c) for c in np.array_split(np.array(seeds, dtype=object), n_chunks)]
+    if workers == 1:
+        init_bootstrap(data)
+        parts = [bootstrap_chunk(c) for c in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_bootstrap, initargs=(data,)) as pool:
+            parts = list(pool.map(bootstrap_chunk, chunks))
+    return np.concatenate(parts)
+
+
+def odds_ratio_table(coefs: dict, covs: dict, boot, scale: np.ndarray, stats: dict) -> pd.DataFrame:
+    """
+    Odds ratios per unit of each predictor (not per SD), with 95% percentile
+    CIs and two-sided p-values from the repo-clustered bootstrap (`p`, at least
+    2 / (n_boot + 1)), and Wald standard errors and p-values (`se_wald`, `p_wald`).
+    """
+    rows = []
+    for m, model in enumerate(MODELS):
+        coef = coefs[model][1:] / scale
+        se_wald = np.sqrt(np.diag(covs[model])[1:]) / scale
+        p_wald = 2 * norm.sf(np.abs(coef / se_wald))
+        draws = boot[:, m, 1:] / scale if boot is not None else None
+        for j, (term, factor) in enumerate(FACTORS.items()):
+            row = {"model": model, "term": term, "factor": factor, "coef": coef[j], "or": np.exp(coef[j]),
+                   "se": np.nan, "ci_low": np.nan, "ci_high": np.nan, "p": np.nan,
+                   "se_wald": se_wald[j], "p_wald": p_wald[j]}
+            if draws is not None:
+                b = draws[:, j]
+                lo, hi = np.quantile(b, [0.025, 0.975])
+                tail = min((b <= 0).sum(), (b >= 0).sum())
+                row.update(se=b.std(ddof=1), ci_low=np.exp(lo), ci_high=np.exp(hi),
+                           p=min(1.0, 2 * (tail + 1) / (len(b) + 1)))
+            rows.append({**row, **stats[model]})
+    return pd.DataFrame(rows)
+
+
+@instrumented("09")
+def main():
+    cfg = load_config()
+    derived_dir = cfg["paths"]["derived_dir"]
+    os.makedirs(derived_dir, exist_ok=True)
+    opts = cfg.get("repo_fixed_effects") or {}
+    C = float(opts.get("C", 1.0))
+    n_boot = int(opts.get("bootstrap", 500))
+    workers = max(1, int(opts.get("workers", os.cpu_count() or 1)))
+    seed = int(opts.get("seed", cfg.get("seed", 42)))
+
+    for name, step in [("aidev_pop_ge500_agent_prs", "01"), ("aidev_pop_ge500_pr_features", "04")]:
+        path = derived_path(cfg, name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Missing {path}. Run script {step} first.")
+
+    print("=== Rejection model with repository fixed effects ===")
+    df = load_closed_prs(cfg)
+    record_frame("closed_prs", df)
+    with span("design", rows_in=len(df)):
+        X, scale, groups, n_repos = design(df)
+        y = df["rejected"].to_numpy(dtype=float)
+    print(f"Closed PRs: {len(df)}  repos: {n_repos}  rejected: {y.mean():.3f}")
+
+    with span("fit", rows_in=len(df)) as sp:
+        pooled = fit_logit(X, y)
+        fe = fit_logit(X, y, groups, n_repos, C=C)
+        sp.extra["iterations"] = [pooled["n_iter"], fe["n_iter"]]
+        covs = {"pooled": wald_cov(X, pooled), "repo_fe": wald_cov(X, fe, groups, n_repos, C=C)}
+    ll0 = null_loglik(y)
+    stats = {
+        model: {"n_obs": len(df), "n_repos": n_repos if model == "repo_fe" else 0,
+                "pseudo_r2": 1 - fit["loglik"] / ll0 if ll0 else np.nan, "n_boot": n_boot}
+        for model, fit in zip(MODELS, [pooled, fe])
+    }
+    print("Pseudo-R2 (no repo effects):", round(stats["pooled"]["pseudo_r2"], 3))
+    print("Pseudo-R2 (with repo effects):", round(stats["repo_fe"]["pseudo_r2"], 3))
+
+    boot = None
+    if n_boot > 0:
+        data = {"X": X, "y": y, "groups": groups, "n_groups": n_repos, "C": C,
+                "pooled": pooled["beta"], "beta": fe["beta"], "alpha": fe["alpha"]}
+        workers = min(workers, n_boot)
+        print(f"Repo-clustered bootstrap: {n_boot} replicates, workers: {workers}")
+        # Worker processes' memory is not included in this process's numbers
+        with span("bootstrap", rows_in=len(df)) as sp:
+            boot = bootstrap(data, n_boot, seed, workers)
+            sp.rows_out = len(boot)
+
+    table = odds_ratio_table({"pooled": pooled["beta"], "repo_fe": fe["beta"]}, covs, boot, scale, stats)
+    with span("write", rows_in=len(table)):
+        out_path = write_derived(table, cfg, OUT_NAME)
+        csv_path = export_csv(table, cfg, OUT_NAME)
+
+    print("✅ Wrote:", out_path)
+    if csv_path and csv_path != out_path:
+        print("✅ Wrote:", csv_path)
+    print(table[["model", "factor", "or", "ci_low", "ci_high", "p", "p_wald"]].round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import os
+import pandas as pd
+from derived_io import derived_path, export_csv, read_derived, write_derived
+from llm_engine import ChatClient, ResponseCache, TokenBucket, run_cached
+from instrument import span, stage_report
+from preclassifier import PreClassifier
+from text_store import attach_text
+from taxonomy import SYSTEM_PROMPT, create_classification_prompt, parse_classification
+from utils_config import load_config
+
+IN_NAME = "aidev_pop_ge500_pr_review_comments_with_task_type"
+PR_NAME = "aidev_pop_ge500_agent_prs"
+OUT_NAME = "pr_classifications_results"
+TRIAGE_NAME = "pr_preclassifications"
+CLUSTERS_NAME = "aidev_pop_ge500_review_comment_clusters"
+
+RESULT_COLS = ["category", "confidence", "explanation", "secondary_category"]
+
+
+def load_rows(cfg: dict, sample_size) -> pd.DataFrame:
+    """Comments with enough text to classify, sampled as in the notebook."""
+    # Comment bodies come from the text store; diff hunks stay as references
+    df = attach_text(cfg, read_derived(cfg, IN_NAME), ["body_comment"])
+    if "body_comment" not in df.columns:
+        raise ValueError(f"Comments dataset missing body_comment. Columns: {list(df.columns)}")
+
+    # The comment table references its PR by pr_key; the PR description comes from step 01
+    if "body_pr" not in df.columns:
+        pr = read_derived(cfg, PR_NAME, columns=["pr_key", "body"])
+        if "body" not in pr.columns:
+            raise ValueError(f"PR dataset missing body. Columns: {list(pr.columns)}")
+        df = df.merge(pr.rename(columns={"body": "body_pr"}), on="pr_key", how="left")
+
+    df["body_comment"] = df["body_comment"].fillna("")
+    df["body_pr"] = df["body_pr"].fillna("")
+    df["combined_text"] = df["body_pr"] + "\n\n" + df["body_comment"]
+    df = df[df["combined_text"].str.strip().str.len() > 10].copy()
+
+    if sample_size and int(sample_size) < len(df):
+        df = df.sample(n=int(sample_size), random_state=int(cfg.get("seed", 42)))
+    return df
+
+
+def preclassify(cfg: dict, df: pd.DataFrame) -> pd.DataFrame:
+    """Add local_category/local_prob/route; without a trained pre-classifier every row is routed to the LLM."""
+    clf = PreClassifier.from_config(cfg, seed=int(cfg.get("seed", 42)))
+    if clf is None:
+        return df.assign(local_category=None, local_prob=float("nan"), route="llm")
+    print("Pre-classifier:", clf.summary())
+    with span("preclassify", rows_in=len(df)) as sp:
+        df = df.join(clf.predict(df["body_comment"]))
+        sp.rows_out = int((df["route"] == "local").sum())
+    return df
+
+
+def mark_clusters(cfg: dict, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add comment_cluster_id and cluster_rep from step 13: one row per cluster (its
+    canonical comment if sampled, else the first sampled one) is classified, the
+    others copy its label. Without step 13 output, or with
+    comment_clusters.propagate_labels off, every row is its own representative.
+    """
+    path = derived_path(cfg, CLUSTERS_NAME)
+    if not (cfg.get("comment_clusters") or {}).get("propagate_labels", True) or "id" not in df.columns \
+            or not os.path.exists(path):
+        return df.assign(cluster_rep=True)
+    clusters = read_derived(cfg, CLUSTERS_NAME, columns=["id", "comment_cluster_id", "is_canonical"])
+    df = df.merge(clusters, on="id", how="left")
+    missing = df["comment_cluster_id"].isna()
+    if missing.any():
+        print(f"{int(missing.sum())} rows not in {CLUSTERS_NAME} (rerun step 13); classified individually")
+    key = df["comment_cluster_id"].where(~missing, -1 - df.index.to_series())
+    first = df.assign(key=key).sort_values("is_canonical", ascending=False, kind="stable").drop_duplicates("key")
+    df["cluster_rep"] = df.index.isin(first.index)
+    return df.drop(columns=["is_canonical"])
+
+
+def propagate(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+    """Copy `columns` from each cluster's representative row to its other rows (route "cluster")."""
+    members = ~df["cluster_rep"]
+    if not members.any():
+        return df
+    reps = df[df["cluster_rep"]].drop_duplicates("comment_cluster_id").set_index("comment_cluster_id")
+    src = reps[columns].reindex(df.loc[members, "comment_cluster_id"]).set_axis(df.index[members])
+    df = df.copy()
+    for c in columns:
+        df[c] = df[c].where(~members, src[c])
+    df.loc[members, "route"] = "cluster"
+    return df
+
+
+def calls_saved(df: pd.DataFrame) -> str:
+    """Rows and distinct prompts (= LLM calls) that the local labels and cluster propagation replace."""
+    local = df["route"] == "local"
+    cluster = df["route"] == "cluster"
+    prompts = len(df[["body_pr", "body_comment"]].drop_duplicates())
+    sent = len(df.loc[df["route"] == "llm", ["body_pr", "body_comment"]].drop_duplicates())
+    return (f"{int(local.sum())} of {len(df)} rows labeled locally, {int(cluster.sum())} by their near-duplicate "
+            f"cluster; LLM calls {sent} instead of {prompts} ({prompts - sent} saved)")
+
+
+def triage(cfg: dict, df: pd.DataFrame) -> pd.DataFrame:
+    """Pre-classify one row per near-duplicate cluster; the other rows are routed "cluster"."""
+    df = mark_clusters(cfg, df)
+    reps = preclassify(cfg, df[df["cluster_rep"]])
+    members = df[~df["cluster_rep"]].assign(local_category=None, local_prob=float("nan"), route="cluster")
+    return pd.concat([reps, members]).sort_index()
+
+
+def triage_only(cfg: dict):
+    """Pre-classify every RAPR comment (no sampling, no API calls) and report the LLM calls saved."""
+    print("=== Pre-classify rejection reasons locally ===")
+    with span("load") as sp:
+        df = load_rows(cfg, None)
+        sp.rows_out = len(df)
+    print("Rows:", len(df))
+    df = triage(cfg, df)
+    print(calls_saved(df))
+
+    # Agreement with earlier LLM labels, where step 10 has already classified the same comments
+    llm_path = derived_path(cfg, OUT_NAME)
+    if "id" in df.columns and os.path.exists(llm_path):
+        llm = read_derived(cfg, OUT_NAME, columns=["id", "category", "classified_by"])
+        if "classified_by" in llm.columns:
+            llm = llm[llm["classified_by"] == "llm"]  # not the earlier local labels
+        llm = llm.drop_duplicates("id")
+        both = df[df["route"] == "local"].merge(llm, on="id")
+        if len(both):
+            agree = (both["local_category"].astype(str) == both["category"].astype(str)).mean()
+            print(f"Agreement with LLM labels on {len(both)} locally labeled rows: {agree:.3f}")
+
+    if "comment_cluster_id" in df.columns:
+        df = propagate(df, ["local_category", "local_prob"])  # route stays "cluster"
+    out = df.drop(columns=["body_pr", "body_comment", "combined_text", "cluster_rep"])
+    with span("write", rows_in=len(out)):
+        out_path = write_derived(out, cfg, TRIAGE_NAME)
+        csv_path = export_csv(out, cfg, TRIAGE_NAME)
+    print("✅ Wrote:", out_path)
+    if csv_path and csv_path != out_path:
+        print("✅ Wrote:", csv_path)
+    print("Local category counts:\n", out.loc[out["route"] == "local", "local_category"].value_counts())
+
+
+def classify(cfg: dict):
+    llm = cfg.get("llm") or {}
+    model = llm.get("model", "gpt-4o")
+    params = {"temperature": 0.1, "max_tokens": 500, "response_format": {"type": "json_object"}}
+    params.update(llm.get("params") or {})
+
+    print("=== Classify rejection reasons with an LLM ===")
+    print("Model:", model, "| endpoint:", llm.get("base_url", "https://api.openai.com/v1"))
+    with span("load") as sp:
+        df = load_rows(cfg, llm.get("sample_size"))
+        sp.rows_out = len(df)
+    print("Rows to classify:", len(df))
+    df = triage(cfg, df)
+    print(calls_saved(df))
+
+    # Identical (PR body, comment) pairs produce identical prompts: send each once
+    pairs = df.loc[df["route"] == "llm", ["body_pr", "body_comment"]].drop_duplicates().reset_index(drop=True)
+    jobs = {}
+    for row in pairs.itertuples(index=False):
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": create_classification_prompt(row.body_pr, row.body_comment)},
+        ]
+        jobs[ResponseCache.key(model, messages, params)] = messages
+    pairs["prompt_key"] = list(jobs)
+    df = df.merge(pairs, on=["body_pr", "body_comment"], how="left")
+    print("Distinct prompts:", len(jobs))
+
+    cache = ResponseCache(llm.get("cache_path", os.path.join(cfg["paths"]["raw_dir"], "llm_cache.sqlite")))
+    api_key = os.environ.get(llm.get("api_key_env", "OPENAI_API_KEY"), "")
+    client = ChatClient(
+        base_url=llm.get("base_url", "https://api.openai.com/v1"),
+        api_key=api_key,
+        model=model,
+        params=params,
+        bucket=TokenBucket(float(llm.get("requests_per_second", 2)), llm.get("burst")),
+        max_retries=int(llm.get("max_retries", 3)),
+        timeout=float(llm.get("timeout_s", 60)),
+    )
+    try:
+        with span("llm_requests", rows_in=len(jobs)) as sp:
+            results = run_cached(
+                client, cache, jobs, parse_classification,
+                concurrency=int(llm.get("concurrency", 8)),
+            )
+            sp.rows_out = len(results)
+    finally:
+        cache.close()
+
+    res = pd.DataFrame.from_dict(results, orient="index")
+    if "error" not in res.columns:
+        res["error"] = None
+    res["success"] = res["error"].isna()
+    failed = ~res["success"]
+    if failed.any():
+        res.loc[failed, "category"] = "OTHER"
+        res.loc[failed, "confidence"] = "low"
+        res.loc[failed, "explanation"] = "Classification failed: " + res.loc[failed, "error"].astype(str)
+    for c in RESULT_COLS:
+        if c not in res.columns:
+            res[c] = None
+    out = df.join(res[RESULT_COLS + ["success"]], on="prompt_key")
+
+    # Rows labeled by the pre-classifier
+    local = out["route"] == "local"
+    out.loc[local, "category"] = out.loc[local, "local_category"]
+    out.loc[local, "confidence"] = pd.cut(out.loc[local, "local_prob"], [0, 0.5, 0.8, 1],
+                                          labels=["low", "medium", "high"], include_lowest=True).astype(str)
+    out.loc[local, "explanation"] = "Pre-classifier (p=" + out.loc[local, "local_prob"].round(3).astype(str) + ")"
+    out.loc[local, "success"] = True
+    if "comment_cluster_id" in out.columns:
+        out = propagate(out, RESULT_COLS + ["success"])
+        out["success"] = out["success"].astype(bool)
+    out = out.rename(columns={"route": "classified_by"}).drop(columns=["local_category", "local_prob", "cluster_rep"])
+
+    with span("write", rows_in=len(out)):
+        out_path = write_derived(out, cfg, OUT_NAME)
+        csv_path = export_csv(out, cfg, OUT_NAME)
+
+    print("✅ Wrote:", out_path)
+    if csv_path and csv_path != out_path:
+        print("✅ Wrote:", csv_path)
+    print(f"Classification success rate: {out['success'].mean() * 100:.1f}%")
+    print("Category counts:\n", out["category"].value_counts(dropna=False))
+    if not out["success"].all():
+        print("Failed prompts are not cached; rerun to retry them.")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Classify rejection reasons (local pre-classifier, then the LLM).")
+    ap.add_argument("--triage-only", action="store_true",
+                    help="only run the local pre-classifier over all comments and report the LLM calls it saves")
+    args = ap.parse_args(argv)
+
+    cfg = load_config()
+    os.makedirs(cfg["paths"]["derived_dir"], exist_ok=True)
+    in_path = derived_path(cfg, IN_NAME)
+    if not os.path.exists(in_path):
+        raise FileNotFoundError(f"Missing {in_path}. Run script 02 first.")
+
+    # Stage names as in run_pipeline.py
+    with stage_report(cfg, "10-triage" if args.triage_only else "10"):
+        if args.triage_only:
+            triage_only(cfg)
+        else:
+            classify(cfg)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+import numpy as np
+import pandas as pd
+from derived_io import derived_path, read_derived
+from instrument import instrumented, record_frame, span
+from task_type_rules import infer_task_types
+from text_index import FIELDS, TextIndex, hash_texts, index_path
+from text_store import TextStore, store_path
+from utils_config import load_config
+
+COMMENTS_NAME = "aidev_pop_ge500_pr_review_comments_with_task_type"
+PR_NAME = "aidev_pop_ge500_agent_prs"
+
+
+def comment_docs(comments: pd.DataFrame) -> tuple:
+    """(docs, hash -> text lookup) for comment bodies, referenced (text store) or inline."""
+    if "body_comment_ref" in comments.columns:
+        refs = comments["body_comment_ref"]
+        docs = pd.DataFrame({"hash": refs, "pr_key": comments["pr_key"], "field": FIELDS["comment"]}).dropna()
+        return docs.astype({"hash": "int64"}), None
+    if "body_comment" not in comments.columns:
+        raise ValueError(f"Comments dataset missing body_comment. Columns: {list(comments.columns)}")
+    texts = comments["body_comment"]
+    docs = pd.DataFrame({"hash": hash_texts(texts), "pr_key": comments["pr_key"], "field": FIELDS["comment"]})
+    keep = texts.notna().to_numpy()
+    return docs[keep], pd.Series(texts[keep].to_numpy(), index=docs["hash"][keep].to_numpy())
+
+
+def pr_docs(prs: pd.DataFrame) -> tuple:
+    """(docs, hash -> text lookup) for PR titles and bodies."""
+    docs, lookups = [], []
+    for field, col in [("title", "title"), ("body", "body")]:
+        if col not in prs.columns:
+            continue
+        keep = prs[col].notna().to_numpy()
+        texts = prs.loc[keep, col]
+        hashes = hash_texts(texts)
+        docs.append(pd.DataFrame({"hash": hashes, "pr_key": prs.loc[keep, "pr_key"].to_numpy(), "field": FIELDS[field]}))
+        lookups.append(pd.Series(texts.to_numpy(), index=hashes))
+    return pd.concat(docs, ignore_index=True), pd.concat(lookups)
+
+
+@instrumented("11")
+def main():
+    cfg = load_config()
+    opts = cfg.get("text_index") or {}
+    batch_texts = max(1, int(opts.get("batch_texts", 50_000)))
+    max_segments = max(1, int(opts.get("max_segments", 16)))
+
+    for name, step in [(PR_NAME, "01"), (COMMENTS_NAME, "02")]:
+        path = derived_path(cfg, name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Missing {path}. Run script {step} first.")
+
+    print("=== Build full-text index over review comments and PR titles/bodies ===")
+    with span("load") as sp:
+        comments = read_derived(cfg, COMMENTS_NAME, columns=["pr_key", "body_comment_ref", "body_comment"])
+        prs = read_derived(cfg, PR_NAME, columns=["pr_key", "full_name", "number", "agent_type", "pr_outcome",
+                                                  "title", "body"])
+        sp.rows_out = len(comments) + len(prs)
+    record_frame("prs", prs)
+    # Same rule as step 02, applied to every PR so that task_type filters merged PRs too
+    prs["task_type"] = infer_task_types(prs["title"]) if "title" in prs.columns else "unknown"
+
+    with span("hash_docs", rows_in=len(comments) + len(prs)) as sp:
+        c_docs, c_texts = comment_docs(comments)
+        p_docs, p_texts = pr_docs(prs)
+        docs = pd.concat([c_docs, p_docs], ignore_index=True)
+        sp.rows_out = len(docs)
+
+    path = index_path(cfg)
+    index = TextIndex(path, create=True)
+    try:
+        # Only texts whose hash is not indexed yet are read and tokenized
+        with span("index_new_texts", rows_in=docs["hash"].nunique()) as sp:
+            known = index.text_ids().index
+            new_hashes = pd.unique(docs.loc[~docs["hash"].isin(known), "hash"].to_numpy())
+            lookup = pd.concat([s for s in (c_texts, p_texts) if s is not None])
+            lookup = lookup[~lookup.index.duplicated()]
+            texts = lookup.reindex(new_hashes)
+            missing = texts.isna().to_numpy()
+            if missing.any():  # comment bodies kept in the text store
+                texts[missing] = TextStore(store_path(cfg)).fetch(pd.Series(new_hashes[missing])).to_numpy()
+            added = index.add_texts(np.asarray(new_hashes, dtype="int64"), texts.astype(str).tolist(), batch_texts)
+            sp.rows_out = added
+
+        with span("replace_docs", rows_in=len(docs)):
+            index.replace_docs(docs, prs)
+
+        compacted = index.segments() > max_segments
+        if compacted:
+            with span("compact"):
+                index.compact()
+        n_texts = len(index.text_ids())
+        n_segments = index.segments()
+    finally:
+        index.close()
+
+    print("✅ Wrote:", path)
+    print(f"Documents: {len(docs)} ({len(c_docs)} comments, {len(p_docs)} PR titles/bodies) -> {n_texts} distinct texts")
+    print(f"Newly indexed texts: {added}  segments: {n_segments}{' (compacted)' if compacted else ''}")
+
+
+if __name__ == "__main__":
+    main()
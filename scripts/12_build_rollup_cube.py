@@ -0,0 +1,67 @@
+import os
+import pandas as pd
+from derived_io import derived_path, export_csv, read_derived, write_derived
+from instrument import instrumented, record_frame, span
+from rollup_cube import DIMS, FLAGS, MEASURES, build_cube, rollup
+from task_type_rules import infer_task_types
+from utils_config import load_config
+
+PR_NAME = "aidev_pop_ge500_agent_prs"
+FEATURES_NAME = "aidev_pop_ge500_pr_features"
+CUBE_NAME = "aidev_rollup_cube"
+SKETCH_NAME = "aidev_rollup_sketches"
+
+
+def load_prs(cfg: dict) -> pd.DataFrame:
+    """One row per PR: DIMS plus the commit features (NaN without commit details)."""
+    with span("load") as sp:
+        prs = read_derived(cfg, PR_NAME, columns=["pr_key", "created_at", "agent_type", "pr_outcome", "title"])
+        feat = read_derived(cfg, FEATURES_NAME, columns=["pr_key"] + MEASURES + list(FLAGS))
+        sp.rows_out = len(prs) + len(feat)
+    created = pd.to_datetime(prs["created_at"], errors="coerce", utc=True)
+    # Year-month as in PR_Commit_details.ipynb ('2024-12')
+    prs["month"] = (created.dt.year.astype("Int64").astype("string") + "-"
+                    + created.dt.month.astype("Int64").astype("string").str.zfill(2))
+    # Same rule as step 02, applied to every PR (as in step 11)
+    prs["task_type"] = infer_task_types(prs["title"]) if "title" in prs.columns else "unknown"
+    return prs.merge(feat, on="pr_key", how="left")[DIMS + MEASURES + list(FLAGS)]
+
+
+@instrumented("12")
+def main():
+    cfg = load_config()
+    opts = cfg.get("rollup_cube") or {}
+    accuracy = float(opts.get("sketch_accuracy", 0.01))
+    if not 0 < accuracy < 1:
+        raise ValueError(f"rollup_cube.sketch_accuracy must be in (0, 1), got {accuracy}")
+
+    for name, step in [(PR_NAME, "01"), (FEATURES_NAME, "04")]:
+        path = derived_path(cfg, name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Missing {path}. Run script {step} first.")
+
+    print("=== Build monthly rollup cube (month x agent_type x task_type x pr_outcome) ===")
+    df = load_prs(cfg)
+    record_frame("prs", df)
+
+    with span("aggregate", rows_in=len(df)) as sp:
+        cube, sketches = build_cube(df, accuracy)
+        sp.rows_out = len(cube) + len(sketches)
+
+    with span("write", rows_in=len(cube) + len(sketches)):
+        written = []
+        for name, frame in [(CUBE_NAME, cube), (SKETCH_NAME, sketches)]:
+            out_path = write_derived(frame, cfg, name)
+            csv_path = export_csv(frame, cfg, name)
+            written += [out_path] + ([csv_path] if csv_path and csv_path != out_path else [])
+
+    for path in written:
+        print("✅ Wrote:", path)
+
+    print(f"PRs: {len(df)}  cells: {len(cube)}  sketch buckets: {len(sketches)}  (quantile accuracy {accuracy:g})")
+    closed = rollup(cube, ["pr_outcome"], sketches, where={"pr_outcome": ["MERGED", "REJECTED"]})
+    print(closed.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
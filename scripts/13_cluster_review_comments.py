@@ -0,0 +1,135 @@
+import os
+import numpy as np
+import pandas as pd
+from derived_io import derived_path, export_csv, read_derived, write_derived
+from instrument import instrumented, record_frame, span
+from near_duplicates import cluster_texts
+from text_index import hash_texts
+from text_store import TextStore, store_path
+from utils_config import load_config
+
+COMMENTS_NAME = "aidev_pop_ge500_pr_review_comments_with_task_type"
+CLUSTERS_NAME = "aidev_pop_ge500_review_comment_clusters"
+SUMMARY_NAME = "aidev_pop_ge500_review_comment_cluster_summary"
+
+
+def load_comments(cfg: dict) -> tuple:
+    """(comments with a text hash column, distinct texts indexed by hash)."""
+    comments = read_derived(cfg, COMMENTS_NAME,
+                            columns=["id", "pr_key", "created_at_comment", "body_comment_ref", "body_comment"])
+    if "id" not in comments.columns:
+        raise ValueError(f"Comments dataset missing id. Columns: {list(comments.columns)}")
+    if "body_comment_ref" in comments.columns:
+        comments["hash"] = comments["body_comment_ref"].fillna(0).astype("int64")
+        refs = pd.Series(pd.unique(comments.loc[comments["hash"] != 0, "hash"].to_numpy()))
+        texts = pd.Series(TextStore(store_path(cfg)).fetch(refs).to_numpy(), index=refs.to_numpy())
+        return comments.drop(columns=["body_comment_ref"]), texts
+    if "body_comment" not in comments.columns:
+        raise ValueError(f"Comments dataset missing body_comment. Columns: {list(comments.columns)}")
+    comments["hash"] = hash_texts(comments["body_comment"])
+    first = comments.loc[comments["hash"] != 0].drop_duplicates("hash")
+    texts = pd.Series(first["body_comment"].to_numpy(), index=first["hash"].to_numpy())
+    return comments.drop(columns=["body_comment"]), texts
+
+
+def assign_clusters(comments: pd.DataFrame, texts: pd.Series, labels: np.ndarray) -> pd.DataFrame:
+    """
+    One row per comment: comment_cluster_id (0 = largest cluster), canonical_id
+    (earliest comment with the cluster's most frequent text), is_canonical, cluster_size.
+    Comments without text are singletons.
+    """
+    text_cluster = pd.Series(texts.index[labels], index=texts.index)  # hash -> hash of the cluster label
+    df = comments[["id", "pr_key", "created_at_comment", "hash"]].copy()
+    df["cluster"] = df["hash"].map(text_cluster)
+    no_text = df["cluster"].isna()
+    df.loc[no_text, "cluster"] = -df.loc[no_text, "id"]  # own singleton key (ids are positive)
+    df["cluster"] = df["cluster"].astype("int64")
+
+    # Canonical text: the most frequent text of the cluster; canonical comment: its earliest use
+    df["text_rows"] = df.groupby("hash")["id"].transform("size")
+    order = df.sort_values(["cluster", "text_rows", "created_at_comment", "id"],
+                           ascending=[True, False, True, True], kind="stable")
+    canonical = order.drop_duplicates("cluster").set_index("cluster")["id"]
+    df["canonical_id"] = df["cluster"].map(canonical)
+    df["is_canonical"] = df["id"] == df["canonical_id"]
+    df["cluster_size"] = df.groupby("cluster")["id"].transform("size")
+
+    # Dense ids, largest clusters first (ties by canonical id)
+    ranked = df.drop_duplicates("cluster").sort_values(["cluster_size", "canonical_id"], ascending=[False, True])
+    df["comment_cluster_id"] = df["cluster"].map(pd.Series(np.arange(len(ranked)), index=ranked["cluster"]))
+    return df
+
+
+def cluster_summary(df: pd.DataFrame, texts: pd.Series, prefix: int = 120) -> pd.DataFrame:
+    """Clusters with more than one comment, with a prefix of the canonical text."""
+    multi = df[df["cluster_size"] > 1]
+    summary = multi.groupby("comment_cluster_id").agg(
+        n_comments=("id", "size"), n_prs=("pr_key", "nunique"), n_texts=("hash", "nunique"),
+        canonical_id=("canonical_id", "first"),
+        first_at=("created_at_comment", "min"), last_at=("created_at_comment", "max"),
+    ).reset_index()
+    canon_hash = multi.loc[multi["is_canonical"]].set_index("comment_cluster_id")["hash"]
+    canon_text = texts.reindex(canon_hash.reindex(summary["comment_cluster_id"]).to_numpy())
+    canon_text = canon_text.fillna("").str.slice(0, prefix).str.replace(r"\s+", " ", regex=True)
+    summary["canonical_text"] = canon_text.to_numpy()
+    return summary
+
+
+@instrumented("13")
+def main():
+    cfg = load_config()
+    opts = cfg.get("comment_clusters") or {}
+    params = {
+        "shingle_size": max(1, int(opts.get("shingle_size", 5))),
+        "num_perm": int(opts.get("num_perm", 128)),
+        "bands": int(opts.get("bands", 16)),
+        "threshold": float(opts.get("threshold", 0.8)),
+        "batch_texts": max(1, int(opts.get("batch_texts", 20000))),
+        "seed": int(opts.get("seed", cfg.get("seed", 42))),
+    }
+
+    in_path = derived_path(cfg, COMMENTS_NAME)
+    if not os.path.exists(in_path):
+        raise FileNotFoundError(f"Missing {in_path}. Run script 02 first.")
+
+    print("=== Cluster near-duplicate review comments (MinHash + LSH) ===")
+    with span("load") as sp:
+        comments, texts = load_comments(cfg)
+        sp.rows_out = len(comments)
+    record_frame("comments", comments)
+
+    with span("minhash_lsh", rows_in=len(texts)) as sp:
+        labels = cluster_texts(texts, **params)
+        sp.rows_out = len(np.unique(labels))
+
+    with span("assign", rows_in=len(comments)) as sp:
+        df = assign_clusters(comments, texts, labels)
+        summary = cluster_summary(df, texts)
+        sp.rows_out = len(df)
+
+    out = df[["id", "pr_key", "comment_cluster_id", "canonical_id", "is_canonical", "cluster_size"]]
+    with span("write", rows_in=len(out) + len(summary)):
+        written = []
+        for name, frame in [(CLUSTERS_NAME, out), (SUMMARY_NAME, summary)]:
+            out_path = write_derived(frame, cfg, name)
+            csv_path = export_csv(frame, cfg, name)
+            written += [out_path] + ([csv_path] if csv_path and csv_path != out_path else [])
+
+    for path in written:
+        print("✅ Wrote:", path)
+
+    n_clusters = int(df["comment_cluster_id"].nunique())
+    collapsed = len(df) - n_clusters
+    print(f"Comments: {len(df)}  distinct texts: {len(texts)}  clusters: {n_clusters}  "
+          f"(shingles {params['shingle_size']}, {params['num_perm']} permutations, {params['bands']} bands, "
+          f"threshold {params['threshold']:g})")
+    print(f"Rows collapsed into a canonical comment: {collapsed} ({collapsed / max(len(df), 1) * 100:.1f}%), "
+          f"in {len(summary)} clusters of 2+ comments")
+    if len(summary):
+        print("Largest clusters:")
+        print(summary.head(10)[["comment_cluster_id", "n_comments", "n_prs", "n_texts", "canonical_text"]]
+              .to_string(index=False, max_colwidth=70))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Scaling benchmark for the pipeline steps.
+
+For each --scales value, synthetic AIDev-shaped tables are generated once
+(make_synthetic_aidev.py, kept under data/bench/scale_<s>/aidev) and every
+non-optional step in run_pipeline.STAGES is run against them in a fresh work
+directory, each as its own process. Per step we record wall time, peak RSS,
+rows read (raw tables + upstream artifacts) and rows/sec.
+
+Results go to outputs/benchmarks/bench_<timestamp>.json and are compared with
+outputs/benchmarks/baseline.json; steps that got slower or bigger than the
+baseline by more than --tolerance are reported as regressions. A step that
+fails or never runs (because an upstream step failed) makes the benchmark
+exit with status 1, and such a run is never saved as the baseline.
+
+Usage:
+    python scripts/benchmark_pipeline.py --scales 1 10 100
+    python scripts/benchmark_pipeline.py --scales 0.1 --save-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+import pyarrow.parquet as pq
+import yaml
+
+from hf_cache import ParquetCache
+from make_synthetic_aidev import generate
+from partitioned_io import MANIFEST
+from run_pipeline import STAGES, artifact_path, topo_order
+from utils_config import load_config
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join("data", "bench")
+RESULTS_DIR = os.path.join("outputs", "benchmarks")
+BASELINE = "baseline.json"
+MIN_WALL_S = 1.0  # shorter steps are too noisy to call regressions
+
+
+def scale_label(scale: float) -> str:
+    return f"{scale:g}"
+
+
+def parquet_rows(path: str):
+    if path and os.path.exists(os.path.join(path, MANIFEST)):  # partitioned dataset
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            return sum(p["rows"] for p in json.load(f)["partitions"].values())
+    if path and os.path.exists(path) and path.endswith(".parquet"):
+        return pq.read_metadata(path).num_rows
+    return None
+
+
+def prepare_workdir(cfg: dict, scale: float, seed: int) -> tuple:
+    """Generate tables (once per scale) and write a config pointing at them."""
+    root = os.path.abspath(os.path.join(BENCH_DIR, f"scale_{scale_label(scale)}"))
+    data_dir = os.path.join(root, "aidev")
+    marker = os.path.join(data_dir, "_rows.json")
+    if not os.path.exists(marker):
+        print(f"Generating synthetic tables at scale {scale_label(scale)} -> {data_dir}")
+        rows = generate(data_dir, scale, seed=seed)
+        with open(marker, "w", encoding="utf-8") as f:
+            json.dump(rows, f)
+
+    bench_cfg = json.loads(json.dumps(cfg))  # deep copy
+    bench_cfg["aidev_hf_dataset"] = data_dir
+    bench_cfg.setdefault("cache", {})["offline"] = False
+    os.makedirs(os.path.join(root, "config"), exist_ok=True)
+    with open(os.path.join(root, "config", "config.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(bench_cfg, f, sort_keys=False)
+
+    # Fresh derived outputs; the raw table cache is warmed so copies are not timed
+    shutil.rmtree(os.path.join(root, bench_cfg["paths"]["derived_dir"]), ignore_errors=True)
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        cache = ParquetCache.from_config(bench_cfg)
+        for table in bench_cfg["tables"].values():
+            if os.path.exists(os.path.join(data_dir, table)):
+                cache.path_for(data_dir, table)
+    finally:
+        os.chdir(cwd)
+    return root, bench_cfg
+
+
+def _tree_hwm(pid: int) -> int:
+    """Sum of VmHWM (peak RSS) over a process and its children, from /proc (Linux)."""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    total += int(line.split()[1]) * 1024
+                    break
+        with open(f"/proc/{pid}/task/{pid}/children", encoding="utf-8") as f:
+            children = [int(c) for c in f.read().split()]
+    except (OSError, ValueError):
+        return total
+    return total + sum(_tree_hwm(c) for c in children)
+
+
+def run_measured(cmd: list, cwd: str, log_path: str, poll_s: float = 0.05) -> dict:
+    """
+    Run one step in a child process and measure wall time and peak RSS.
+
+    On Linux the peak is polled from /proc (VmHWM of the step and any worker
+    processes it starts): rusage cannot be used because ru_maxrss is inherited
+    from this (much larger) parent process. Elsewhere the rusage value of the
+    child is reported, which is an upper bound.
+    """
+    with open(log_path, "w", encoding="utf-8") as log:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+        peak = None
+        if os.path.exists(f"/proc/{proc.pid}/status"):
+            peak = 0
+            while proc.poll() is None:
+                peak = max(peak, _tree_hwm(proc.pid))
+                time.sleep(poll_s)
+        elif hasattr(os, "wait4"):
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is KiB on Linux, bytes on macOS
+            peak = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        else:
+            proc.wait()
+        wall = time.perf_counter() - t0
+    return {"returncode": proc.returncode, "wall_s": round(wall, 3),
+            "peak_rss_mb": round(peak / 2**20, 1) if peak else None}
+
+
+def bench_scale(cfg: dict, scale: float, seed: int) -> dict:
+    root, bench_cfg = prepare_workdir(cfg, scale, seed)
+    log_dir = os.path.join(root, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    cwd = os.getcwd()
+    os.chdir(root)  # artifact paths are relative to the work dir
+    try:
+        results = {}
+        for name in topo_order():
+            st = STAGES[name]
+            if st.get("optional"):
+                continue
+            table_rows = [parquet_rows(os.path.join(bench_cfg["aidev_hf_dataset"], bench_cfg["tables"][t]))
+                          for t in st["tables"]]
+            cmd = [sys.executable, os.path.join(SCRIPTS_DIR, st["script"])] + st.get("args", [])
+            print(f"[{scale_label(scale)}x] {name} ...", end=" ", flush=True)
+            res = run_measured(cmd, root, os.path.join(log_dir, f"{name}.log"))
+            input_rows = [parquet_rows(artifact_path(bench_cfg, i)) for i in st["inputs"]]
+
+            rows_in = sum(r for r in table_rows + input_rows if r)
+            res["rows_in"] = rows_in
+            res["rows_out"] = sum(r for r in (parquet_rows(artifact_path(bench_cfg, o)) for o in st["outputs"]) if r)
+            res["rows_per_s"] = round(rows_in / res["wall_s"], 1) if res["wall_s"] > 0 else None
+            results[name] = res
+            print(f"{res['wall_s']:.2f}s  {res['peak_rss_mb']} MB  {res['rows_per_s']} rows/s")
+            if res["returncode"] != 0:
+                print(f"  failed; see {os.path.join(log_dir, name + '.log')}")
+                break
+    finally:
+        os.chdir(cwd)
+    with open(os.path.join(root, "aidev", "_rows.json"), encoding="utf-8") as f:
+        return {"tables": json.load(f), "steps": results}
+
+
+def incomplete_steps(report: dict) -> list:
+    """Non-optional steps that failed or did not run, per scale."""
+    expected = [n for n in topo_order() if not STAGES[n].get("optional")]
+    missing = []
+    for scale, run in report["scales"].items():
+        for name in expected:
+            res = run["steps"].get(name)
+            if res is None:
+                missing.append(f"{scale}x step {name}: not run")
+            elif res["returncode"] != 0:
+                missing.append(f"{scale}x step {name}: exit status {res['returncode']}")
+    return missing
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for scale, run in current["scales"].items():
+        base_steps = baseline.get("scales", {}).get(scale, {}).get("steps", {})
+        for step, res in run["steps"].items():
+            base = base_steps.get(step)
+            if not base:
+                continue
+            for metric in ["wall_s", "peak_rss_mb"]:
+                new, old = res.get(metric), base.get(metric)
+                if not new or not old or (metric == "wall_s" and new < MIN_WALL_S):
+                    continue
+                if new > old * (1 + tolerance):
+                    regressions.append(f"{scale}x step {step}: {metric} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark pipeline steps on synthetic AIDev-shaped data.")
+    ap.add_argument("--scales", type=float, nargs="+", default=[1.0, 10.0, 100.0])
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline.")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown/growth vs baseline (0.25 = 25%%).")
+    ap.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if a regression is found.")
+    args = ap.parse_args()
+
+    cfg = load_config()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+
+    print("=== Pipeline scaling benchmark ===")
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "scales": {scale_label(s): bench_scale(cfg, s, args.seed) for s in args.scales},
+    }
+
+    out_path = os.path.join(RESULTS_DIR, f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print("✅ Wrote:", out_path)
+
+    failed = incomplete_steps(report)
+    if failed:
+        print(f"❌ Steps that did not finish ({len(failed)}):")
+        for f in failed:
+            print("  " + f)
+
+    baseline_path = os.path.join(RESULTS_DIR, BASELINE)
+    regressions = []
+    if os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        print(f"Regressions vs baseline ({len(regressions)}):" if regressions else "No regressions vs baseline.")
+        for r in regressions:
+            print("  " + r)
+    if not failed and (args.save_baseline or not os.path.exists(baseline_path)):
+        shutil.copyfile(out_path, baseline_path)
+        print("✅ Saved baseline:", baseline_path)
+
+    if failed or (regressions and args.fail_on_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Check that `backend.engine: duckdb` produces the same outputs as the pandas
+path for steps 01-03.
+
+Each engine runs the steps in its own work directory under data/parity/<engine>.
+Both share the raw table cache, and each starts from an empty derived dir.
+Every output, including the key index, is read back as the pipeline reads it
+(derived_io dtype policy) and compared with pandas.testing.assert_frame_equal
+(values, dtypes, column and row order).
+Exits with status 1 on any difference.
+
+Usage:
+    python scripts/check_backend_parity.py
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pandas as pd
+import yaml
+
+from derived_io import apply_dtypes
+from run_pipeline import STAGES, artifact_path
+from utils_config import load_config
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PARITY_DIR = os.path.join("data", "parity")
+STEPS = ["01", "02", "03"]
+ENGINES = ["pandas", "duckdb"]
+
+
+def prepare_workdir(cfg: dict, engine: str) -> tuple:
+    root = os.path.abspath(os.path.join(PARITY_DIR, engine))
+    run_cfg = json.loads(json.dumps(cfg))  # deep copy
+    run_cfg.setdefault("backend", {})["engine"] = engine
+    if os.path.isdir(run_cfg["aidev_hf_dataset"]):
+        run_cfg["aidev_hf_dataset"] = os.path.abspath(run_cfg["aidev_hf_dataset"])
+    paths = run_cfg["paths"]
+    paths["raw_dir"] = os.path.abspath(paths["raw_dir"])  # shared table cache
+    paths["derived_dir"] = os.path.join(root, "derived")
+    paths["outputs_dir"] = os.path.join(root, "outputs")
+    run_cfg.setdefault("instrumentation", {})["report_dir"] = os.path.join(root, "run_reports")
+    if run_cfg["backend"].get("temp_dir"):
+        run_cfg["backend"]["temp_dir"] = os.path.abspath(run_cfg["backend"]["temp_dir"])
+
+    shutil.rmtree(paths["derived_dir"], ignore_errors=True)
+    os.makedirs(os.path.join(root, "config"), exist_ok=True)
+    with open(os.path.join(root, "config", "config.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(run_cfg, f, sort_keys=False)
+    return root, run_cfg
+
+
+def run_steps(root: str, engine: str) -> bool:
+    os.makedirs(os.path.join(root, "logs"), exist_ok=True)
+    for name in STEPS:
+        log_path = os.path.join(root, "logs", f"{name}.log")
+        print(f"[{engine}] {name} ...", end=" ", flush=True)
+        with open(log_path, "w", encoding="utf-8") as log:
+            cmd = [sys.executable, os.path.join(SCRIPTS_DIR, STAGES[name]["script"])] + STAGES[name].get("args", [])
+            rc = subprocess.run(cmd, cwd=root, stdout=log, stderr=subprocess.STDOUT).returncode
+        print("ok" if rc == 0 else f"failed; see {log_path}")
+        if rc != 0:
+            return False
+    return True
+
+
+def compare(cfgs: dict) -> list:
+    diffs = []
+    for name in STEPS:
+        for out in STAGES[name]["outputs"]:
+            frames = [apply_dtypes(pd.read_parquet(artifact_path(cfgs[e], out))) for e in ENGINES]
+            try:
+                pd.testing.assert_frame_equal(frames[0], frames[1], check_exact=True)
+                print(f"  {out}: identical ({len(frames[0])} rows)")
+            except AssertionError as e:
+                diffs.append(out)
+                print(f"  {out}: DIFFERENT\n    " + str(e).replace("\n", "\n    "))
+    return diffs
+
+
+def main():
+    cfg = load_config()
+    print("=== Backend parity check (steps 01-03) ===")
+    cfgs = {}
+    for engine in ENGINES:
+        root, cfgs[engine] = prepare_workdir(cfg, engine)
+        if not run_steps(root, engine):
+            sys.exit(1)
+
+    print("Comparing outputs:")
+    diffs = compare(cfgs)
+    if diffs:
+        print(f"❌ {len(diffs)} output(s) differ between pandas and duckdb.")
+        sys.exit(1)
+    print("✅ duckdb outputs match pandas.")
+
+
+if __name__ == "__main__":
+    main()
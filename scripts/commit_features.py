@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+COMMIT_COLS = ["pr_id", "sha", "filename", "additions", "deletions", "changes"]
+
+# Filename patterns from PR_Commit_details.ipynb (case-insensitive substring match)
+TEST_PATTERN = r"test"
+DOC_PATTERN = r"docs|readme|\.md"
+
+
+def file_flags(filenames: pd.Series) -> pd.DataFrame:
+    """
+    is_test / is_doc per row. Each distinct filename is matched once; commits
+    touching the same file many times share the result.
+    """
+    codes, uniques = pd.factorize(filenames)
+    uniq = pd.Series(np.asarray(uniques, dtype=object), dtype=object)
+    flags = {}
+    for name, pat in [("is_test", TEST_PATTERN), ("is_doc", DOC_PATTERN)]:
+        hit = uniq.str.contains(pat, case=False, regex=True, na=False).to_numpy(dtype=bool)
+        flags[name] = np.where(codes >= 0, hit[codes] if len(hit) else False, False)
+    return pd.DataFrame(flags, index=filenames.index)
+
+
+def aggregate_commits(commits: pd.DataFrame) -> pd.DataFrame:
+    """One row per pr_id with the commit features used in the notebooks."""
+    commits = commits.join(file_flags(commits["filename"]))
+    agg = (
+        commits
+        .groupby("pr_id", sort=True)
+        .agg(
+            n_commits       = ("sha", "nunique"),
+            n_files         = ("filename", "nunique"),
+            total_additions = ("additions", "sum"),
+            total_deletions = ("deletions", "sum"),
+            total_changes   = ("changes", "sum"),
+            n_test_files    = ("is_test", "sum"),
+            n_doc_files     = ("is_doc", "sum"),
+        )
+        .reset_index()
+    )
+    agg["touched_tests"] = (agg["n_test_files"] > 0).astype("int64")
+    agg["touched_docs"] = (agg["n_doc_files"] > 0).astype("int64")
+    return agg
+
+
+def aggregate_shard(path: str, pr_ids: list) -> pd.DataFrame:
+    """
+    Read and aggregate the commits of one pr_id range. The range bounds let
+    Parquet skip row groups by statistics; the `in` filter drops other PRs.
+    Module-level so it can be sent to a process pool.
+    """
+    filters = [("pr_id", ">=", pr_ids[0]), ("pr_id", "<=", pr_ids[-1]), ("pr_id", "in", pr_ids)]
+    commits = pd.read_parquet(path, columns=COMMIT_COLS, filters=filters)
+    return aggregate_commits(commits)
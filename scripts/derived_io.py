@@ -0,0 +1,309 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from partitioned_io import SPECS as PARTITIONED_SPECS, PartitionedDataset, PartitionedWriter
+
+# Dtype policy for intermediate datasets (applied on write and on every read)
+INT_KEY_COLS = ["id_pr", "pr_id", "repo_id"]                # GitHub ids: int64
+SMALL_INT_COLS = ["pr_key", "repo_key", "number", "stars"]  # int32 while the values fit
+CATEGORICAL_COLS = ["agent_type", "agent", "pr_outcome", "state", "task_type", "task_type_majority", "full_name"]
+TIMESTAMP_RE = re.compile(r".*_at(_comment|_pr|_repo)?|final_comment_time")
+INT32_MAX = np.iinfo("int32").max
+
+
+def _text_dtype():
+    # Arrow-backed strings with NaN as missing value (pandas' default "str" from 3.0)
+    try:
+        return pd.StringDtype("pyarrow", na_value=np.nan)
+    except TypeError:  # pandas < 2.3
+        return pd.StringDtype("pyarrow_numpy")
+
+
+TEXT_DTYPE = _text_dtype()
+
+DEFAULT_FORMAT = "parquet"
+DEFAULT_LAYOUT = "flat"
+DEFAULT_COMPRESSION = "zstd"
+DEFAULT_ROW_GROUP_SIZE = 131_072
+
+# In-process handoff used by run_pipeline.py: path -> DataFrame last written there
+_MEMORY = None
+
+
+def enable_memory_handoff() -> None:
+    """Keep written intermediates in memory so later steps in the same process skip the disk read."""
+    global _MEMORY
+    if _MEMORY is None:
+        _MEMORY = {}
+
+
+def _settings(cfg: dict) -> dict:
+    s = cfg.get("intermediates") or {}
+    fmt = str(s.get("format", DEFAULT_FORMAT)).lower()
+    if fmt not in ("parquet", "csv"):
+        raise ValueError(f"intermediates.format must be 'parquet' or 'csv', got {fmt!r}")
+    layout = str(s.get("layout", DEFAULT_LAYOUT)).lower()
+    if layout not in ("flat", "partitioned"):
+        raise ValueError(f"intermediates.layout must be 'flat' or 'partitioned', got {layout!r}")
+    if layout == "partitioned" and fmt != "parquet":
+        raise ValueError("intermediates.layout 'partitioned' needs intermediates.format: parquet")
+    return {
+        "format": fmt,
+        "layout": layout,
+        "incremental": bool(s.get("incremental", True)),
+        "compression": s.get("compression", DEFAULT_COMPRESSION),
+        "row_group_size": int(s.get("row_group_size") or DEFAULT_ROW_GROUP_SIZE),
+        "export_csv": bool(s.get("export_csv", True)),
+    }
+
+
+def partitioned_dataset(cfg: dict, name: str):
+    """The PartitionedDataset for `name` under `intermediates.layout: partitioned`, else None."""
+    s = _settings(cfg)
+    if s["layout"] != "partitioned" or name not in PARTITIONED_SPECS:
+        return None
+    return PartitionedDataset(os.path.join(cfg["paths"]["derived_dir"], name), PARTITIONED_SPECS[name],
+                              compression=s["compression"], row_group_size=s["row_group_size"])
+
+
+def incremental(cfg: dict) -> bool:
+    """Whether steps 01/02 may update existing partitioned datasets instead of rebuilding them."""
+    s = _settings(cfg)
+    return s["layout"] == "partitioned" and s["incremental"]
+
+
+def derived_path(cfg: dict, name: str) -> str:
+    """Path of intermediate dataset `name` (no extension) in the configured format and layout."""
+    if partitioned_dataset(cfg, name) is not None:
+        return os.path.join(cfg["paths"]["derived_dir"], name)  # directory
+    ext = "parquet" if _settings(cfg)["format"] == "parquet" else "csv"
+    return os.path.join(cfg["paths"]["derived_dir"], f"{name}.{ext}")
+
+
+def _int_column(s: pd.Series, bits: int) -> pd.Series:
+    if not pd.api.types.is_integer_dtype(s):
+        s = pd.to_numeric(s, errors="coerce")
+    if bits == 32 and s.notna().any() and not (-INT32_MAX <= s.min() and s.max() <= INT32_MAX):
+        bits = 64
+    return s.astype(f"int{bits}") if s.notna().all() else s.astype(f"Int{bits}")
+
+
+def _categorical_column(s: pd.Series) -> pd.Series:
+    # Categories are the sorted observed values, whatever batch or engine wrote the file
+    if not isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype("category")
+    s = s.cat.remove_unused_categories()
+    if not s.cat.categories.is_monotonic_increasing:
+        try:
+            s = s.cat.reorder_categories(sorted(s.cat.categories))
+        except TypeError:  # mixed category types
+            pass
+    return s
+
+
+def apply_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compact dtypes: int64 ids, int32 keys/counts, UTC timestamps, categorical
+    labels and Arrow-backed text. Modifies and returns df.
+    """
+    refs = [c for c in df.columns if c.endswith("_ref")]  # text store references (text_store.py)
+    for c in INT_KEY_COLS + SMALL_INT_COLS + refs:
+        if c in df.columns:
+            df[c] = _int_column(df[c], 32 if c in SMALL_INT_COLS else 64)
+    for c in df.columns:
+        if TIMESTAMP_RE.fullmatch(c) and (df[c].dtype == object or pd.api.types.is_datetime64_any_dtype(df[c])
+                                          or pd.api.types.is_string_dtype(df[c])):
+            df[c] = pd.to_datetime(df[c], errors="coerce", utc=True)
+    for c in CATEGORICAL_COLS:
+        if c in df.columns:
+            df[c] = _categorical_column(df[c])
+    for c in df.columns:
+        s = df[c]
+        if s.dtype == object and pd.api.types.infer_dtype(s, skipna=True) in ("string", "empty"):
+            df[c] = s.astype(TEXT_DTYPE)
+        elif isinstance(s.dtype, pd.StringDtype) and s.dtype != TEXT_DTYPE:
+            df[c] = s.astype(TEXT_DTYPE)
+    return df
+
+
+def write_derived(df: pd.DataFrame, cfg: dict, name: str) -> str:
+    s = _settings(cfg)
+    path = derived_path(cfg, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df = apply_dtypes(df.copy())
+    parts = partitioned_dataset(cfg, name)
+    if parts is not None:
+        parts.write(df)
+    elif s["format"] == "parquet":
+        df.to_parquet(path, index=False, compression=s["compression"], row_group_size=s["row_group_size"])
+    else:
+        df.to_csv(path, index=False)
+    if _MEMORY is not None:
+        # Partitioned datasets are read back in partition order, so they are not handed over
+        if parts is None:
+            _MEMORY[path] = df.reset_index(drop=True)
+        else:
+            _MEMORY.pop(path, None)
+    return path
+
+
+def upsert_derived(df: pd.DataFrame, cfg: dict, name: str, delete=()) -> dict:
+    """
+    Insert or replace the rows of df (matched on the dataset key) in partitioned
+    dataset `name` and delete the keys in `delete`, rewriting only the partitions
+    involved. Returns the counts of PartitionedDataset.upsert.
+    """
+    parts = partitioned_dataset(cfg, name)
+    if parts is None:
+        raise ValueError(f"{name} is not a partitioned dataset (intermediates.layout: partitioned).")
+    stats = parts.upsert(apply_dtypes(df.copy()), delete=delete)
+    if _MEMORY is not None:
+        _MEMORY.pop(parts.path, None)
+    return stats
+
+
+def _filter_frame(df: pd.DataFrame, filters) -> pd.DataFrame:
+    """Apply pyarrow-style `filters` ([(col, op, value), ...], or a list of such lists for OR) to df."""
+    import pyarrow as pa
+    import pyarrow.dataset as pads
+    import pyarrow.parquet as pq
+
+    groups = filters if isinstance(filters[0], list) else [filters]
+    cols = sorted({f[0] for group in groups for f in group})
+    table = pa.Table.from_pandas(df[cols], preserve_index=False).append_column("__row", pa.array(np.arange(len(df))))
+    rows = pads.dataset(table).to_table(columns=["__row"], filter=pq.filters_to_expression(filters))
+    return df.iloc[np.sort(rows.column("__row").to_numpy())]
+
+
+def read_derived(cfg: dict, name: str, columns=None, filters=None) -> pd.DataFrame:
+    """
+    Read intermediate dataset `name`, optionally only `columns` (missing ones are
+    ignored) and rows matching pyarrow-style `filters` (pushed down into the
+    Parquet scan), with the dtype policy applied.
+    """
+    path = derived_path(cfg, name)
+    if columns is not None:
+        available = set(derived_columns(cfg, name))
+        columns = [c for c in columns if c in available]
+    if _MEMORY is not None and path in _MEMORY:
+        df = _MEMORY[path]
+        if filters:
+            df = _filter_frame(df, filters)
+        return apply_dtypes((df[columns] if columns is not None else df).reset_index(drop=True))
+    parts = partitioned_dataset(cfg, name)
+    if parts is not None:
+        return apply_dtypes(parts.read(columns=columns, filters=filters or None))
+    if path.endswith(".parquet"):
+        return apply_dtypes(pd.read_parquet(path, columns=columns, filters=filters or None))
+    # 64-bit text references would lose digits if parsed as float (columns with nulls)
+    refs = {c: "Int64" for c in derived_columns(cfg, name) if c.endswith("_ref")}
+    df = apply_dtypes(pd.read_csv(path, usecols=columns, dtype=refs, low_memory=False))
+    if filters:
+        df = apply_dtypes(_filter_frame(df, filters).reset_index(drop=True))
+    return df
+
+
+def derived_columns(cfg: dict, name: str) -> list:
+    """Column names of an intermediate dataset, read from the Parquet footer or CSV header."""
+    path = derived_path(cfg, name)
+    if _MEMORY is not None and path in _MEMORY:
+        return list(_MEMORY[path].columns)
+    parts = partitioned_dataset(cfg, name)
+    if parts is not None:
+        return parts.columns
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def export_csv(df: pd.DataFrame, cfg: dict, name: str):
+    """Write a CSV copy of a final artifact (e.g. the labeling sheet input) if enabled."""
+    s = _settings(cfg)
+    path = os.path.join(cfg["paths"]["derived_dir"], f"{name}.csv")
+    if s["format"] == "csv":
+        return path  # already written by write_derived
+    if not s["export_csv"]:
+        return None
+    df.to_csv(path, index=False)
+    return path
+
+
+class DerivedWriter:
+    """
+    Write an intermediate dataset incrementally, one DataFrame batch at a time,
+    so producers can stream without holding the whole table in memory.
+
+    Empty batches are accepted (the first one still fixes the columns). The
+    Parquet schema is fixed by the first batch. Columns that are entirely
+    null in that batch take their type from `fallback_schema` (a pyarrow schema
+    of the sources) or default to string.
+    """
+
+    def __init__(self, cfg: dict, name: str, fallback_schema=None):
+        self.settings = _settings(cfg)
+        self.path = derived_path(cfg, name)
+        self.tmp = self.path + ".tmp"
+        self.fallback_schema = fallback_schema
+        self.schema = None
+        self.writer = None
+        self.rows = 0
+        self.csv_started = False  # header written to self.tmp (CSV format)
+        # Partitioned layout: batches are split into per-partition files instead
+        parts = partitioned_dataset(cfg, name)
+        self.partitioned = PartitionedWriter(parts, fallback_schema) if parts is not None else None
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)  # left behind by a crashed run; must not be appended to
+        if _MEMORY is not None:
+            _MEMORY.pop(self.path, None)
+
+    def _resolve_schema(self, table):
+        import pyarrow as pa
+
+        fields = []
+        for field in table.schema:
+            if pa.types.is_null(field.type):
+                typ = pa.string()
+                if self.fallback_schema is not None and field.name in self.fallback_schema.names:
+                    typ = self.fallback_schema.field(field.name).type
+                field = field.with_type(typ)
+            elif pa.types.is_dictionary(field.type):
+                # Later batches may have more categories than fit the first batch's int8 codes
+                field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+            fields.append(field)
+        return pa.schema(fields, metadata=table.schema.metadata)
+
+    def write(self, df: pd.DataFrame) -> None:
+        df = apply_dtypes(df.copy())
+        if self.partitioned is not None:
+            self.partitioned.write(df)
+            self.rows += len(df)
+            return
+        if self.settings["format"] == "csv":
+            df.to_csv(self.tmp, index=False, mode="a" if self.csv_started else "w", header=not self.csv_started)
+            self.csv_started = True
+            self.rows += len(df)
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.schema is None:
+            self.schema = self._resolve_schema(pa.Table.from_pandas(df, preserve_index=False))
+            self.writer = pq.ParquetWriter(self.tmp, self.schema, compression=self.settings["compression"])
+        if len(df):
+            self.writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False),
+                                    row_group_size=self.settings["row_group_size"])
+            self.rows += len(df)
+
+    def close(self) -> str:
+        if self.partitioned is not None:
+            return self.partitioned.close()
+        if self.writer is not None:
+            self.writer.close()
+        if not os.path.exists(self.tmp):
+            raise ValueError(f"No batches were written to {self.path}.")
+        os.replace(self.tmp, self.path)
+        return self.path
@@ -0,0 +1,143 @@
+"""
+Logistic regression with repository fixed effects for high-cardinality repo_id.
+
+The design is [X | one-hot(repo)]: a few dense predictors (intercept first) and
+a repo block with exactly one nonzero per row. The repo block is kept sparse as
+its column indices (`groups`, the CSR indices of the one-hot matrix), never
+materialized. Its part of the Hessian is diagonal, so each Newton step
+eliminates the repo effects with a k x k Schur complement: O(n k^2) per
+iteration however many repos there are, instead of a dense one-hot pipeline.
+
+Objective (sklearn's LogisticRegression with penalty="l2"):
+
+    C * sum_i w_i * logloss_i + 0.5 * (||beta[1:]||^2 + ||alpha||^2)
+
+The intercept beta[0] is not penalized; C=None fits the unpenalized MLE
+(for the pooled model without repo effects).
+"""
+import numpy as np
+from scipy.special import expit, log_expit
+
+MAX_ITER = 100
+TOL = 1e-8
+
+
+def _objective(eta, y, w, lam, beta, alpha):
+    ll = np.dot(w, y * log_expit(eta) + (1 - y) * log_expit(-eta))
+    return -ll + 0.5 * lam * (np.dot(beta[1:], beta[1:]) + np.dot(alpha, alpha)), ll
+
+
+def fit_logit(X: np.ndarray, y: np.ndarray, groups=None, n_groups: int = 0, C=None, weights=None,
+              start=None, max_iter: int = MAX_ITER, tol: float = TOL) -> dict:
+    """
+    Newton's method with step halving. Returns beta (k,), alpha (n_groups,),
+    the log-likelihood and the iteration count. `start` = (beta, alpha) warm start.
+    """
+    n, k = X.shape
+    w = np.ones(n) if weights is None else np.asarray(weights, dtype=float)
+    lam = 0.0 if C is None else 1.0 / C
+    if groups is None:
+        groups, n_groups = np.zeros(n, dtype=np.int64), 0
+    elif lam == 0:
+        raise ValueError("Repo fixed effects need an L2 penalty (C); separated repos have no finite MLE.")
+    lam_b = np.full(k, lam)
+    lam_b[0] = 0.0
+
+    beta = np.zeros(k) if start is None else np.array(start[0], dtype=float)
+    alpha = np.zeros(n_groups) if start is None or n_groups == 0 else np.array(start[1], dtype=float)
+    eta = X @ beta + (alpha[groups] if n_groups else 0.0)
+    obj, ll = _objective(eta, y, w, lam, beta, alpha)
+
+    for it in range(1, max_iter + 1):
+        p = expit(eta)
+        r = w * (y - p)
+        h = w * p * (1 - p)
+        grad_b = X.T @ r - lam_b * beta
+        hess_b = (X * h[:, None]).T @ X + np.diag(lam_b)
+        if n_groups:
+            grad_a = np.bincount(groups, r, n_groups) - lam * alpha
+            diag_a = np.bincount(groups, h, n_groups) + lam
+            cross = np.stack([np.bincount(groups, h * X[:, j], n_groups) for j in range(k)])  # (k, n_groups)
+            scaled = cross / diag_a
+            step_b = np.linalg.solve(hess_b - scaled @ cross.T, grad_b - scaled @ grad_a)
+            step_a = (grad_a - cross.T @ step_b) / diag_a
+        else:
+            step_b = np.linalg.solve(hess_b, grad_b)
+            step_a = alpha
+
+        t = 1.0
+        while True:
+            new_b = beta + t * step_b
+            new_a = alpha + t * step_a if n_groups else alpha
+            new_eta = X @ new_b + (new_a[groups] if n_groups else 0.0)
+            new_obj, new_ll = _objective(new_eta, y, w, lam, new_b, new_a)
+            if new_obj <= obj + 1e-12 * abs(obj) or t < 1e-10:
+                break
+            t /= 2
+        done = t * max(np.abs(step_b).max(), np.abs(step_a).max() if n_groups else 0.0) < tol
+        beta, alpha, eta, obj, ll = new_b, new_a, new_eta, new_obj, new_ll
+        if done:
+            break
+    return {"beta": beta, "alpha": alpha, "loglik": ll, "n_iter": it}
+
+
+def wald_cov(X: np.ndarray, fit: dict, groups=None, n_groups: int = 0, C=None, weights=None) -> np.ndarray:
+    """
+    (k, k) covariance of beta: the inverse of the (penalized) information at the
+    fit, with the repo effects profiled out by the same Schur complement. For
+    C=None this is the usual Wald covariance of the MLE.
+    """
+    n, k = X.shape
+    w = np.ones(n) if weights is None else np.asarray(weights, dtype=float)
+    lam = 0.0 if C is None else 1.0 / C
+    lam_b = np.full(k, lam)
+    lam_b[0] = 0.0
+    eta = X @ fit["beta"] + (fit["alpha"][groups] if n_groups else 0.0)
+    p = expit(eta)
+    h = w * p * (1 - p)
+    info = (X * h[:, None]).T @ X + np.diag(lam_b)
+    if n_groups:
+        diag_a = np.bincount(groups, h, n_groups) + lam
+        cross = np.stack([np.bincount(groups, h * X[:, j], n_groups) for j in range(k)])
+        info = info - (cross / diag_a) @ cross.T
+    return np.linalg.inv(info)
+
+
+def null_loglik(y: np.ndarray) -> float:
+    """Log-likelihood of the intercept-only model (McFadden's pseudo-R^2 denominator)."""
+    m = y.mean()
+    return float(len(y) * (m * np.log(m) + (1 - m) * np.log(1 - m))) if 0 < m < 1 else 0.0
+
+
+# --- Repo-clustered bootstrap, run in a process pool ---
+
+_DATA = {}
+
+
+def init_bootstrap(data: dict) -> None:
+    """Process-pool initializer: the design is sent to each worker once, not per task."""
+    _DATA.clear()
+    _DATA.update(data)
+
+
+def bootstrap_chunk(seeds: list) -> np.ndarray:
+    """
+    Refit both models on repo-clustered bootstrap samples, one per seed: repos
+    are drawn with replacement and each row is weighted by how often its repo
+    was drawn (the same fit as stacking the copies). Returns an array of shape
+    (len(seeds), 2, k) holding the pooled and fixed-effects coefficients.
+    Module-level so it can be sent to a process pool.
+    """
+    X, y, groups, n_groups, C = _DATA["X"], _DATA["y"], _DATA["groups"], _DATA["n_groups"], _DATA["C"]
+    out = np.empty((len(seeds), 2, X.shape[1]))
+    for i, seed in enumerate(seeds):
+        rng = np.random.default_rng(seed)
+        draws = np.bincount(rng.integers(0, n_groups, n_groups), minlength=n_groups)
+        w = draws[groups]
+        keep = w > 0
+        Xs, ys, ws = X[keep], y[keep], w[keep]
+        kept, gs = np.unique(groups[keep], return_inverse=True)
+        pooled = fit_logit(Xs, ys, weights=ws, start=(_DATA["pooled"], None))
+        fe = fit_logit(Xs, ys, gs, len(kept), C=C, weights=ws, start=(_DATA["beta"], _DATA["alpha"][kept]))
+        out[i, 0], out[i, 1] = pooled["beta"], fe["beta"]
+    return out
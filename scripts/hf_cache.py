@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from range_fetch import SHA256_RE, RangeFetcher, head, hf_resolve_url
+
+INDEX_FILE = "index.json"
+BLOB_DIR = "blobs"
+DEFAULT_ENDPOINT = "https://huggingface.co"
+FOOTER_GUESS = 64 * 1024  # bytes fetched for a remote Parquet footer; larger footers take a second request
+
+
+class ParquetCache:
+    """
+    Persistent on-disk cache for Parquet tables from the AIDev dataset.
+
+    Layout under `root` (paths.raw_dir by default):
+        blobs/<file hash>.parquet   content-addressed table files
+        index.json                  (dataset, revision, table) -> blob, etag, size, last_used
+
+    Entries are validated against the remote ETag/size (one HEAD request, no
+    download). In offline mode the network is never touched and only indexed
+    entries are served. Least recently used blobs are evicted once the cache
+    grows beyond `max_bytes`.
+
+    Downloads go through `fetcher` (range_fetch.RangeFetcher: parallel byte
+    ranges, resume, checksum) from `endpoint`/datasets/<dataset>/resolve/...;
+    the endpoint can be any server with the same URL layout, e.g. a local one.
+    `prefetch` fetches several tables concurrently.
+
+    `dataset_path` may also be a local directory of Parquet files (a stand-in
+    for the Hugging Face dataset); its files are validated by size + mtime.
+    """
+
+    def __init__(self, root: str, max_bytes: int = None, offline: bool = False, revision: str = "main",
+                 endpoint: str = None, fetcher: RangeFetcher = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.revision = revision
+        self.endpoint = endpoint or os.environ.get("HF_ENDPOINT") or DEFAULT_ENDPOINT
+        self.fetcher = fetcher or RangeFetcher(token=os.environ.get("HF_TOKEN"))
+        self._lock = threading.Lock()
+        self._blob_locks = {}
+        os.makedirs(os.path.join(root, BLOB_DIR), exist_ok=True)
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "ParquetCache":
+        cache_cfg = cfg.get("cache") or {}
+        max_gb = cache_cfg.get("max_size_gb")
+        offline = bool(cache_cfg.get("offline", False))
+        if os.environ.get("AIDEV_OFFLINE", "").lower() in ("1", "true", "yes"):
+            offline = True
+        return cls(
+            root=cfg["paths"]["raw_dir"],
+            max_bytes=int(float(max_gb) * 1024 ** 3) if max_gb else None,
+            offline=offline,
+            revision=str(cache_cfg.get("revision", "main")),
+            endpoint=cache_cfg.get("endpoint"),
+            fetcher=RangeFetcher(
+                connections=int(cache_cfg.get("connections", 8)),
+                chunk_bytes=int(float(cache_cfg.get("chunk_mb", 64)) * 1024 ** 2),
+                max_retries=int(cache_cfg.get("max_retries", 5)),
+                token=os.environ.get("HF_TOKEN"),
+            ),
+        )
+
+    # ---------- index ----------
+
+    def _index_path(self) -> str:
+        return os.path.join(self.root, INDEX_FILE)
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self, index: dict) -> None:
+        tmp = self._index_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(tmp, self._index_path())
+
+    def _key(self, dataset_path: str, table_name: str) -> str:
+        return f"{dataset_path}@{self.revision}/{table_name}"
+
+    def _blob_path(self, file_hash: str) -> str:
+        return os.path.join(self.root, BLOB_DIR, f"{file_hash}.parquet")
+
+    # ---------- sources ----------
+
+    def _remote_metadata(self, dataset_path: str, table_name: str) -> dict:
+        if os.path.isdir(dataset_path):
+            st = os.stat(os.path.join(dataset_path, table_name))
+            stamp = f"{os.path.abspath(dataset_path)}/{table_name}:{st.st_size}:{st.st_mtime_ns}"
+            return {
+                "etag": hashlib.sha256(stamp.encode("utf-8")).hexdigest(),
+                "size": st.st_size,
+                "commit": "local",
+            }
+
+        url = hf_resolve_url(self.endpoint, dataset_path, table_name, self.revision)
+        meta = head(url, token=self.fetcher.token, max_retries=self.fetcher.max_retries)
+        return {"etag": meta["etag"], "size": meta["size"], "commit": meta["commit"] or self.revision}
+
+    def _download(self, dataset_path: str, table_name: str, meta: dict, dest: str) -> None:
+        if os.path.isdir(dataset_path):
+            tmp = dest + ".part"
+            shutil.copyfile(os.path.join(dataset_path, table_name), tmp)
+            os.replace(tmp, dest)
+            return
+        # Pin the commit so the bytes match the metadata we validated against
+        url = hf_resolve_url(self.endpoint, dataset_path, table_name, meta["commit"])
+        sha256 = meta["etag"] if SHA256_RE.fullmatch(meta["etag"]) else None  # LFS/Xet etag = content SHA-256
+        start = time.perf_counter()
+        self.fetcher.download(url, dest, size=meta["size"], sha256=sha256, key=meta["etag"])
+        mb = os.path.getsize(dest) / 1024 ** 2
+        secs = time.perf_counter() - start
+        print(f"Downloaded {table_name}: {mb:.1f} MB in {secs:.1f}s ({mb / max(secs, 1e-9):.1f} MB/s)"
+              f"{', SHA-256 verified' if sha256 else ''}")
+
+    def read_footer(self, dataset_path: str, table_name: str) -> bytes:
+        """
+        The footer of a remote Parquet table as a minimal Parquet buffer
+        (pyarrow.parquet.read_metadata(pyarrow.BufferReader(...))). Only the
+        last bytes of the file are fetched, with suffix ranges, so servers that
+        report no size work too; nothing is added to the cache.
+        """
+        meta = self._remote_metadata(dataset_path, table_name)
+        url = hf_resolve_url(self.endpoint, dataset_path, table_name, meta["commit"])
+        tail = self.fetcher.read_tail(url, FOOTER_GUESS)
+        if len(tail) < 12 or tail[-4:] != b"PAR1":
+            raise ValueError(f"{url} is not a Parquet file (no PAR1 footer)")
+        n = int.from_bytes(tail[-8:-4], "little")  # footer length, then the "PAR1" magic
+        if n + 8 > len(tail):
+            tail = self.fetcher.read_tail(url, n + 8)
+        return b"PAR1" + tail[-(n + 8):]
+
+    def _blob_lock(self, file_hash: str) -> threading.Lock:
+        # Concurrent requests for the same content download it once
+        with self._lock:
+            return self._blob_locks.setdefault(file_hash, threading.Lock())
+
+    # ---------- public API ----------
+
+    def lookup(self, dataset_path: str, table_name: str):
+        """Return the cached path for the table without any network access, or None."""
+        with self._lock:
+            entry = self._load_index().get(self._key(dataset_path, table_name))
+        if entry is None or not os.path.exists(self._blob_path(entry["etag"])):
+            return None
+        return self._blob_path(entry["etag"])
+
+    def path_for(self, dataset_path: str, table_name: str) -> str:
+        """Return a local path for the table, downloading it only if needed."""
+        key = self._key(dataset_path, table_name)
+
+        with self._lock:
+            index = self._load_index()
+        entry = index.get(key)
+
+        if self.offline:
+            if entry is None or not os.path.exists(self._blob_path(entry["etag"])):
+                raise FileNotFoundError(
+                    f"Offline mode: {key} is not in the local cache ({self.root}). "
+                    "Run once with cache.offline=false to populate it."
+                )
+            return self._touch(key)
+
+        meta = self._remote_metadata(dataset_path, table_name)
+        blob = self._blob_path(meta["etag"])
+
+        # A blob with the same hash may already exist under another key/revision
+        with self._blob_lock(meta["etag"]):
+            fresh = os.path.exists(blob) and (meta["size"] is None or os.path.getsize(blob) == meta["size"])
+            if not fresh:
+                print(f"Downloading {key} -> {blob}")
+                self._download(dataset_path, table_name, meta, blob)
+
+        with self._lock:
+            index = self._load_index()
+            old = index.get(key)
+            index[key] = {
+                "etag": meta["etag"],
+                "size": os.path.getsize(blob),
+                "commit": meta["commit"],
+                "last_used": time.time(),
+            }
+            self._save_index(index)
+            if old is not None and old["etag"] != meta["etag"]:
+                self._drop_unreferenced(index, old["etag"])
+            self._evict(index, keep=meta["etag"])
+        return blob
+
+    def prefetch(self, dataset_path: str, table_names: list, workers: int = 4) -> dict:
+        """
+        path_for() for several tables at once, `workers` tables in parallel.
+        Returns {table_name: local path or the exception that table raised}.
+        """
+        def fetch(name):
+            try:
+                return self.path_for(dataset_path, name)
+            except Exception as e:  # reported per table; the other downloads go on
+                return e
+
+        names = list(dict.fromkeys(table_names))
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(names) or 1))) as pool:
+            return dict(zip(names, pool.map(fetch, names)))
+
+    def _touch(self, key: str) -> str:
+        with self._lock:
+            index = self._load_index()
+            index[key]["last_used"] = time.time()
+            self._save_index(index)
+            return self._blob_path(index[key]["etag"])
+
+    def _drop_unreferenced(self, index: dict, etag: str) -> None:
+        # Caller holds the lock. A blob superseded by a new ETag is removed once
+        # no key points at it; otherwise it would sit on disk, unseen by _evict.
+        if any(entry["etag"] == etag for entry in index.values()):
+            return
+        lock = self._blob_locks.setdefault(etag, threading.Lock())
+        if not lock.acquire(blocking=False):  # being downloaded again for another key
+            return
+        try:
+            path = self._blob_path(etag)
+            if os.path.exists(path):
+                os.remove(path)
+                print(f"Removed superseded cached table {etag[:12]}")
+        finally:
+            lock.release()
+
+    def _evict(self, index: dict, keep: str) -> None:
+        # Caller holds the lock. Blobs can be shared by several keys; a blob's
+        # recency is the most recent use across those keys.
+        if self.max_bytes is None:
+            return
+        blobs = {}
+        for key, entry in index.items():
+            b = blobs.setdefault(entry["etag"], {"size": entry["size"], "last_used": 0.0, "keys": []})
+            b["last_used"] = max(b["last_used"], entry["last_used"])
+            b["keys"].append(key)
+
+        total = sum(b["size"] for b in blobs.values())
+        for etag, b in sorted(blobs.items(), key=lambda kv: kv[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if etag == keep:
+                continue
+            path = self._blob_path(etag)
+            if os.path.exists(path):
+                os.remove(path)
+            for key in b["keys"]:
+                index.pop(key, None)
+            total -= b["size"]
+            print(f"Evicted cached table {etag[:12]} ({b['size'] / 1024 ** 2:.1f} MB)")
+        self._save_index(index)
@@ -0,0 +1,277 @@
+"""
+Lightweight instrumentation for the pipeline scripts.
+
+    @instrumented("02")
+    def main():
+        with span("load") as sp:
+            df = read_derived(...)
+            sp.rows_out = len(df)
+        record_frame("comments", df)
+
+Each span records wall time, rows in/out, bytes read by the process
+(/proc/self/io on Linux), and current/peak RSS when it ends. A JSON report is
+written to `instrumentation.report_dir` (default outputs/run_reports) when the
+stage finishes. Under run_pipeline all stages of one run share one report.
+
+`instrumentation.profile_stage` names a stage to profile as well:
+`profile_mode: cprofile` dumps a .prof file (pstats/snakeviz), `tracemalloc`
+writes the top allocation sites and the traced peak.
+"""
+import cProfile
+import functools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from utils_config import load_config
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_REPORT_DIR = os.path.join("outputs", "run_reports")
+
+_RUN = None    # run-level report while run_pipeline is collecting stages
+_STAGE = None  # StageReport of the stage currently running
+
+
+def _options(cfg: dict) -> dict:
+    opts = dict((cfg or {}).get("instrumentation") or {})
+    opts.setdefault("enabled", True)
+    opts.setdefault("report_dir", DEFAULT_REPORT_DIR)
+    opts.setdefault("frame_memory", True)
+    opts.setdefault("profile_mode", "cprofile")
+    return opts
+
+
+def _mb(n):
+    return None if n is None else round(n / 2**20, 1)
+
+
+def memory() -> tuple:
+    """(current RSS, peak RSS) of this process in bytes; None where unavailable."""
+    rss = peak = None
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    except OSError:
+        if resource is not None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            peak *= 1 if sys.platform == "darwin" else 1024
+    return rss, peak
+
+
+def bytes_read():
+    """Bytes read by this process so far (files and pipes; Linux only)."""
+    try:
+        with open("/proc/self/io", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class Span:
+    def __init__(self, name: str, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.extra = {}
+
+    def to_dict(self, wall_s: float, read: int) -> dict:
+        rss, peak = memory()
+        out = {
+            "name": self.name,
+            "calls": 1,
+            "wall_s": round(wall_s, 4),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "bytes_read": read,
+            "rss_mb": _mb(rss),
+            "peak_rss_mb": _mb(peak),
+        }
+        out.update(self.extra)
+        return out
+
+
+class StageReport:
+    def __init__(self, name: str, opts: dict):
+        self.name = name
+        self.opts = opts
+        self.spans = []
+        self.frames = []
+        self.t0 = time.perf_counter()
+        self.read0 = bytes_read()
+
+    def add_span(self, entry: dict) -> None:
+        # Spans repeated with the same name (e.g. once per record batch) are summed
+        prev = next((s for s in self.spans if s["name"] == entry["name"]), None)
+        if prev is None:
+            self.spans.append(entry)
+            return
+        prev["calls"] += 1
+        prev["wall_s"] = round(prev["wall_s"] + entry["wall_s"], 4)
+        for k in ["rows_in", "rows_out", "bytes_read"]:
+            if entry[k] is not None:
+                prev[k] = (prev[k] or 0) + entry[k]
+        prev["rss_mb"], prev["peak_rss_mb"] = entry["rss_mb"], entry["peak_rss_mb"]
+
+    def to_dict(self, status: str, profile_path=None) -> dict:
+        read1 = bytes_read()
+        rss, peak = memory()
+        return {
+            "stage": self.name,
+            "status": status,
+            "wall_s": round(time.perf_counter() - self.t0, 4),
+            "bytes_read": read1 - self.read0 if read1 is not None and self.read0 is not None else None,
+            "rss_mb": _mb(rss),
+            "peak_rss_mb": _mb(peak),
+            "spans": self.spans,
+            "frames": self.frames,
+            "profile": profile_path,
+        }
+
+
+def _write_report(opts: dict, report: dict, name: str) -> str:
+    os.makedirs(opts["report_dir"], exist_ok=True)
+    path = os.path.join(opts["report_dir"], f"{name}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    return path
+
+
+def _header() -> dict:
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "argv": sys.argv,
+        "pid": os.getpid(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def _start_profile(opts: dict, name: str):
+    if str(opts.get("profile_stage")) != name:
+        return None
+    if opts["profile_mode"] == "tracemalloc":
+        tracemalloc.start(25)
+        return "tracemalloc"
+    prof = cProfile.Profile()
+    prof.enable()
+    return prof
+
+
+def _stop_profile(profiler, opts: dict, name: str):
+    if profiler is None:
+        return None
+    os.makedirs(opts["report_dir"], exist_ok=True)
+    stem = os.path.join(opts["report_dir"], f"profile_{name}_{time.strftime('%Y%m%d_%H%M%S')}")
+    if profiler == "tracemalloc":
+        snapshot = tracemalloc.take_snapshot()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        path = stem + "_tracemalloc.txt"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Traced peak: {_mb(traced_peak)} MB\n\nTop allocation sites:\n")
+            for stat in snapshot.statistics("lineno")[:40]:
+                f.write(f"{stat}\n")
+        return path
+    profiler.disable()
+    path = stem + ".prof"
+    profiler.dump_stats(path)
+    return path
+
+
+@contextmanager
+def stage_report(cfg: dict, name: str):
+    """Collect spans for one pipeline stage and write (or hand over) its report."""
+    global _STAGE
+    opts = _options(cfg)
+    if not opts["enabled"]:
+        yield None
+        return
+
+    rep = StageReport(name, opts)
+    prev, _STAGE = _STAGE, rep
+    profiler = _start_profile(opts, name)
+    status = "failed"
+    try:
+        yield rep
+        status = "ok"
+    finally:
+        profile_path = _stop_profile(profiler, opts, name)
+        _STAGE = prev
+        stage = rep.to_dict(status, profile_path)
+        if _RUN is not None:
+            _RUN["stages"].append(stage)
+        else:
+            path = _write_report(opts, {**_header(), "stages": [stage]}, name)
+            print("Run report:", path)
+        if profile_path:
+            print("Profile:", profile_path)
+
+
+def instrumented(name: str):
+    """Decorator: run a script's main() inside stage_report(load_config(), name)."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with stage_report(load_config(), name):
+                return fn(*args, **kwargs)
+        return run
+    return wrap
+
+
+@contextmanager
+def span(name: str, rows_in=None):
+    """Time one phase (load, filter, join, derive, write, ...) of the current stage."""
+    sp = Span(name, rows_in)
+    t0 = time.perf_counter()
+    read0 = bytes_read()
+    try:
+        yield sp
+    finally:
+        if _STAGE is not None:
+            read1 = bytes_read()
+            read = read1 - read0 if read1 is not None and read0 is not None else None
+            _STAGE.add_span(sp.to_dict(time.perf_counter() - t0, read))
+
+
+def record_frame(name: str, df) -> None:
+    """Record the shape and (deep) memory footprint of a DataFrame in the current stage."""
+    if _STAGE is None:
+        return
+    entry = {"name": name, "rows": int(len(df)), "cols": int(df.shape[1])}
+    if _STAGE.opts["frame_memory"]:
+        entry["memory_mb"] = _mb(int(df.memory_usage(deep=True).sum()))
+    _STAGE.frames.append(entry)
+
+
+@contextmanager
+def run_report(cfg: dict, name: str = "pipeline"):
+    """Used by run_pipeline: stages run inside share one report, written at the end."""
+    global _RUN
+    opts = _options(cfg)
+    if not opts["enabled"]:
+        yield None
+        return
+    _RUN = {**_header(), "stages": [], "skipped": []}
+    t0 = time.perf_counter()
+    try:
+        yield _RUN
+    finally:
+        report, _RUN = _RUN, None
+        report["wall_s"] = round(time.perf_counter() - t0, 4)
+        report["peak_rss_mb"] = _mb(memory()[1])
+        print("Run report:", _write_report(opts, report, name))
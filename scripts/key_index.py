@@ -0,0 +1,112 @@
+import os
+import numpy as np
+import pandas as pd
+from derived_io import derived_path, read_derived, write_derived
+
+REPO_INDEX = "aidev_key_index_repos"
+PR_INDEX = "aidev_key_index_prs"
+
+
+def _pack(repo_key: np.ndarray, number: np.ndarray) -> np.ndarray:
+    # (repo, number) -> one int64; PR numbers fit easily in the low 32 bits
+    return (repo_key.astype("int64") << 32) | number.astype("int64")
+
+
+def _take(values: np.ndarray, pos: np.ndarray) -> np.ndarray:
+    # values[pos], with -1 wherever pos is -1 (also safe on an empty index)
+    out = np.full(len(pos), -1, dtype="int64")
+    hit = pos >= 0
+    out[hit] = values[pos[hit]]
+    return out
+
+
+def _as_int(values, missing: int = -1) -> np.ndarray:
+    return pd.to_numeric(pd.Series(values), errors="coerce").fillna(missing).astype("int64").to_numpy()
+
+
+class KeyIndex:
+    """
+    Dense integer keys for the pipeline's join columns:
+        full_name          -> repo_key
+        (repo_key, number) -> pr_key
+        pr_id (AIDev id)  <-> pr_key
+
+    Stages join on the single integer `pr_key` instead of (full_name, number).
+    Lookups return -1 for unknown keys.
+    """
+
+    def __init__(self, repos: pd.DataFrame, prs: pd.DataFrame):
+        self.repos = repos.reset_index(drop=True)
+        self.prs = prs.reset_index(drop=True)
+        self._repo_lookup = pd.Index(self.repos["full_name"].astype(str))
+        self._pr_lookup = pd.Index(_pack(self.prs["repo_key"].to_numpy(), self.prs["number"].to_numpy()))
+        self._pr_id_lookup = pd.Index(self.prs["pr_id"]) if "pr_id" in self.prs.columns else None
+        self._pr_keys = self.prs["pr_key"].to_numpy(dtype="int64")
+
+    def repo_keys(self, full_name) -> np.ndarray:
+        pos = self._repo_lookup.get_indexer(pd.Series(full_name).astype(str))
+        return _take(self.repos["repo_key"].to_numpy(dtype="int64"), pos)
+
+    def pr_keys(self, full_name, number) -> np.ndarray:
+        repo = self.repo_keys(full_name)
+        num = _as_int(number)
+        pos = self._pr_lookup.get_indexer(_pack(repo, num))
+        pos[(repo < 0) | (num < 0)] = -1
+        return _take(self._pr_keys, pos)
+
+    def pr_keys_from_pr_id(self, pr_id) -> np.ndarray:
+        if self._pr_id_lookup is None:
+            raise ValueError("Key index has no pr_id column.")
+        return _take(self._pr_keys, self._pr_id_lookup.get_indexer(_as_int(pr_id)))
+
+    def pr_ids(self, pr_key) -> np.ndarray:
+        return self.prs.set_index("pr_key")["pr_id"].reindex(_as_int(pr_key)).to_numpy()
+
+
+def load_key_index(cfg: dict) -> KeyIndex:
+    for name in (REPO_INDEX, PR_INDEX):
+        if not os.path.exists(derived_path(cfg, name)):
+            raise FileNotFoundError(f"Missing {derived_path(cfg, name)}. Run script 01 first.")
+    return KeyIndex(read_derived(cfg, REPO_INDEX), read_derived(cfg, PR_INDEX))
+
+
+def update_key_index(cfg: dict, pr: pd.DataFrame) -> KeyIndex:
+    """
+    Add any repos/PRs from `pr` (full_name, number, optional id_pr) to the
+    persisted index and return it. Existing keys never change, so artifacts
+    keyed on pr_key stay valid across rebuilds.
+    """
+    if all(os.path.exists(derived_path(cfg, n)) for n in (REPO_INDEX, PR_INDEX)):
+        old = load_key_index(cfg)
+        repos, prs = old.repos, old.prs
+    else:
+        repos = pd.DataFrame({"repo_key": pd.Series(dtype="int64"), "full_name": pd.Series(dtype=object)})
+        prs = pd.DataFrame({c: pd.Series(dtype="int64") for c in ["pr_key", "repo_key", "number", "pr_id"]})
+        old = KeyIndex(repos, prs)
+
+    keyed = pr[["full_name", "number"] + (["id_pr"] if "id_pr" in pr.columns else [])]
+    keyed = keyed.dropna(subset=["number"]).drop_duplicates(["full_name", "number"])
+    keyed = keyed.astype({"full_name": str, "number": "int64"})
+
+    new_names = sorted(set(keyed["full_name"]) - set(repos["full_name"]))
+    new_repos = pd.DataFrame({
+        "repo_key": np.arange(len(repos), len(repos) + len(new_names), dtype="int64"),
+        "full_name": new_names,
+    })
+    repos = pd.concat([repos, new_repos], ignore_index=True)
+
+    index = KeyIndex(repos, prs)
+    new_prs = keyed.loc[old.pr_keys(keyed["full_name"], keyed["number"]) < 0]
+    new_prs = new_prs.sort_values(["full_name", "number"]).reset_index(drop=True)
+    new_prs = pd.DataFrame({
+        "pr_key": np.arange(len(prs), len(prs) + len(new_prs), dtype="int64"),
+        "repo_key": index.repo_keys(new_prs["full_name"]),
+        "number": new_prs["number"].to_numpy(),
+        "pr_id": new_prs["id_pr"].to_numpy() if "id_pr" in new_prs.columns else pd.NA,
+    })
+    prs = pd.concat([prs, new_prs], ignore_index=True) if len(prs) else new_prs
+
+    write_derived(repos, cfg, REPO_INDEX)
+    write_derived(prs, cfg, PR_INDEX)
+    print(f"Key index: {len(repos)} repos (+{len(new_repos)}), {len(prs)} PRs (+{len(new_prs)})")
+    return KeyIndex(repos, prs)
@@ -0,0 +1,184 @@
+"""
+Concurrent client for OpenAI-compatible chat completion APIs.
+
+- TokenBucket: shared request-rate limiter (burst up to `capacity`).
+- ResponseCache: SQLite store of successful responses keyed by a hash of
+  (model, messages, request params). Every response is committed as soon as it
+  arrives, so the cache doubles as the checkpoint: an interrupted run resumes
+  by skipping keys that are already cached.
+- ChatClient: one request with retry/backoff on 429/5xx/network errors
+  (honours Retry-After). Uses only the standard library, so `base_url` can point
+  at the OpenAI API or at any local server that speaks the same protocol.
+"""
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)  # tokens per second; <= 0 disables limiting
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ResponseCache:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, created_at REAL)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def key(model: str, messages: list, params: dict) -> str:
+        blob = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys) -> dict:
+        keys = list(keys)
+        found = {}
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, response FROM responses WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def put(self, key: str, model: str, response: str) -> None:
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, model, response, time.time())
+            )
+            self.conn.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+class ChatClient:
+    def __init__(self, base_url: str, api_key: str, model: str, params: dict = None,
+                 bucket: TokenBucket = None, max_retries: int = 3, timeout: float = 60.0,
+                 backoff: float = 1.0):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.api_key = api_key
+        self.model = model
+        self.params = dict(params or {})
+        self.bucket = bucket or TokenBucket(0)
+        self.max_retries = int(max_retries)
+        self.timeout = float(timeout)
+        self.backoff = float(backoff)
+
+    def _delay(self, attempt: int, retry_after=None) -> float:
+        try:
+            base = float(retry_after)
+        except (TypeError, ValueError):
+            base = self.backoff * 2 ** attempt
+        return base * (1.0 + 0.25 * random.random())  # jitter so workers don't retry in lockstep
+
+    def complete(self, messages: list) -> str:
+        """Return the assistant message content; raises after max_retries."""
+        body = json.dumps({"model": self.model, "messages": messages, **self.params}).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            req = urllib.request.Request(self.url, data=body, headers=headers, method="POST")
+            try:
+                with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                    payload = json.load(resp)
+                return payload["choices"][0]["message"]["content"]
+            except urllib.error.HTTPError as e:
+                if e.code not in RETRY_STATUS or attempt == self.max_retries:
+                    raise
+                delay = self._delay(attempt, e.headers.get("Retry-After"))
+            except (urllib.error.URLError, TimeoutError, ConnectionError):
+                if attempt == self.max_retries:
+                    raise
+                delay = self._delay(attempt)
+            time.sleep(delay)
+
+
+def run_cached(client: ChatClient, cache: ResponseCache, jobs: dict, parse,
+               concurrency: int = 8, progress_every: int = 100) -> dict:
+    """
+    Run `jobs` ({key: messages}) through `client` with `concurrency` threads.
+
+    Cached keys are not requested again. A response is cached only once
+    `parse(text)` accepts it; unparseable answers are retried like transport
+    errors (max_retries). Returns {key: parsed result or {"error": str}}.
+    """
+    results = {}
+    for k, text in cache.get_many(jobs).items():
+        try:
+            results[k] = parse(text)
+        except ValueError:
+            pass  # stale/invalid entry: request again
+    pending = [k for k in jobs if k not in results]
+    print(f"Requests: {len(jobs)}  cached: {len(results)}  to send: {len(pending)}")
+
+    def work(k):
+        last = None
+        for _ in range(client.max_retries + 1):
+            text = client.complete(jobs[k])
+            try:
+                parsed = parse(text)
+            except ValueError as e:
+                last = e
+                continue
+            cache.put(k, client.model, text)
+            return parsed
+        raise ValueError(f"Unparseable response: {last}")
+
+    done = 0
+    pool = ThreadPoolExecutor(max_workers=max(1, int(concurrency)))
+    try:
+        futures = {pool.submit(work, k): k for k in pending}
+        for fut in as_completed(futures):
+            k = futures[fut]
+            try:
+                results[k] = fut.result()
+            except Exception as e:  # noqa: BLE001 - recorded per row, retried on next run
+                results[k] = {"error": str(e)}
+            done += 1
+            if progress_every and done % progress_every == 0:
+                print(f"  {done}/{len(pending)} done")
+    finally:
+        # On Ctrl-C, drop queued requests; finished ones are already cached
+        pool.shutdown(wait=True, cancel_futures=True)
+    return results
@@ -0,0 +1,227 @@
+"""
+Generate local Parquet tables shaped like the AIDev tables the pipeline reads:
+
+    all_repository.parquet         id, full_name, stars, language
+    all_pull_request.parquet       id, number, repo_id, agent, user, state, created_at,
+                                   closed_at, merged_at, title, body, html_url
+    pr_review_comments_v2.parquet  id, pr_id, pull_request_url, user, body, path,
+                                   diff_hunk, position, created_at
+    pr_commit_details.parquet      pr_id, sha, filename, additions, deletions, changes
+
+Volumes scale linearly with --scale (1 = roughly the AIDev release). Skew is
+kept realistic: stars are log-normal, PRs per repository follow a Zipf-like
+law, and comments per PR are negative-binomial (most PRs have none, a few have
+dozens). Stars follow each repository's PR weight (with noise), as active
+repositories tend to be popular ones, so the min_stars filter keeps enough PRs
+for every step. Tables are written in chunks, so memory stays flat at any scale.
+
+Usage:
+    python scripts/make_synthetic_aidev.py --scale 1 --out data/bench/scale_1/aidev
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Approximate volumes at scale 1
+BASE_REPOS = 116_000
+BASE_PRS = 930_000
+COMMENTS_PER_PR = 0.6      # mean; negative binomial, heavy tail
+FILES_PER_COMMIT = 2.5
+COMMITS_PER_PR = 2.0
+
+AGENTS = np.array(["OpenAI_Codex", "Devin", "Copilot", "Cursor", "Claude_Code"])
+AGENT_P = np.array([0.80, 0.05, 0.06, 0.05, 0.04])
+MERGE_RATE = {"OpenAI_Codex": 0.80, "Devin": 0.50, "Copilot": 0.45, "Cursor": 0.65, "Claude_Code": 0.60}
+
+TITLES = np.array([
+    "fix: handle empty input", "feat: add retry option", "Refactor config loader", "docs: update README",
+    "Add tests for parser", "chore: bump dependencies", "build: fix packaging", "perf: cache lookups",
+    "style: format code", "ci: run on windows", "Revert previous change", "Implement search endpoint",
+    "Update error messages", "",
+])
+PR_BODIES = np.array([
+    "", "Fixes the issue described in the ticket.", "This PR adds the requested feature.\n\n" + "Details. " * 40,
+    "## Summary\n- change one\n- change two\n\n## Testing\nRan the unit tests.", "Automated change.",
+])
+COMMENT_BODIES = np.array([
+    "LGTM", "Thanks!", "+1", "done", "nit: typo", "Fixed.",
+    "This does not address the issue; the logic in this branch is wrong for empty lists.",
+    "Please add tests covering the edge cases here.",
+    "This duplicates the existing helper in utils, please reuse it.",
+    "There is a merge conflict with main, please rebase onto the latest commit.",
+    "CI fails on this change: the build cannot find the new module.",
+    "Could you split this PR? It mixes the refactor with the feature.",
+    "We decided not to take this change, it is outside the project scope.",
+    "I am not confident this generated code handles concurrency correctly.",
+    None,
+])
+COMMENT_USERS = np.array(["maintainer1", "maintainer2", "reviewer", "alice", "bob", "dependabot[bot]", "codecov[bot]"])
+PATHS = np.array(["src/app.py", "src/utils.py", "tests/test_app.py", "docs/index.md", "README.md", "lib/core.js", "setup.py"])
+HUNKS = np.array(["@@ -1,2 +1,3 @@\n-a\n+b\n+c", "@@ -10,4 +10,6 @@\n context\n-old\n+new", "@@ -5 +5 @@\n-x\n+y"])
+
+START = pd.Timestamp("2024-12-01", tz="UTC")
+END = pd.Timestamp("2025-08-15", tz="UTC")
+
+
+class ChunkWriter:
+    """Append DataFrame chunks to one Parquet file (schema fixed by the first chunk)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.writer = None
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+        self.writer.write_table(table.cast(self.writer.schema), row_group_size=100_000)
+        self.rows += len(df)
+
+    def close(self) -> int:
+        if self.writer is not None:
+            self.writer.close()
+        return self.rows
+
+
+def make_repos(rng, n_repos: int, repo_p: np.ndarray) -> pd.DataFrame:
+    # Log-normal stars handed out in the order of the (noisy) PR weights: busy repos get the most stars
+    stars = np.sort(np.floor(rng.lognormal(mean=3.0, sigma=1.8, size=n_repos)).astype("int64"))[::-1]
+    order = np.argsort(-np.log(repo_p) + rng.normal(0.0, 1.0, n_repos), kind="stable")
+    stars = stars[np.argsort(order, kind="stable")]
+    return pd.DataFrame({
+        "id": np.arange(n_repos, dtype="int64") + 1,
+        "full_name": [f"org{i % 9973}/repo{i}" for i in range(n_repos)],
+        "stars": stars,
+        "language": rng.choice(["Python", "TypeScript", "Go", "Rust", "Java"], n_repos),
+    })
+
+
+def make_prs(rng, repos: pd.DataFrame, repo_p: np.ndarray, next_number: np.ndarray,
+             first_id: int, n: int) -> pd.DataFrame:
+    repo_idx = rng.choice(len(repos), size=n, p=repo_p)
+    # Per-repo PR numbers continue across chunks
+    order = np.argsort(repo_idx, kind="stable")
+    sorted_idx = repo_idx[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_idx)) + 1]
+    rank = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+    number = np.empty(n, dtype="int64")
+    number[order] = next_number[sorted_idx] + rank
+    np.add.at(next_number, repo_idx, 1)
+
+    agent = rng.choice(AGENTS, size=n, p=AGENT_P)
+    # More PRs later in the window (adoption grows over time)
+    span = (END - START).total_seconds()
+    created = (START + pd.to_timedelta(np.sqrt(rng.random(n)) * span, unit="s")).floor("s")
+    closed_after = pd.to_timedelta(rng.lognormal(mean=2.5, sigma=1.5, size=n), unit="h").floor("s")
+    is_closed = rng.random(n) < 0.88
+    merged = is_closed & (rng.random(n) < pd.Series(agent).map(MERGE_RATE).to_numpy())
+    closed_at = (created + closed_after).where(is_closed)
+    full_name = repos["full_name"].to_numpy()[repo_idx]
+
+    return pd.DataFrame({
+        "id": np.arange(first_id, first_id + n, dtype="int64"),
+        "number": number,
+        "repo_id": repos["id"].to_numpy()[repo_idx],
+        "agent": agent,
+        "user": np.char.add("user", (rng.integers(0, 50_000, n)).astype(str)),
+        "state": np.where(is_closed, "closed", "open"),
+        "created_at": created,
+        "closed_at": closed_at,
+        "merged_at": closed_at.where(merged),
+        "title": rng.choice(TITLES, n),
+        "body": rng.choice(PR_BODIES, n),
+        "html_url": "https://github.com/" + pd.Series(full_name) + "/pull/" + pd.Series(number).astype(str),
+    })
+
+
+def make_comments(rng, prs: pd.DataFrame, first_id: int) -> pd.DataFrame:
+    # Negative binomial with small n: mostly zero, long tail
+    counts = rng.negative_binomial(0.25, 0.25 / (0.25 + COMMENTS_PER_PR), size=len(prs))
+    idx = np.repeat(np.arange(len(prs)), counts)
+    m = len(idx)
+    pr = prs.iloc[idx]
+    repo_url = pr["html_url"].str.replace("https://github.com/", "https://api.github.com/repos/", regex=False)
+    return pd.DataFrame({
+        "id": np.arange(first_id, first_id + m, dtype="int64"),
+        "pr_id": pr["id"].to_numpy(),
+        "pull_request_url": repo_url.str.replace("/pull/", "/pulls/", regex=False).to_numpy(),
+        "user": rng.choice(COMMENT_USERS, m),
+        "body": rng.choice(COMMENT_BODIES, m),
+        "path": rng.choice(PATHS, m),
+        "diff_hunk": rng.choice(HUNKS, m),
+        "position": rng.integers(1, 200, m).astype("float64"),
+        "created_at": pr["created_at"].reset_index(drop=True) + pd.to_timedelta(rng.exponential(24, m), unit="h").floor("s"),
+    })
+
+
+def make_commit_details(rng, prs: pd.DataFrame) -> pd.DataFrame:
+    n_commits = 1 + rng.poisson(COMMITS_PER_PR - 1, size=len(prs))
+    commit_pr = np.repeat(np.arange(len(prs)), n_commits)
+    commit_id = np.arange(len(commit_pr))
+    n_files = 1 + rng.poisson(FILES_PER_COMMIT - 1, size=len(commit_pr))
+    row_commit = np.repeat(commit_id, n_files)
+    m = len(row_commit)
+    additions = np.floor(rng.lognormal(2.5, 1.5, m)).astype("int64")
+    deletions = np.floor(rng.lognormal(1.5, 1.5, m)).astype("int64")
+    pr_ids = prs["id"].to_numpy()[commit_pr[row_commit]]
+    return pd.DataFrame({
+        "pr_id": pr_ids,
+        "sha": np.char.add(pr_ids.astype(str), np.char.add("-", row_commit.astype(str))),
+        "filename": rng.choice(PATHS, m),
+        "additions": additions,
+        "deletions": deletions,
+        "changes": additions + deletions,
+    })
+
+
+def generate(out_dir: str, scale: float, seed: int = 0, chunk_size: int = 500_000) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    n_repos = max(10, int(BASE_REPOS * scale))
+    n_prs = max(100, int(BASE_PRS * scale))
+
+    # Zipf-like repository popularity for PR placement
+    weights = 1.0 / np.arange(1, n_repos + 1) ** 1.1
+    repo_p = rng.permutation(weights / weights.sum())
+
+    repos = make_repos(rng, n_repos, repo_p)
+    repos.to_parquet(os.path.join(out_dir, "all_repository.parquet"), index=False)
+    next_number = np.ones(n_repos, dtype="int64")
+
+    writers = {
+        "pull_request": ChunkWriter(os.path.join(out_dir, "all_pull_request.parquet")),
+        "review_comments": ChunkWriter(os.path.join(out_dir, "pr_review_comments_v2.parquet")),
+        "commit_details": ChunkWriter(os.path.join(out_dir, "pr_commit_details.parquet")),
+    }
+    for start in range(0, n_prs, chunk_size):
+        n = min(chunk_size, n_prs - start)
+        prs = make_prs(rng, repos, repo_p, next_number, 1_000_000 + start, n)
+        writers["pull_request"].write(prs)
+        writers["review_comments"].write(make_comments(rng, prs, 50_000_000 + writers["review_comments"].rows))
+        writers["commit_details"].write(make_commit_details(rng, prs))
+
+    rows = {"repository": n_repos}
+    rows.update({name: w.close() for name, w in writers.items()})
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Write synthetic AIDev-shaped Parquet tables.")
+    ap.add_argument("--scale", type=float, default=1.0, help="Volume relative to the AIDev release (e.g. 0.1, 1, 10, 100).")
+    ap.add_argument("--out", required=True, help="Output directory (use as aidev_hf_dataset).")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    print(f"=== Synthetic AIDev tables (scale {args.scale:g}) ===")
+    rows = generate(args.out, args.scale, seed=args.seed)
+    print("✅ Wrote:", args.out)
+    for name, n in rows.items():
+        print(f"  {name}: {n} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Near-duplicate text clustering with MinHash signatures and LSH banding.
+
+Texts are normalized (lowercase, digits -> "0", whitespace collapsed), so
+templated bot output that differs only in numbers, names or spacing lands on
+the same shingles. Each text is shingled into overlapping byte k-grams. All
+k-gram hashes of a batch are computed at once with numpy (a rolling
+polynomial over the concatenated UTF-8 bytes). The MinHash signature is the
+per-text minimum of `num_perm` multiply-shift hashes (np.minimum.reduceat).
+
+LSH splits a signature into `bands` bands of num_perm / bands rows. Texts that
+agree on a whole band are candidates. A candidate joins the first text of its
+bucket when their estimated Jaccard similarity (the share of equal signature
+entries) reaches `threshold`. Clusters are the connected components of those
+links, so the work is linear in the number of texts, even for buckets that
+hold thousands of copies of one bot template.
+"""
+import numpy as np
+import pandas as pd
+
+PRIME = np.uint64(1099511628211)  # FNV-1a 64-bit prime (rolling hash base)
+
+
+def normalize(texts: pd.Series) -> pd.Series:
+    """Lowercase, digits -> 0, runs of whitespace -> one space (null -> "")."""
+    t = texts.astype(object).where(texts.notna(), "").astype(str).str.lower()
+    return t.str.replace(r"\d", "0", regex=True).str.replace(r"\s+", " ", regex=True).str.strip()
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer: spreads the polynomial hash over all 64 bits
+    with np.errstate(over="ignore"):
+        x = x ^ (x >> np.uint64(30))
+        x = x * np.uint64(0xBF58476D1CE4E5B9)
+        x = x ^ (x >> np.uint64(27))
+        x = x * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def shingle_hashes(texts: list, k: int) -> tuple:
+    """
+    (hashes, starts): 64-bit hashes of all byte k-grams of `texts` (non-empty
+    strings), grouped per text; text i owns hashes[starts[i]:starts[i + 1]].
+    Texts shorter than k bytes are one shingle.
+    """
+    data = [t.encode("utf-8") for t in texts]
+    lengths = np.fromiter((len(b) for b in data), dtype=np.int64, count=len(data))
+    buf = np.frombuffer(b"".join(data) + b"\0" * k, dtype=np.uint8).astype(np.uint64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    n_win = np.maximum(lengths - k + 1, 1)
+    starts = np.concatenate([[0], np.cumsum(n_win)])
+    # Window start positions, text by text
+    pos = np.arange(starts[-1], dtype=np.int64) - np.repeat(starts[:-1] - offsets[:-1], n_win)
+    width = np.repeat(np.minimum(lengths, k), n_win)  # short texts: the whole text
+    h = np.zeros(len(pos), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for j in range(k):
+            byte = np.where(j < width, buf[pos + j], np.uint64(0))
+            h = h * PRIME + byte + np.uint64(1)
+    return _mix(h), starts
+
+
+def permutations(num_perm: int, seed: int) -> tuple:
+    """Odd multipliers and offsets of the multiply-shift hash family."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash(texts: list, k: int, perms: tuple) -> np.ndarray:
+    """(len(texts), num_perm) uint32 MinHash signatures."""
+    a, b = perms
+    hashes, starts = shingle_hashes(texts, k)
+    sig = np.empty((len(texts), len(a)), dtype=np.uint32)
+    buf = np.empty_like(hashes)
+    # One contiguous pass per permutation (in place): much faster than a 2-D block reduced along axis 0
+    with np.errstate(over="ignore"):
+        for p in range(len(a)):
+            np.multiply(hashes, a[p], out=buf)
+            buf += b[p]
+            buf >>= np.uint64(32)
+            sig[:, p] = np.minimum.reduceat(buf, starts[:-1])
+    return sig
+
+
+def _components(n: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Smallest member index of each node's connected component."""
+    label = np.arange(n)
+    while True:
+        low = np.minimum(label[left], label[right])
+        new = label.copy()
+        np.minimum.at(new, left, low)
+        np.minimum.at(new, right, low)
+        new = new[new]  # pointer jumping
+        if np.array_equal(new, label):
+            return label
+        label = new
+
+
+def lsh_clusters(sig: np.ndarray, bands: int, threshold: float) -> np.ndarray:
+    """Cluster label (smallest member row) per signature row."""
+    n, num_perm = sig.shape
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+    rows = num_perm // bands
+    left, right = [], []
+    for band in range(bands):
+        key = np.zeros(n, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            for c in range(band * rows, (band + 1) * rows):
+                key = _mix(key ^ sig[:, c].astype(np.uint64))
+        order = np.argsort(key, kind="stable")
+        sorted_key = key[order]
+        first = np.r_[True, sorted_key[1:] != sorted_key[:-1]]
+        leader = order[np.flatnonzero(first)[np.cumsum(first) - 1]]  # first row of each bucket
+        cand = leader != order
+        a, b = leader[cand], order[cand]
+        est = (sig[a] == sig[b]).mean(axis=1)
+        keep = est >= threshold
+        left.append(a[keep])
+        right.append(b[keep])
+    left = np.concatenate(left) if left else np.empty(0, dtype=np.int64)
+    right = np.concatenate(right) if right else np.empty(0, dtype=np.int64)
+    return _components(n, left, right)
+
+
+def cluster_texts(texts: pd.Series, shingle_size: int = 5, num_perm: int = 128, bands: int = 16,
+                  threshold: float = 0.8, batch_texts: int = 20000, seed: int = 1) -> np.ndarray:
+    """
+    Cluster label per text: the position (in `texts`) of the smallest member
+    of its near-duplicate cluster. Empty/null texts are singletons.
+    """
+    norm = normalize(pd.Series(texts)).to_numpy()
+    live = np.flatnonzero(norm != "")
+    perms = permutations(num_perm, seed)
+    sig = np.empty((len(live), num_perm), dtype=np.uint32)
+    for s in range(0, len(live), batch_texts):
+        sig[s:s + batch_texts] = minhash(norm[live[s:s + batch_texts]].tolist(), shingle_size, perms)
+    labels = np.arange(len(norm))
+    if len(live):
+        labels[live] = live[lsh_clusters(sig, bands, threshold)]
+    return labels
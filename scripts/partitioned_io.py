@@ -0,0 +1,330 @@
+"""
+Hive-partitioned layout for the PR and comment datasets (`intermediates.layout: partitioned`).
+
+    <derived_dir>/<name>/created_month=2025-06/agent_type=Devin/part-00003.parquet
+    <derived_dir>/<name>/_manifest.json
+
+Rows are partitioned by the month of a timestamp column and by agent_type
+(both live in the directory names, not in the files) and sorted by the
+dataset's `order` columns inside each partition, so a partition file depends
+only on its rows, not on how or when they were ingested. Steps 01/02 rewrite
+only the partitions that hold new, changed or removed rows (`upsert`).
+
+The manifest lists the live file of each partition with its row count and
+SHA-256, plus the Arrow schema shared by all files. A rewrite writes new file
+names and replaces the manifest last, so an interrupted run leaves the
+previous version readable. run_pipeline.py fingerprints the manifest.
+"""
+import base64
+import hashlib
+import json
+import os
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+MANIFEST = "_manifest.json"
+PARTITION_COLS = ["created_month", "agent_type"]
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# name -> month column, unique row key, sort order inside a partition
+SPECS = {
+    "aidev_pop_ge500_agent_prs": {"month": "created_at", "key": "id_pr", "order": ["pr_key"]},
+    "aidev_pop_ge500_pr_review_comments_with_task_type": {
+        "month": "created_at_comment", "key": "id", "order": ["pr_key", "id"],
+    },
+}
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _dense_schema(schema, fallback=None):
+    """Plain value types for dictionary columns; all-null columns typed from `fallback` (or string)."""
+    import pyarrow as pa
+
+    fields = []
+    for field in schema:
+        if pa.types.is_dictionary(field.type):
+            field = field.with_type(field.type.value_type)
+        elif pa.types.is_null(field.type):
+            typ = fallback.field(field.name).type if fallback is not None and field.name in fallback.names else pa.string()
+            field = field.with_type(typ)
+        fields.append(field)
+    return pa.schema(fields)
+
+
+class PartitionedDataset:
+    def __init__(self, path: str, spec: dict, compression: str = "zstd", row_group_size: int = 131_072):
+        self.path = path
+        self.spec = spec
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self._manifest = None
+        self._stamp = None
+
+    # --- manifest ---------------------------------------------------------------
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.path, MANIFEST))
+
+    @property
+    def manifest(self) -> dict:
+        # Re-read whenever the file changed, e.g. after an upsert through another instance
+        path = os.path.join(self.path, MANIFEST)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Missing {path}.")
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if self._manifest is None or self._stamp != stamp:
+            with open(path, encoding="utf-8") as f:
+                self._manifest = json.load(f)
+            self._stamp = stamp
+        return self._manifest
+
+    @property
+    def columns(self) -> list:
+        return list(self.manifest["columns"])
+
+    @property
+    def schema(self):
+        """Arrow schema of the files (partition columns excluded)."""
+        import pyarrow as pa
+
+        return pa.ipc.read_schema(pa.py_buffer(base64.b64decode(self.manifest["schema"])))
+
+    def partitions(self) -> list:
+        return sorted(self.manifest["partitions"])
+
+    def rows(self) -> int:
+        return sum(p["rows"] for p in self.manifest["partitions"].values())
+
+    def _file(self, rel: str) -> str:
+        return os.path.join(self.path, rel, self.manifest["partitions"][rel]["file"])
+
+    # --- read -------------------------------------------------------------------
+
+    def partition_labels(self, df: pd.DataFrame) -> pd.Series:
+        """Partition directory (created_month=YYYY-MM/agent_type=...) of every row."""
+        month = pd.to_datetime(df[self.spec["month"]], errors="coerce", utc=True).dt.strftime("%Y-%m")
+        agent = df["agent_type"].astype(object).where(df["agent_type"].notna())
+        month = month.astype(object).where(month.notna(), NULL_PARTITION)
+        agent = agent.map(lambda a: quote(str(a), safe=""), na_action="ignore").fillna(NULL_PARTITION)
+        return "created_month=" + month.astype(str) + "/agent_type=" + agent.astype(str)
+
+    def read(self, columns=None, filters=None, partitions=None) -> pd.DataFrame:
+        """
+        Rows of all (or the given) partitions in partition order, with
+        agent_type restored from the directory names. `filters` are
+        pyarrow-style and prune whole partitions on agent_type.
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as pads
+        import pyarrow.parquet as pq
+
+        parts = self.partitions() if partitions is None else sorted(set(partitions) & set(self.manifest["partitions"]))
+        columns = self.columns if columns is None else list(columns)
+        part_schema = pa.schema([(c, pa.string()) for c in PARTITION_COLS])
+        schema = pa.schema(list(self.schema) + list(part_schema))
+        dataset = pads.dataset([self._file(p) for p in parts], schema=schema, format="parquet",
+                               partitioning=pads.partitioning(part_schema, flavor="hive"),
+                               partition_base_dir=self.path)
+        expr = pq.filters_to_expression(filters) if filters else None
+        return _to_pandas(dataset.to_table(columns=columns, filter=expr))
+
+    def key_partitions(self) -> pd.Series:
+        """Row key -> partition directory, from the key column of every file."""
+        import pyarrow.parquet as pq
+
+        key = self.spec["key"]
+        keys, labels = [], []
+        for rel in self.partitions():
+            values = pq.read_table(self._file(rel), columns=[key]).column(key).to_numpy()
+            keys.append(values)
+            labels.append(np.full(len(values), rel, dtype=object))
+        if not keys:
+            return pd.Series([], dtype=object)
+        return pd.Series(np.concatenate(labels), index=np.concatenate(keys))
+
+    # --- write ------------------------------------------------------------------
+
+    def _write_partition(self, rel: str, df: pd.DataFrame, schema, generation: int) -> dict:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        order = [c for c in self.spec["order"] if c in df.columns]
+        if order:
+            df = df.sort_values(order, kind="stable")
+        table = pa.Table.from_pandas(df.drop(columns=[c for c in PARTITION_COLS if c in df.columns]),
+                                     preserve_index=False)
+        table = table.select(schema.names).cast(schema)
+        name = f"part-{generation:05d}.parquet"
+        os.makedirs(os.path.join(self.path, rel), exist_ok=True)
+        path = os.path.join(self.path, rel, name)
+        pq.write_table(table, path, compression=self.compression, row_group_size=self.row_group_size)
+        return {"file": name, "rows": table.num_rows, "sha256": _sha256(path)}
+
+    def commit(self, parts: dict, columns: list, schema=None, replace_all: bool = False) -> None:
+        """
+        Write `parts` (partition directory -> all of its rows, or a function
+        returning them; empty drops the partition) and publish them in a new
+        manifest. With `replace_all`, partitions not in `parts` are dropped too.
+        """
+        old = self.manifest if self.exists() else {"generation": 0, "partitions": {}}
+        if schema is None:
+            schema = self.schema
+        schema = schema.remove_metadata()
+        generation = int(old["generation"]) + 1
+        live = {} if replace_all else dict(old["partitions"])
+        for rel in sorted(parts):
+            live.pop(rel, None)
+            df = parts[rel]() if callable(parts[rel]) else parts[rel]
+            if len(df):
+                live[rel] = self._write_partition(rel, df, schema, generation)
+
+        manifest = {
+            "generation": generation,
+            "columns": list(columns),
+            "partition_by": PARTITION_COLS,
+            "month_column": self.spec["month"],
+            "order": self.spec["order"],
+            "schema": base64.b64encode(schema.serialize().to_pybytes()).decode("ascii"),
+            "partitions": dict(sorted(live.items())),
+        }
+        tmp = os.path.join(self.path, MANIFEST + ".tmp")
+        os.makedirs(self.path, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, MANIFEST))
+        self._manifest = None
+        self._remove_unreferenced()
+
+    def _remove_unreferenced(self) -> None:
+        live = {os.path.normpath(self._file(rel)) for rel in self.manifest["partitions"]}
+        for root, dirs, files in os.walk(self.path, topdown=False):
+            for name in files:
+                path = os.path.normpath(os.path.join(root, name))
+                if name.endswith(".parquet") and path not in live:
+                    os.remove(path)
+            if root != self.path and not os.listdir(root):
+                os.rmdir(root)
+
+    def write(self, df: pd.DataFrame) -> None:
+        """Replace the whole dataset with df."""
+        import pyarrow as pa
+
+        schema = _dense_schema(pa.Schema.from_pandas(df, preserve_index=False))
+        schema = pa.schema([f for f in schema if f.name not in PARTITION_COLS])
+        labels = self.partition_labels(df)
+        parts = {rel: rows for rel, rows in df.groupby(labels.to_numpy(), sort=True)}
+        self.commit(parts, list(df.columns), schema, replace_all=True)
+
+    def upsert(self, rows: pd.DataFrame, delete=()) -> dict:
+        """
+        Insert or replace `rows` (matched on the key column) and delete the
+        rows whose key is in `delete`; only partitions that gain or lose rows
+        are rewritten. Returns counts for the log.
+        """
+        key = self.spec["key"]
+        columns = self.columns
+        if list(rows.columns) != columns:
+            raise ValueError(f"Columns differ from {self.path}: {list(rows.columns)} vs {columns}")
+        replaced = pd.Index(rows[key]).append(pd.Index(list(delete)))
+        where = self.key_partitions()
+        hit = where[where.index.isin(replaced)]
+        labels = self.partition_labels(rows)
+        affected = sorted(set(labels) | set(hit))
+
+        parts = {}
+        for rel in affected:
+            old = self.read(partitions=[rel]) if rel in self.manifest["partitions"] else rows.iloc[:0]
+            old = old.loc[~old[key].isin(replaced), columns]
+            parts[rel] = pd.concat([old, rows.loc[labels == rel]], ignore_index=True)
+        self.commit(parts, columns)
+        return {
+            "inserted": int((~rows[key].isin(where.index)).sum()),
+            "updated": int(rows[key].isin(where.index).sum()),
+            "deleted": int(pd.Index(list(delete)).isin(where.index).sum()),
+            "partitions": len(affected),
+            "total_partitions": len(self.manifest["partitions"]),
+        }
+
+
+class PartitionedWriter:
+    """
+    Full rewrite of a partitioned dataset from DataFrame batches: each batch is
+    split by partition and appended to a per-partition staging file; `close`
+    loads, sorts and writes one partition at a time, so memory is bounded by
+    the largest partition rather than the table.
+    """
+
+    def __init__(self, dataset: PartitionedDataset, fallback_schema=None):
+        self.dataset = dataset
+        self.fallback_schema = fallback_schema
+        self.staging = os.path.join(dataset.path, "_staging")
+        self.writers = {}
+        self.schema = None
+        self.columns = None
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.schema is None:
+            self.columns = list(df.columns)
+            schema = _dense_schema(pa.Schema.from_pandas(df, preserve_index=False), self.fallback_schema)
+            self.schema = pa.schema([f for f in schema if f.name not in PARTITION_COLS]).remove_metadata()
+        if not len(df):
+            return
+        labels = self.dataset.partition_labels(df)
+        for rel, rows in df.groupby(labels.to_numpy(), sort=True):
+            table = pa.Table.from_pandas(rows.drop(columns=["agent_type"]), preserve_index=False)
+            table = table.select(self.schema.names).cast(self.schema)
+            if rel not in self.writers:
+                path = os.path.join(self.staging, f"{len(self.writers):05d}.parquet")
+                os.makedirs(self.staging, exist_ok=True)
+                self.writers[rel] = (path, pq.ParquetWriter(path, self.schema, compression=self.dataset.compression))
+            self.writers[rel][1].write_table(table)
+        self.rows += len(df)
+
+    def close(self) -> str:
+        import pyarrow.parquet as pq
+
+        if self.schema is None:
+            raise ValueError(f"No batches were written to {self.dataset.path}.")
+
+        def load(rel, path):
+            df = _to_pandas(pq.read_table(path))
+            df.insert(self.columns.index("agent_type"), "agent_type", _label_value(rel, "agent_type"))
+            return df
+
+        for _, writer in self.writers.values():
+            writer.close()
+        # Staging files are not in the manifest, so the commit removes them
+        self.dataset.commit({rel: (lambda rel=rel, path=path: load(rel, path)) for rel, (path, _) in self.writers.items()},
+                            self.columns, self.schema, replace_all=True)
+        return self.dataset.path
+
+
+def _to_pandas(table) -> pd.DataFrame:
+    """table.to_pandas(), but integer columns with nulls become nullable ints, not (lossy) floats."""
+    import pyarrow as pa
+
+    df = table.to_pandas()
+    for name, col in zip(table.column_names, table.columns):
+        if pa.types.is_integer(col.type) and col.null_count:
+            dtype = f"{'U' if pa.types.is_unsigned_integer(col.type) else ''}Int{col.type.bit_width}"
+            df[name] = col.to_pandas(types_mapper={col.type: pd.api.types.pandas_dtype(dtype)}.get)
+    return df
+
+
+def _label_value(rel: str, column: str):
+    value = dict(seg.split("=", 1) for seg in rel.split("/"))[column]
+    return None if value == NULL_PARTITION else unquote(value)
@@ -0,0 +1,160 @@
+"""
+Local rejection-reason pre-classifier that runs before the LLM (step 10).
+
+A TF-IDF (word 1-2 grams) + TAXONOMY keyword-count model with a linear
+classifier is trained on the manual labels of the ground-truth labeling sheet
+(Step 8). Rows whose top class probability reaches `threshold` are labeled
+locally; the rest go to the LLM. Unless `preclassifier.threshold` is set, the
+threshold is the lowest confidence at which the cross-validated predictions
+still agree with the manual labels at least `preclassifier.agreement` of the
+time.
+
+    clf = PreClassifier.from_config(cfg)   # None if there are too few labels
+    pred = clf.predict(df["body_comment"]) # category, probability, route
+"""
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from taxonomy import TAXONOMY
+
+DEFAULTS = {
+    "enabled": True,
+    "labels": "ground_truth_200_labeling_sheet.csv",  # in paths.derived_dir
+    "label_column": "manual_label",
+    "text_column": "final_blocking_comment",
+    "agreement": 0.9,
+    "threshold": None,
+    "min_labels": 50,
+    "cv_folds": 5,
+    "C": 1.0,
+}
+
+# One case-insensitive pattern per category that has keywords
+KEYWORD_PATTERNS = {
+    code: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in info["keywords"]) + r")\b", re.IGNORECASE)
+    for code, info in TAXONOMY.items() if info["keywords"]
+}
+
+
+def options(cfg: dict) -> dict:
+    opts = dict(DEFAULTS)
+    opts.update(cfg.get("preclassifier") or {})
+    return opts
+
+
+def labels_path(cfg: dict) -> str:
+    return os.path.join(cfg["paths"]["derived_dir"], options(cfg)["labels"])
+
+
+def keyword_counts(texts) -> np.ndarray:
+    """log1p of TAXONOMY keyword hits per category (one column per category with keywords)."""
+    s = pd.Series(np.asarray(texts, dtype=object)).fillna("").astype(str)
+    return np.log1p(np.column_stack([s.str.count(p).to_numpy() for p in KEYWORD_PATTERNS.values()]))
+
+
+def build_model(C: float):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import FeatureUnion, Pipeline
+    from sklearn.preprocessing import FunctionTransformer
+
+    return Pipeline([
+        ("features", FeatureUnion([
+            ("words", TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, strip_accents="unicode")),
+            ("keywords", FunctionTransformer(keyword_counts)),
+        ])),
+        ("clf", LogisticRegression(C=C, max_iter=2000, class_weight="balanced")),
+    ])
+
+
+def load_labels(cfg: dict) -> pd.DataFrame:
+    """Labeled rows of the labeling sheet: text + taxonomy code (other labels are dropped)."""
+    opts = options(cfg)
+    path = labels_path(cfg)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=["text", "label"])
+    sheet = pd.read_csv(path, dtype=str, keep_default_na=False)
+    for c in (opts["text_column"], opts["label_column"]):
+        if c not in sheet.columns:
+            raise ValueError(f"Labeling sheet {path} missing {c}. Columns: {list(sheet.columns)}")
+    out = pd.DataFrame({
+        "text": sheet[opts["text_column"]],
+        "label": sheet[opts["label_column"]].str.strip().str.upper(),
+    })
+    return out[out["label"].isin(list(TAXONOMY)) & (out["text"].str.strip() != "")].reset_index(drop=True)
+
+
+def agreement_curve(labels: pd.Series, pred: pd.Series, prob: np.ndarray) -> pd.DataFrame:
+    """For each confidence cut-off: share of rows at or above it and their agreement with the labels."""
+    order = np.argsort(-prob, kind="stable")
+    hit = (pred.to_numpy() == labels.to_numpy())[order]
+    n = np.arange(1, len(order) + 1)
+    return pd.DataFrame({"threshold": prob[order], "coverage": n / len(order), "agreement": np.cumsum(hit) / n})
+
+
+def pick_threshold(curve: pd.DataFrame, agreement: float) -> float:
+    """Lowest cut-off whose rows still agree at least `agreement`; above 1 (nothing local) if none does."""
+    # Rows tied on probability are assigned together, so only the last row of a tie is a valid cut
+    last = curve.groupby("threshold", sort=False).tail(1)
+    ok = last[last["agreement"] >= agreement]
+    return float(ok["threshold"].min()) if len(ok) else np.inf
+
+
+class PreClassifier:
+    def __init__(self, model, threshold: float, report: dict):
+        self.model = model
+        self.threshold = threshold
+        self.report = report
+
+    @classmethod
+    def from_config(cls, cfg: dict, seed: int = 42):
+        """Train on the labeling sheet; None if disabled or with fewer than `min_labels` labels."""
+        from sklearn.model_selection import KFold, cross_val_predict
+
+        opts = options(cfg)
+        if not opts["enabled"]:
+            return None
+        labels = load_labels(cfg)
+        if len(labels) < int(opts["min_labels"]) or labels["label"].nunique() < 2:
+            print(f"Pre-classifier: {len(labels)} labeled rows in {labels_path(cfg)} "
+                  f"(need {opts['min_labels']}); every row goes to the LLM.")
+            return None
+
+        model = build_model(float(opts["C"]))
+        folds = KFold(n_splits=min(int(opts["cv_folds"]), len(labels)), shuffle=True, random_state=seed)
+        proba = cross_val_predict(model, labels["text"], labels["label"], cv=folds, method="predict_proba")
+        classes = np.unique(labels["label"])  # column order of predict_proba
+        curve = agreement_curve(labels["label"], pd.Series(classes[proba.argmax(axis=1)]), proba.max(axis=1))
+        threshold = opts["threshold"]
+        threshold = float(threshold) if threshold is not None else pick_threshold(curve, float(opts["agreement"]))
+        above = curve[curve["threshold"] >= threshold]
+        report = {
+            "labels": len(labels),
+            "classes": int(labels["label"].nunique()),
+            "cv_accuracy": float(curve["agreement"].iloc[-1]),
+            "threshold": threshold,
+            "cv_coverage": float(above["coverage"].max()) if len(above) else 0.0,
+            "cv_agreement": float(above["agreement"].iloc[-1]) if len(above) else np.nan,
+        }
+        return cls(model.fit(labels["text"], labels["label"]), threshold, report)
+
+    def predict(self, texts: pd.Series) -> pd.DataFrame:
+        """local_category / local_prob / route ("local" or "llm") per row; each distinct text is scored once."""
+        codes, uniq = pd.factorize(texts.fillna("").astype(str))
+        proba = self.model.predict_proba(np.asarray(uniq, dtype=object))
+        best = proba.argmax(axis=1)
+        prob = proba[np.arange(len(uniq)), best][codes]
+        return pd.DataFrame({
+            "local_category": self.model.classes_[best][codes],
+            "local_prob": prob,
+            "route": np.where(prob >= self.threshold, "local", "llm"),
+        }, index=texts.index)
+
+    def summary(self) -> str:
+        r = self.report
+        return (f"{r['labels']} labels, {r['classes']} classes, CV accuracy {r['cv_accuracy']:.3f}; "
+                f"threshold {r['threshold']:.3f} -> CV coverage {r['cv_coverage']:.3f}, "
+                f"agreement {r['cv_agreement']:.3f}")
@@ -0,0 +1,54 @@
+"""
+Download AIDev tables into the local table cache (paths.raw_dir) up front, several
+tables at a time, each over parallel byte-range requests (see hf_cache / range_fetch).
+Tables that are already cached and current are not downloaded again, and an
+interrupted download resumes where it stopped.
+
+Usage:
+    python scripts/prefetch_tables.py                                # every table in config.yaml `tables`
+    python scripts/prefetch_tables.py commit_details review_comments
+    python scripts/prefetch_tables.py pr_commits.parquet --workers 2  # any other file of the dataset
+"""
+import argparse
+import os
+import time
+
+from hf_cache import ParquetCache
+from utils_config import load_config
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Prefetch AIDev tables into the local cache.")
+    ap.add_argument("tables", nargs="*", help="config `tables` keys or file names (default: all configured tables)")
+    ap.add_argument("--workers", type=int, help="tables downloaded at once (default: cache.prefetch_workers)")
+    args = ap.parse_args(argv)
+
+    cfg = load_config()
+    ds = cfg["aidev_hf_dataset"]
+    tables = cfg["tables"]
+    names = [tables.get(t, t) for t in args.tables] or list(tables.values())
+    workers = args.workers or int((cfg.get("cache") or {}).get("prefetch_workers", 4))
+    cache = ParquetCache.from_config(cfg)
+
+    print(f"=== Prefetch {len(names)} tables from {ds} ({workers} at a time, "
+          f"{cache.fetcher.connections} connections each) ===")
+    start = time.perf_counter()
+    results = cache.prefetch(ds, names, workers=workers)
+    elapsed = time.perf_counter() - start
+
+    failed = {name: r for name, r in results.items() if isinstance(r, Exception)}
+    total_mb = 0.0
+    for name, r in results.items():
+        if name in failed:
+            print(f"❌ {name}: {type(r).__name__}: {r}")
+        else:
+            mb = os.path.getsize(r) / 1024 ** 2
+            total_mb += mb
+            print(f"✅ {name} -> {r} ({mb:.1f} MB)")
+    print(f"{len(results) - len(failed)}/{len(results)} tables cached, {total_mb:.1f} MB in {elapsed:.1f}s")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Parallel, resumable HTTP downloads of dataset files (standard library only).
+
+- head(): ETag, size and commit of a Hugging Face `resolve` URL, read from the
+  X-Linked-* / X-Repo-Commit headers of the redirect (the file is not fetched),
+  or from the plain headers of any other HTTP server.
+- RangeFetcher.download(): files larger than one chunk are split into
+  `Range: bytes=a-b` requests served by a thread pool and written in place into
+  <dest>.part. Progress per chunk is recorded in <dest>.part.json, so an
+  interrupted download resumes where each chunk stopped. The result is checked
+  against the expected size and, when the ETag is a SHA-256 (Hugging Face LFS
+  and Xet files), its checksum before it is moved to `dest`. Servers that
+  ignore Range get one streamed request.
+"""
+import hashlib
+import http.client
+import json
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+REDIRECT_STATUS = {301, 302, 303, 307, 308}
+SHA256_RE = re.compile(r"[0-9a-f]{64}")
+SAFE_ETAG_RE = re.compile(r"[0-9A-Za-z._-]{1,128}")
+READ_BYTES = 1024 * 1024
+SAVE_EVERY = 4 * 1024 * 1024  # bytes per chunk between progress checkpoints
+
+
+class RangeNotSupported(Exception):
+    pass
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None  # surfaces the 3xx as an HTTPError with its headers
+
+
+def _clean_etag(etag: str) -> str:
+    # Quoted etags, sometimes weak ("W/...")
+    etag = (etag or "").strip()
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    return etag.strip('"')
+
+
+def hf_resolve_url(endpoint: str, repo_id: str, filename: str, revision: str = "main") -> str:
+    return (f"{endpoint.rstrip('/')}/datasets/{repo_id}/resolve/"
+            f"{urllib.parse.quote(revision, safe='')}/{urllib.parse.quote(filename)}")
+
+
+def _request(url: str, token: str = None, headers: dict = None, method: str = "GET") -> urllib.request.Request:
+    req = urllib.request.Request(url, headers={"Accept-Encoding": "identity", **(headers or {})}, method=method)
+    if token:
+        req.add_unredirected_header("Authorization", f"Bearer {token}")  # not sent on to storage redirects
+    return req
+
+
+def _retrying(fn, max_retries: int):
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_STATUS or attempt == max_retries:
+                raise
+            retry_after = e.headers.get("Retry-After")
+            time.sleep(float(retry_after) if retry_after and retry_after.isdigit() else min(2 ** attempt, 30))
+        except (urllib.error.URLError, http.client.HTTPException, TimeoutError, ConnectionError):
+            if attempt == max_retries:
+                raise
+            time.sleep(min(2 ** attempt, 30))
+
+
+def head(url: str, token: str = None, timeout: float = 60, max_retries: int = 5) -> dict:
+    """{"etag", "size", "commit"} of the file behind `url`."""
+    opener = urllib.request.build_opener(_NoRedirect)
+    host = urllib.parse.urlsplit(url).netloc
+
+    def once(u):
+        same_host = urllib.parse.urlsplit(u).netloc == host
+        try:
+            with opener.open(_request(u, token if same_host else None, method="HEAD"), timeout=timeout) as resp:
+                return resp.headers, None
+        except urllib.error.HTTPError as e:
+            if e.code not in REDIRECT_STATUS:
+                raise
+            return e.headers, urllib.parse.urljoin(u, e.headers.get("Location", ""))
+
+    for _ in range(10):
+        headers, location = _retrying(lambda: once(url), max_retries)
+        # Hub redirects to storage carry the file's metadata; other redirects are followed
+        if location and headers.get("X-Linked-Etag") is None:
+            url = location
+            continue
+        size = headers.get("X-Linked-Size") or headers.get("Content-Length")
+        etag = _clean_etag(headers.get("X-Linked-Etag") or headers.get("ETag"))
+        if not etag:  # plain server without ETag: name the content by URL, size and mtime
+            etag = f"{url}:{size}:{headers.get('Last-Modified')}"
+        if not SAFE_ETAG_RE.fullmatch(etag):  # cached files are named by etag
+            etag = hashlib.sha256(etag.encode("utf-8")).hexdigest()[:40]
+        return {"etag": etag, "size": int(size) if size else None, "commit": headers.get("X-Repo-Commit")}
+    raise IOError(f"Too many redirects for {url}")
+
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class RangeFetcher:
+    """
+    Downloads one file over up to `connections` concurrent range requests of
+    `chunk_bytes` each; see the module docstring.
+    """
+
+    def __init__(self, connections: int = 8, chunk_bytes: int = 64 * 1024 ** 2, max_retries: int = 5,
+                 timeout: float = 60, token: str = None):
+        self.connections = max(1, int(connections))
+        self.chunk_bytes = max(READ_BYTES, int(chunk_bytes))
+        self.max_retries = int(max_retries)
+        self.timeout = timeout
+        self.token = token
+
+    # ---------- resume state ----------
+
+    def _load_state(self, path: str, key: str, size: int) -> dict:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if state.get("key") != key or state.get("size") != size:
+            return None
+        return state
+
+    def _save_state(self, path: str, state: dict) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    # ---------- transfer ----------
+
+    def _fetch_chunk(self, url: str, part: str, start: int, end: int, done: int, ranged: bool, progress) -> None:
+        """
+        Write bytes [start + done, end) of the file into `part` (end=0: until EOF).
+        A failed request is retried from the last written byte; only attempts that
+        made no progress count against max_retries.
+        """
+        attempt = 0
+        while True:
+            before = done
+            headers = {"Range": f"bytes={start + done}-{end - 1}"} if ranged else {}
+            try:
+                with urllib.request.urlopen(_request(url, self.token, headers), timeout=self.timeout) as resp:
+                    if ranged and resp.status != 206:
+                        raise RangeNotSupported(url)
+                    with open(part, "r+b") as f:
+                        f.seek(start + done)
+                        unsaved = 0
+                        while not end or start + done < end:
+                            block = resp.read(min(READ_BYTES, end - start - done) if end else READ_BYTES)
+                            if not block:
+                                break
+                            f.write(block)
+                            done += len(block)
+                            unsaved += len(block)
+                            if unsaved >= SAVE_EVERY:
+                                f.flush()
+                                progress(start, done)
+                                unsaved = 0
+                        f.flush()
+                        progress(start, done)
+                if end and start + done < end:
+                    raise ConnectionError(f"Connection closed at byte {start + done} of {url}")
+                return
+            except urllib.error.HTTPError as e:
+                if e.code not in RETRY_STATUS:
+                    raise
+                error = e
+            except (urllib.error.URLError, http.client.HTTPException, TimeoutError, ConnectionError) as e:
+                error = e
+            if not ranged:
+                done = 0  # a plain GET restarts from the first byte
+            elif done > before:
+                attempt = 0
+                continue
+            attempt += 1
+            if attempt > self.max_retries:
+                raise error
+            time.sleep(min(2 ** (attempt - 1), 30))
+
+    def read_tail(self, url: str, n: int) -> bytes:
+        """
+        The last `n` bytes of `url` (fewer if the file is smaller) in one
+        suffix-range request (`bytes=-n`, e.g. a Parquet footer); the file size
+        need not be known.
+        """
+        req = _request(url, self.token, {"Range": f"bytes=-{n}"})
+
+        def once():
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                data = resp.read()
+            return data if resp.status == 206 else data[-n:]  # server ignored the range
+
+        return _retrying(once, self.max_retries)
+
+    def _accepts_ranges(self, url: str) -> bool:
+        req = _request(url, self.token, {"Range": "bytes=0-0"})
+        resp = _retrying(lambda: urllib.request.urlopen(req, timeout=self.timeout), self.max_retries)
+        with resp:
+            return resp.status == 206
+
+    def download(self, url: str, dest: str, size: int = None, sha256: str = None, key: str = None) -> None:
+        """
+        Download `url` to `dest`. `key` (e.g. the ETag) identifies the content:
+        a partial download is only resumed if it was started for the same key and size.
+        """
+        part, state_path = dest + ".part", dest + ".part.json"
+        key = key or url
+        ranged = size is not None and size > self.chunk_bytes and self.connections > 1 and self._accepts_ranges(url)
+        state = self._load_state(state_path, key, size) if size is not None else None
+        if state is None or not os.path.exists(part) or os.path.getsize(part) != size:
+            state = {"key": key, "size": size, "chunks": {}}
+            with open(part, "wb") as f:
+                if size:
+                    f.truncate(size)
+        lock = threading.Lock()
+
+        def progress(start, done):
+            with lock:
+                state["chunks"][str(start)] = done
+                if size is not None:
+                    self._save_state(state_path, state)
+
+        def run(chunks, ranged):
+            jobs = [(s, e, state["chunks"].get(str(s), 0)) for s, e in chunks]
+            jobs = [(s, e, d) for s, e, d in jobs if s + d < e or not e]
+            if len(jobs) <= 1:
+                for s, e, d in jobs:
+                    self._fetch_chunk(url, part, s, e, d, ranged, progress)
+                return
+            with ThreadPoolExecutor(max_workers=min(self.connections, len(jobs))) as pool:
+                for fut in [pool.submit(self._fetch_chunk, url, part, s, e, d, ranged, progress) for s, e, d in jobs]:
+                    fut.result()
+
+        # One stream for small files or unknown sizes; a known size still resumes with a range request
+        chunks = [(s, min(s + self.chunk_bytes, size)) for s in range(0, size, self.chunk_bytes)] if ranged \
+            else [(0, size or 0)]
+        try:
+            run(chunks, ranged or (size is not None and state["chunks"].get("0", 0) > 0))
+        except RangeNotSupported:
+            state["chunks"] = {}
+            run([(0, size)], False)
+
+        got = os.path.getsize(part)
+        if size is not None and got != size:
+            raise IOError(f"Size mismatch for {url}: expected {size} bytes, got {got}")
+        if sha256 and sha256_file(part) != sha256:
+            for p in (part, state_path):
+                if os.path.exists(p):
+                    os.remove(p)
+            raise IOError(f"Checksum mismatch for {url}: expected SHA-256 {sha256}")
+        os.replace(part, dest)
+        if os.path.exists(state_path):
+            os.remove(state_path)
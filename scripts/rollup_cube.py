@@ -0,0 +1,122 @@
+"""
+Pre-aggregated PR cube: month x agent_type x task_type x pr_outcome.
+
+Every cell holds additive statistics only, so any slice is a groupby-sum of
+cells:
+
+  - n_prs (all PRs) and n_features (PRs with commit features),
+  - <measure>_sum / <measure>_sumsq for MEASURES (mean and standard deviation),
+  - <flag>_sum for FLAGS (test/doc rates over n_features).
+
+Quantiles come from a second table of log-bucket sketches (as in DDSketch):
+a value x > 0 falls into bucket ceil(log_gamma(x)) with gamma = (1 + a) / (1 - a),
+zeros into ZERO_BUCKET. Sketches merge by adding bucket counts, and a quantile
+read from the merged buckets is within relative error `a` of the exact one.
+"""
+import numpy as np
+import pandas as pd
+
+DIMS = ["month", "agent_type", "task_type", "pr_outcome"]
+MEASURES = ["total_changes", "n_files", "n_commits"]
+FLAGS = {"touched_tests": "test_rate", "touched_docs": "doc_rate"}  # flag -> rate column
+ZERO_BUCKET = np.iinfo(np.int32).min
+
+
+def bucket_of(values: np.ndarray, accuracy: float) -> np.ndarray:
+    """Sketch bucket per value (negative values count as zero)."""
+    gamma = (1 + accuracy) / (1 - accuracy)
+    x = np.asarray(values, dtype="float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        idx = np.ceil(np.log(x) / np.log(gamma))
+    return np.where(x > 0, idx, ZERO_BUCKET).astype("int32")
+
+
+def bucket_value(buckets: np.ndarray, accuracy: float) -> np.ndarray:
+    """Representative value of each bucket: within `accuracy` of everything in it."""
+    gamma = (1 + accuracy) / (1 - accuracy)
+    b = np.asarray(buckets, dtype="int64")
+    return np.where(b == ZERO_BUCKET, 0.0, 2 * np.power(gamma, b.astype("float64")) / (gamma + 1))
+
+
+def build_cube(df: pd.DataFrame, accuracy: float) -> tuple:
+    """
+    (cube, sketches) from one row per PR with DIMS, MEASURES and FLAGS.
+    Rows without commit features (NaN measures) count in n_prs only.
+    """
+    df = df.copy()
+    has = df[MEASURES[0]].notna()
+    df["n_features"] = has.astype("int64")
+    stats = {"n_prs": (DIMS[0], "size"), "n_features": ("n_features", "sum")}
+    for m in MEASURES:
+        x = df[m].astype("float64")
+        df[f"{m}_sumsq"] = x * x
+        stats[f"{m}_sum"] = (m, "sum")
+        stats[f"{m}_sumsq"] = (f"{m}_sumsq", "sum")
+    for f in FLAGS:
+        df[f] = df[f].astype("float64")
+        stats[f"{f}_sum"] = (f, "sum")
+    cube = df.groupby(DIMS, observed=True, dropna=False, sort=True).agg(**stats).reset_index()
+
+    parts = []
+    feat = df[has]
+    for m in MEASURES:
+        part = feat[DIMS].copy()
+        part["bucket"] = bucket_of(feat[m].to_numpy(dtype="float64", na_value=0.0), accuracy)
+        part = part.groupby(DIMS + ["bucket"], observed=True, dropna=False, sort=True).size()
+        part = part.rename("count").reset_index()
+        part.insert(len(DIMS), "measure", m)
+        parts.append(part)
+    sketches = pd.concat(parts, ignore_index=True)
+    sketches["value"] = bucket_value(sketches["bucket"].to_numpy(), accuracy)
+    return cube, sketches
+
+
+def _select(df: pd.DataFrame, where: dict) -> pd.DataFrame:
+    mask = np.ones(len(df), dtype=bool)
+    for col, val in (where or {}).items():
+        vals = [val] if np.isscalar(val) or val is None else list(val)
+        mask &= df[col].isin(vals).to_numpy()
+    return df[mask]
+
+
+def _quantiles(sketches: pd.DataFrame, by: list, quantiles: list) -> pd.DataFrame:
+    keys = by + ["measure"]
+    s = (sketches.groupby(keys + ["bucket"], observed=True, dropna=False, sort=True)
+         .agg(count=("count", "sum"), value=("value", "first")).reset_index())
+    groups = s.groupby(keys, observed=True, dropna=False, sort=False)["count"]
+    cum, total = groups.cumsum(), groups.transform("sum")
+    out = []
+    for q in quantiles:
+        # Lowest bucket whose cumulative count passes rank q * (n - 1)
+        hit = s[cum > q * (total - 1)].groupby(keys, observed=True, dropna=False, sort=False).head(1)
+        wide = hit.pivot_table(index=by, columns="measure", values="value", observed=True, dropna=False)
+        name = "median" if q == 0.5 else f"p{round(q * 100):g}"
+        wide = wide.reindex(columns=[m for m in MEASURES if m in wide.columns])
+        out.append(wide.rename(columns=lambda m: f"{name}_{m}"))
+    return pd.concat(out, axis=1)
+
+
+def rollup(cube: pd.DataFrame, by: list, sketches: pd.DataFrame = None, quantiles=(0.5,),
+           where: dict = None) -> pd.DataFrame:
+    """
+    One row per `by` group (any subset of DIMS; [] = everything) with n_prs,
+    n_features, mean_/sd_<measure>, the FLAGS rates and, given the sketches,
+    median_/pNN_<measure>. `where` = {dim: value or list} selects cells first.
+    """
+    keys = list(by) or ["all"]
+    cube = _select(cube, where).assign(all="all")
+    sums = [c for c in cube.columns if c not in DIMS + ["all"]]
+    agg = cube.groupby(keys, observed=True, dropna=False, sort=True)[sums].sum()
+    n = agg["n_features"].astype("float64").where(agg["n_features"] > 0)
+    out = agg[["n_prs", "n_features"]].copy()
+    for m in MEASURES:
+        mean = agg[f"{m}_sum"] / n
+        out[f"mean_{m}"] = mean
+        var = (agg[f"{m}_sumsq"] - n * mean * mean) / (n - 1).where(n > 1)
+        out[f"sd_{m}"] = np.sqrt(var.clip(lower=0))
+    for f, rate in FLAGS.items():
+        out[rate] = agg[f"{f}_sum"] / n
+    if sketches is not None and quantiles:
+        out = out.join(_quantiles(_select(sketches, where).assign(all="all"), keys, list(quantiles)))
+    out = out.reset_index()
+    return out if by else out.drop(columns="all")
@@ -0,0 +1,372 @@
+"""
+Run the reproduction pipeline (steps 00-09, 11) in a single process. Optional
+steps (10, LLM classification) only run when named, e.g. `run_pipeline.py 10`.
+
+Each step is a node in a dependency graph. Intermediates are handed to the next
+step in memory (and still written to data/derived), and every step is
+fingerprinted from:
+  - the config keys it reads,
+  - the hashes of its upstream artifacts (and of the cached raw tables it reads),
+  - the source of the script and of the helper modules it imports.
+Steps whose fingerprint matches the last successful run are skipped, so e.g.
+changing `ground_truth_seed` only reruns steps 05-07.
+
+Usage:
+    python scripts/run_pipeline.py               # run what is stale
+    python scripts/run_pipeline.py --dry-run     # show what would run
+    python scripts/run_pipeline.py --force 02    # rerun 02 (downstream reruns if its output changed)
+"""
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import sys
+from contextlib import nullcontext
+
+from utils_config import load_config, config_value
+from derived_io import derived_path, enable_memory_handoff
+from hf_cache import ParquetCache
+from instrument import run_report
+from partitioned_io import MANIFEST
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = ".pipeline_state.json"
+
+COMMON_KEYS = ["intermediates", "paths.derived_dir"]
+HF_KEYS = ["aidev_hf_dataset", "cache.revision"]
+TEXT_STORE = "aidev_pop_ge500_review_comment_text.parquet"  # text_store.STORE_FILE
+TEXT_INDEX = "aidev_pop_ge500_text_index.sqlite"  # text_index.INDEX_FILE
+LABELING_SHEET = "ground_truth_200_labeling_sheet.csv"  # Step 8, filled in by hand (preclassifier.labels)
+
+# name -> script (+ args), config keys read, raw tables read, derived inputs, outputs
+STAGES = {
+    "00": {
+        "script": "00_sanity_check_tables.py",
+        "config": HF_KEYS,
+        "tables": [],  # reads footers only; cached blobs appear after it runs, which would make it stale
+        "inputs": [],
+        "outputs": [],
+    },
+    "01": {
+        "script": "01_build_aidev_pop_agent_prs.py",
+        "config": HF_KEYS + COMMON_KEYS + ["min_stars", "agents", "time_window", "backend"],
+        "tables": ["pull_request", "repository"],
+        "inputs": [],
+        "outputs": ["aidev_pop_ge500_agent_prs", "aidev_key_index_repos", "aidev_key_index_prs"],
+        "after": ["00"],
+    },
+    "01-sweep": {
+        "script": "01_build_aidev_pop_agent_prs.py",
+        "args": ["--sweep"],
+        "config": HF_KEYS + COMMON_KEYS + ["min_stars", "agents", "time_window", "sweep"],
+        "tables": ["pull_request", "repository"],
+        "inputs": ["aidev_key_index_repos", "aidev_key_index_prs"],
+        "outputs": ["aidev_sweep_agent_prs", "aidev_sweep_summary"],
+        "optional": True,  # robustness checks, not part of the reproduction
+    },
+    "02": {
+        "script": "02_build_review_comments_with_task_type.py",
+        "config": HF_KEYS + COMMON_KEYS + ["streaming", "text_store", "backend"],
+        "tables": ["review_comments"],
+        "inputs": ["aidev_pop_ge500_agent_prs", "aidev_key_index_repos", "aidev_key_index_prs"],
+        "outputs": ["aidev_pop_ge500_pr_review_comments_with_task_type", TEXT_STORE],
+    },
+    "03": {
+        "script": "03_build_commented_raprs_pr_level.py",
+        "config": COMMON_KEYS + ["backend"],
+        "tables": [],
+        "inputs": ["aidev_pop_ge500_pr_review_comments_with_task_type", "aidev_pop_ge500_agent_prs"],
+        "outputs": ["aidev_pop_ge500_commented_raprs_pr_level"],
+    },
+    "04": {
+        "script": "04_build_pr_commit_features.py",
+        "config": HF_KEYS + COMMON_KEYS + ["commit_features"],
+        "tables": ["commit_details"],
+        "inputs": ["aidev_pop_ge500_agent_prs"],
+        "outputs": ["aidev_pop_ge500_pr_features"],
+    },
+    "05": {
+        "script": "05_sample_ground_truth_200_raprs.py",
+        "config": COMMON_KEYS + ["ground_truth_seed"],
+        "tables": [],
+        "inputs": ["aidev_pop_ge500_commented_raprs_pr_level"],
+        "outputs": ["ground_truth_200_commented_raprs_pr_level", "ground_truth_200_manifest.txt"],
+    },
+    "05-replicates": {
+        "script": "05_sample_ground_truth_200_raprs.py",
+        "args": ["--replicates"],
+        "config": COMMON_KEYS + ["ground_truth_seed", "ground_truth_replicates"],
+        "tables": [],
+        "inputs": ["aidev_pop_ge500_commented_raprs_pr_level"],
+        "outputs": ["ground_truth_200_replicates.npz"],
+        "optional": True,  # label-stability analysis, not part of the reproduction
+    },
+    "06": {
+        "script": "06_export_ground_truth_200_review_comments.py",
+        "config": COMMON_KEYS,
+        "tables": [],
+        "inputs": ["ground_truth_200_commented_raprs_pr_level", "aidev_pop_ge500_pr_review_comments_with_task_type"],
+        "outputs": ["ground_truth_200_review_comments"],
+    },
+    "07": {
+        "script": "07_final_blocking_comment_per_pr.py",
+        "config": COMMON_KEYS,
+        "tables": [],
+        "inputs": ["ground_truth_200_review_comments", TEXT_STORE],
+        "outputs": ["ground_truth_200_final_blocking_comment"],
+    },
+    "07-all": {
+        "script": "07_final_blocking_comment_per_pr.py",
+        "args": ["--scope", "all"],
+        "config": COMMON_KEYS,
+        "tables": [],
+        "inputs": ["aidev_pop_ge500_pr_review_comments_with_task_type", TEXT_STORE],
+        "outputs": ["aidev_pop_ge500_final_blocking_comment"],
+    },
+    "09": {
+        "script": "09_fit_repo_fixed_effects.py",
+        "config": COMMON_KEYS + ["repo_fixed_effects"],
+        "tables": [],
+        "inputs": ["aidev_pop_ge500_agent_prs", "aidev_pop_ge500_pr_features"],
+        "outputs": ["rejection_model_odds_ratios"],
+    },
+    "11": {
+        "script": "11_build_text_index.py",
+        "config": COMMON_KEYS + ["text_index"],
+        "tables": [],
+        "inputs": ["aidev_pop_ge500_agent_prs", "aidev_pop_ge500_pr_review_comments_with_task_type", TEXT_STORE],
+        "outputs": [TEXT_INDEX],
+    },
+    "12": {
+        "script": "12_build_rollup_cube.py",
+        "config": COMMON_KEYS + ["rollup_cube"],
+        "tables": [],
+        "inputs": ["aidev_pop_ge500_agent_prs", "aidev_pop_ge500_pr_features"],
+        "outputs": ["aidev_rollup_cube", "aidev_rollup_sketches"],
+    },
+    "13": {
+        "script": "13_cluster_review_comments.py",
+        "config": COMMON_KEYS + ["comment_clusters", "seed"],
+        "tables": [],
+        "inputs": ["aidev_pop_ge500_pr_review_comments_with_task_type", TEXT_STORE],
+        "outputs": ["aidev_pop_ge500_review_comment_clusters", "aidev_pop_ge500_review_comment_cluster_summary"],
+    },
+    "10-triage": {
+        "script": "10_classify_rejections_llm.py",
+        "args": ["--triage-only"],
+        "config": COMMON_KEYS + ["preclassifier", "comment_clusters.propagate_labels", "seed"],
+        "tables": [],
+        "inputs": ["aidev_pop_ge500_pr_review_comments_with_task_type", "aidev_pop_ge500_agent_prs", TEXT_STORE,
+                   LABELING_SHEET, "aidev_pop_ge500_review_comment_clusters"],
+        "outputs": ["pr_preclassifications"],
+        "optional": True,  # needs the manual labels of the labeling sheet
+    },
+    "10": {
+        "script": "10_classify_rejections_llm.py",
+        "config": COMMON_KEYS + ["llm", "preclassifier", "comment_clusters.propagate_labels", "seed"],
+        "tables": [],
+        "inputs": ["aidev_pop_ge500_pr_review_comments_with_task_type", "aidev_pop_ge500_agent_prs", TEXT_STORE,
+                   LABELING_SHEET, "aidev_pop_ge500_review_comment_clusters"],
+        "outputs": ["pr_classifications_results"],
+        "optional": True,  # paid API calls: only run when named on the command line
+    },
+}
+
+
+def artifact_path(cfg: dict, name: str) -> str:
+    # Names with an extension are plain files; the rest are intermediates in the configured format
+    if os.path.splitext(name)[1]:
+        return os.path.join(cfg["paths"]["derived_dir"], name)
+    return derived_path(cfg, name)
+
+
+def producers() -> dict:
+    return {out: name for name, st in STAGES.items() for out in st["outputs"]}
+
+
+def upstream(name: str) -> list:
+    prod = producers()
+    deps = {prod[i] for i in STAGES[name]["inputs"] if i in prod}
+    deps.update(STAGES[name].get("after", []))
+    return sorted(deps)
+
+
+def topo_order() -> list:
+    order, seen = [], set()
+
+    def visit(n):
+        if n in seen:
+            return
+        seen.add(n)
+        for d in upstream(n):
+            visit(d)
+        order.append(n)
+
+    for n in sorted(STAGES):
+        visit(n)
+    return order
+
+
+def file_hash(path: str, memo: dict) -> str:
+    # Content hash, memoized on (size, mtime) so unchanged artifacts are not re-read
+    if os.path.isdir(path):
+        path = os.path.join(path, MANIFEST)  # partitioned dataset: the manifest holds each file's SHA-256
+    st = os.stat(path)
+    stamp = f"{st.st_size}:{st.st_mtime_ns}"
+    if memo.get(path, {}).get("stamp") == stamp:
+        return memo[path]["sha256"]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            h.update(chunk)
+    memo[path] = {"stamp": stamp, "sha256": h.hexdigest()}
+    return memo[path]["sha256"]
+
+
+def local_imports(path: str) -> list:
+    """scripts/*.py modules imported by `path`, directly or through other local modules."""
+    seen, stack = set(), [path]
+    while stack:
+        src = open(stack.pop(), "rb").read()
+        # Module-level and function-level imports (e.g. derived_io -> partitioned_io)
+        for mod in re.findall(rb"^\s*(?:from|import) (\w+)", src, flags=re.M):
+            helper = os.path.join(SCRIPTS_DIR, mod.decode() + ".py")
+            if helper not in seen and helper != path and os.path.exists(helper):
+                seen.add(helper)
+                stack.append(helper)
+    return sorted(seen)
+
+
+def source_hash(script: str) -> str:
+    # Script source plus every local helper module it depends on (utils_hf, derived_io, partitioned_io, ...)
+    h = hashlib.sha256()
+    path = os.path.join(SCRIPTS_DIR, script)
+    h.update(open(path, "rb").read())
+    for helper in local_imports(path):
+        h.update(os.path.basename(helper).encode("utf-8"))
+        h.update(open(helper, "rb").read())
+    return h.hexdigest()
+
+
+def fingerprint(name: str, cfg: dict, cache: ParquetCache, memo: dict):
+    st = STAGES[name]
+    parts = {
+        "config": {k: config_value(cfg, k) for k in st["config"]},
+        "source": source_hash(st["script"]),
+        "inputs": {},
+        "tables": {},
+    }
+    for i in st["inputs"]:
+        p = artifact_path(cfg, i)
+        if not os.path.exists(p):
+            return None  # upstream not built yet
+        parts["inputs"][i] = file_hash(p, memo)
+    for tname in st["tables"]:
+        # Cached blobs are named by content hash; no network access needed
+        blob = cache.lookup(cfg["aidev_hf_dataset"], cfg["tables"][tname])
+        parts["tables"][tname] = os.path.basename(blob) if blob else None
+    blob = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def run_stage(name: str) -> None:
+    script = STAGES[name]["script"]
+    args = STAGES[name].get("args", [])
+    spec = importlib.util.spec_from_file_location(f"stage_{name}", os.path.join(SCRIPTS_DIR, script))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    argv = sys.argv
+    sys.argv = [script] + args
+    try:
+        module.main()
+    finally:
+        sys.argv = argv
+
+
+def load_state(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(path: str, state: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run pipeline steps, skipping up-to-date ones.")
+    ap.add_argument("stages", nargs="*", help="Target steps (default: all but optional ones). Upstream steps run if stale.")
+    ap.add_argument("--force", nargs="*", metavar="STEP", help="Rerun these steps (all if none given).")
+    ap.add_argument("--dry-run", action="store_true", help="Only report which steps are stale.")
+    args = ap.parse_args()
+
+    cfg = load_config()
+    cache = ParquetCache.from_config(cfg)
+    derived_dir = cfg["paths"]["derived_dir"]
+    os.makedirs(derived_dir, exist_ok=True)
+    state_path = os.path.join(derived_dir, STATE_FILE)
+    state = load_state(state_path)
+    memo = state.setdefault("_file_hashes", {})
+
+    unknown = [s for s in (args.stages or []) + (args.force or []) if s not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown steps {unknown}. Known: {sorted(STAGES)}")
+
+    # Targets plus everything they depend on
+    wanted = set()
+    stack = list(args.stages or [n for n, st in STAGES.items() if not st.get("optional")])
+    while stack:
+        n = stack.pop()
+        if n not in wanted:
+            wanted.add(n)
+            stack.extend(upstream(n))
+    forced = set(wanted) if args.force == [] else set(args.force or [])
+
+    enable_memory_handoff()
+    stale = set()
+    print("=== Pipeline ===")
+    # One run report for all steps run below (not for --dry-run)
+    with (nullcontext() if args.dry_run else run_report(cfg)) as run:
+        for name in topo_order():
+            if name not in wanted:
+                continue
+            st = STAGES[name]
+            fp = fingerprint(name, cfg, cache, memo)
+            prev = state.get(name, {})
+            outputs_ok = all(os.path.exists(artifact_path(cfg, o)) for o in st["outputs"])
+            up_to_date = fp is not None and prev.get("fingerprint") == fp and outputs_ok and name not in forced
+
+            if args.dry_run:
+                # Without running, a stale upstream step makes everything below it stale too
+                if up_to_date and not stale.intersection(upstream(name)):
+                    print(f"[{name}] up to date ({st['script']})")
+                else:
+                    stale.add(name)
+                    print(f"[{name}] stale: would run {st['script']}")
+                continue
+            if up_to_date:
+                print(f"[{name}] up to date, skipping ({st['script']})")
+                if run is not None:
+                    run["skipped"].append(name)
+                continue
+
+            print(f"\n[{name}] running {st['script']}")
+            run_stage(name)
+            # Inputs exist now; recompute so the stored fingerprint matches what was consumed
+            state[name] = {
+                "fingerprint": fingerprint(name, cfg, cache, memo),
+                "outputs": {o: file_hash(artifact_path(cfg, o), memo) for o in st["outputs"]},
+            }
+            save_state(state_path, state)
+
+    print("\n✅ Pipeline complete.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Query the full-text index built by script 11 (text_index.py) from the command line.
+
+Usage:
+    python scripts/search_text_index.py '"not what was asked" OR "scope mismatch"'
+    python scripts/search_text_index.py 'rebase AND NOT conflict' --agent-type Devin Copilot --outcome REJECTED
+    python scripts/search_text_index.py '"please add tests"' --field comment --task-type bugfix --limit 50
+
+Prints the matching PRs (full_name, number, filter columns and the number of
+matching documents), most matches first.
+"""
+import argparse
+import time
+
+from text_index import FIELDS, TextIndex, index_path
+from utils_config import load_config
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Phrase/boolean search over review comments and PR titles/bodies.")
+    ap.add_argument("query", help='words, "phrases", AND / OR / NOT, parentheses')
+    ap.add_argument("--agent-type", nargs="+", help="e.g. Devin Copilot")
+    ap.add_argument("--task-type", nargs="+", help="e.g. bugfix feature docs")
+    ap.add_argument("--outcome", nargs="+", help="pr_outcome: MERGED REJECTED OPEN")
+    ap.add_argument("--field", nargs="+", choices=sorted(FIELDS), help="documents to search (default: all)")
+    ap.add_argument("--limit", type=int, default=20, help="rows to print (0 = all)")
+    args = ap.parse_args(argv)
+
+    cfg = load_config()
+    index = TextIndex(index_path(cfg))
+    try:
+        start = time.perf_counter()
+        hits = index.search(args.query, agent_type=args.agent_type, task_type=args.task_type,
+                            pr_outcome=args.outcome, field=args.field)
+        elapsed = (time.perf_counter() - start) * 1000
+    finally:
+        index.close()
+
+    print(f"{len(hits)} PRs ({hits['n_docs'].sum()} documents) in {elapsed:.1f} ms")
+    if len(hits):
+        print((hits.head(args.limit) if args.limit else hits).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+Out-of-core execution of steps 01-03 with DuckDB (`backend.engine: duckdb`).
+
+The same filters, joins and aggregates as the pandas code in the step scripts,
+run as SQL directly over the Parquet files. DuckDB uses all cores
+(`backend.threads`) and spills to `backend.temp_dir` once `backend.memory_limit`
+is reached, so the tables never have to fit in pandas memory. Results are
+streamed out in record batches through DerivedWriter, which applies the same
+dtype policy as write_derived. check_backend_parity.py compares the outputs
+with the pandas path.
+
+Requires the optional `duckdb` package (pip install duckdb).
+"""
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from derived_io import DerivedWriter, derived_path
+from instrument import span
+from key_index import load_key_index, update_key_index
+from task_type_rules import infer_task_types
+from text_store import TextStoreWriter
+from utils_hf import read_parquet_metadata_hf
+
+DEFAULT_TEMP_DIR = os.path.join("data", "raw", "duckdb_tmp")
+PR_URL_PATTERN = r"repos/(?P<full_name>[^/]+/[^/]+)/pulls/(?P<number>\d+)"
+
+
+def enabled(cfg: dict) -> bool:
+    engine = str((cfg.get("backend") or {}).get("engine", "pandas")).lower()
+    if engine not in ("pandas", "duckdb"):
+        raise ValueError(f"backend.engine must be 'pandas' or 'duckdb', got {engine!r}")
+    return engine == "duckdb"
+
+
+def connect(cfg: dict):
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("backend.engine 'duckdb' needs the duckdb package: pip install duckdb") from e
+    if not derived_path(cfg, "").endswith(".parquet"):
+        raise ValueError("backend.engine 'duckdb' reads intermediates as Parquet; set intermediates.format: parquet")
+    if str((cfg.get("intermediates") or {}).get("layout", "flat")).lower() != "flat":
+        raise ValueError("backend.engine 'duckdb' reads single-file intermediates; set intermediates.layout: flat")
+
+    opts = cfg.get("backend") or {}
+    temp_dir = opts.get("temp_dir") or DEFAULT_TEMP_DIR
+    os.makedirs(temp_dir, exist_ok=True)
+    con = duckdb.connect()
+    con.execute("SET TimeZone = 'UTC'")  # naive timestamps are UTC, as in pd.to_datetime(utc=True)
+    con.execute("SET preserve_insertion_order = false")  # every result below has an explicit ORDER BY
+    con.execute(f"SET temp_directory = '{_lit(temp_dir)}'")
+    if opts.get("memory_limit"):
+        con.execute(f"SET memory_limit = '{_lit(opts['memory_limit'])}'")
+    if opts.get("threads"):
+        con.execute(f"SET threads = {int(opts['threads'])}")
+    return con
+
+
+def _q(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _lit(value) -> str:
+    return str(value).replace("'", "''")
+
+
+def _scan(path: str) -> str:
+    return f"read_parquet('{_lit(path)}', file_row_number = true)"
+
+
+def _suffixed(left: list, right: list, suffixes: tuple, on: str) -> tuple:
+    """Output names of pd.merge(left, right, on=on, suffixes=suffixes) for each side."""
+    overlap = (set(left) & set(right)) - {on}
+    lnames = [c + suffixes[0] if c in overlap else c for c in left]
+    rnames = [c + suffixes[1] if c in overlap else c for c in right if c != on]
+    return lnames, [c for c in right if c != on], rnames
+
+
+def _index_tables(con, index) -> None:
+    con.register("idx_repos", index.repos[["repo_key", "full_name"]])
+    con.register("idx_prs", index.prs[["pr_key", "repo_key", "number"]])
+
+
+def _pr_key_join(alias: str) -> str:
+    # Same lookup as KeyIndex.pr_keys: -1 for PRs that are not in the index
+    return (
+        f"LEFT JOIN idx_repos ir ON ir.full_name = {alias}.full_name "
+        f"LEFT JOIN idx_prs ip ON ip.repo_key = ir.repo_key AND ip.number = {alias}.number"
+    )
+
+
+def _ts_units(schema: pa.Schema, names: dict) -> dict:
+    """Output column -> unit of its source timestamp column (names: source -> output)."""
+    return {
+        out: schema.field(src).type.unit for src, out in names.items()
+        if src in schema.names and pa.types.is_timestamp(schema.field(src).type)
+    }
+
+
+def _write(con, cfg: dict, name: str, query: str, units: dict, batch_size: int, transform=None) -> tuple:
+    """
+    Stream `query` into intermediate `name`; returns (path, rows, columns).
+
+    DuckDB timestamps are microseconds; `units` restores the unit pandas keeps
+    from the source file (e.g. ns). Sub-microsecond digits are not preserved.
+    `transform` is applied to each pandas batch before it is written.
+    """
+    reader = con.execute(query).fetch_record_batch(batch_size)
+    writer = DerivedWriter(cfg, name, fallback_schema=reader.schema)
+
+    def convert(table_or_batch) -> pd.DataFrame:
+        df = table_or_batch.to_pandas()
+        for c, unit in units.items():
+            if c in df.columns:
+                ts = pd.to_datetime(df[c], utc=True)  # naive source columns are UTC, as in apply_dtypes
+                df[c] = ts.dt.as_unit(unit)
+        return transform(df) if transform is not None else df
+
+    n_batches = 0
+    for batch in reader:
+        df = convert(batch)
+        writer.write(df)
+        n_batches += 1
+    if n_batches == 0:
+        df = convert(reader.schema.empty_table())
+        writer.write(df)
+    return writer.close(), writer.rows, list(df.columns)
+
+
+def _batch_size(cfg: dict) -> int:
+    return int((cfg.get("backend") or {}).get("batch_size", 100_000))
+
+
+def build_agent_prs(cfg: dict, cache, agent_col: str, window_end) -> tuple:
+    """Step 01. Returns (path, rows, columns, outcome counts, agent counts)."""
+    ds, t = cfg["aidev_hf_dataset"], cfg["tables"]
+    pr_file = cache.path_for(ds, t["pull_request"])
+    repo_file = cache.path_for(ds, t["repository"])
+    pr_schema = read_parquet_metadata_hf(ds, t["pull_request"], cache=cache).schema.to_arrow_schema()
+    con = connect(cfg)
+
+    # PR columns as script 01 builds them: id -> id_pr, parsed timestamps, agent_type, outcome
+    exprs = {}
+    for field in pr_schema:
+        if field.name in ("created_at", "closed_at", "merged_at"):
+            cast = "CAST" if pa.types.is_timestamp(field.type) else "TRY_CAST"
+            exprs[field.name] = f"{cast}({_q(field.name)} AS TIMESTAMPTZ)"
+        else:
+            exprs["id_pr" if field.name == "id" else field.name] = _q(field.name)
+    exprs["agent_type"] = "CAST(__agent AS VARCHAR)"
+    exprs["turnaround_time_hours"] = "(epoch_us(closed_at) - epoch_us(created_at)) / 1e6 / 3600.0"
+    exprs["pr_outcome"] = (
+        "CASE WHEN merged_at IS NOT NULL THEN 'MERGED' "
+        "WHEN lower(CAST(state AS VARCHAR)) = 'closed' THEN 'REJECTED' ELSE 'OPEN' END"
+    )
+    pr_cols = list(exprs)
+    lnames, rcols, rnames = _suffixed(pr_cols, ["id", "full_name", "stars"], ("", "_repo"), on="__none__")
+    joined = [(f"p.{_q(c)}", n) for c, n in zip(pr_cols, lnames)]
+    joined += [(f"r.{_q(c)}", n) for c, n in zip(rcols, rnames) if n not in ("id", "id_repo")]
+
+    time_filter = "AND created_at < CAST($2 AS TIMESTAMPTZ)" if window_end is not None else ""
+    params = [sorted(cfg["agents"])] + ([window_end.isoformat()] if window_end is not None else [])
+    with span("query_prs") as sp:
+        # The parsed timestamps are computed once in `parsed`; derived columns use them
+        base = ", ".join(
+            f"{exprs[c]} AS {_q(c)}" for c in pr_cols
+            if c not in ("agent_type", "turnaround_time_hours", "pr_outcome")
+        )
+        derived = ", ".join(f"{exprs[c]} AS {_q(c)}" for c in ("agent_type", "turnaround_time_hours", "pr_outcome"))
+        con.execute(
+            f"CREATE TEMP TABLE popular AS SELECT id, full_name, stars "
+            f"FROM read_parquet('{_lit(repo_file)}') WHERE stars >= $1",
+            [int(cfg["min_stars"])],
+        )
+        con.execute(
+            f"""
+            CREATE TEMP TABLE agent_prs AS
+            WITH parsed AS (
+                SELECT {base}, {_q(agent_col)} AS __agent, repo_id AS __repo_id, file_row_number AS __rn
+                FROM {_scan(pr_file)}
+            ),
+            p AS (
+                SELECT *, {derived} FROM parsed
+                WHERE list_contains($1, CAST(__agent AS VARCHAR))
+                  AND __repo_id IN (SELECT id FROM popular) {time_filter}
+            )
+            SELECT {", ".join(f"{e} AS {_q(n)}" for e, n in joined)}, p.__rn
+            FROM p LEFT JOIN popular r ON p.__repo_id = r.id
+            """,
+            params,
+        )
+        sp.rows_out = con.execute("SELECT count(*) FROM agent_prs").fetchone()[0]
+
+    # Key index (append-only): only the key columns are pulled into pandas
+    key_cols = [c for c in ["full_name", "number", "id_pr"] if c in [n for _, n in joined]]
+    with span("key_index", rows_in=sp.rows_out):
+        keys = con.execute(f"SELECT {', '.join(map(_q, key_cols))} FROM agent_prs ORDER BY __rn").df()
+        _index_tables(con, update_key_index(cfg, keys))
+
+    lead = ["pr_key", "id_pr", "repo_id", "full_name", "stars", "number", "agent_type",
+            "created_at", "closed_at", "merged_at", "turnaround_time_hours", "state", "pr_outcome", "title", "body"]
+    out_cols = [n for _, n in joined] + ["pr_key"]
+    out_cols = [c for c in lead if c in out_cols] + [c for c in out_cols if c not in lead]
+    select = ", ".join("COALESCE(ip.pr_key, -1) AS pr_key" if c == "pr_key" else f"a.{_q(c)}" for c in out_cols)
+
+    with span("write", rows_in=sp.rows_out):
+        out_path, n_rows, columns = _write(
+            con, cfg, "aidev_pop_ge500_agent_prs",
+            f"SELECT {select} FROM agent_prs a {_pr_key_join('a')} ORDER BY a.__rn",
+            _ts_units(pr_schema, {c: c for c in ("created_at", "closed_at", "merged_at")}),
+            _batch_size(cfg),
+        )
+    counts = {
+        c: pd.Series(dict(con.execute(
+            f"SELECT {_q(c)}, count(*) AS n FROM agent_prs GROUP BY ALL ORDER BY n DESC, {_q(c)}"
+        ).fetchall()), dtype="int64", name="count")
+        for c in ["pr_outcome", "agent_type"]
+    }
+    con.close()
+    return out_path, n_rows, columns, counts["pr_outcome"], counts["agent_type"]
+
+
+def build_review_comments(cfg: dict, cache, out_name: str) -> tuple:
+    """Step 02. Returns (path, rows, columns, task type counts)."""
+    ds, t = cfg["aidev_hf_dataset"], cfg["tables"]
+    comments_file = cache.path_for(ds, t["review_comments"])
+    comment_schema = read_parquet_metadata_hf(ds, t["review_comments"], cache=cache).schema.to_arrow_schema()
+    comment_cols = comment_schema.names
+    if "pull_request_url" not in comment_cols:
+        raise ValueError(
+            "Expected 'pull_request_url' in comments table.\n"
+            f"Available columns: {comment_cols}"
+        )
+    pr_path = derived_path(cfg, "aidev_pop_ge500_agent_prs")
+    pr_cols = pq.read_schema(pr_path).names
+    for c in ["pr_outcome", "full_name", "number", "pr_key"]:
+        if c not in pr_cols:
+            raise ValueError(f"PR dataset missing {c}. Columns: {pr_cols}")
+
+    con = connect(cfg)
+    _index_tables(con, load_key_index(cfg))
+    # Only the RAPR columns script 02 carries onto comment rows; the rest stay in the PR table
+    rcols = [c for c in ["agent_type", "title"] if c in pr_cols]
+    con.execute(
+        f"CREATE TEMP TABLE rapr AS SELECT {', '.join(map(_q, ['pr_key'] + rcols))} "
+        f"FROM read_parquet('{_lit(pr_path)}') WHERE pr_outcome = 'REJECTED' AND number IS NOT NULL"
+    )
+    print("Rejected APRs (RAPRs):", con.execute("SELECT count(*) FROM rapr").fetchone()[0])
+
+    # Comment columns after extract_pr_keys; names shared with PR columns get _comment (as in script 02)
+    left = comment_cols + [c for c in ["full_name", "number", "pr_key"] if c not in comment_cols]
+    shared = set(pr_cols) - {"full_name", "number", "pr_key"}
+    lnames = [c + "_comment" if c in shared else c for c in left]
+    select = [f"c.{_q(c)} AS {_q(n)}" for c, n in zip(left, lnames)]
+    rnames = [c for c in rcols if c == "agent_type"]
+    select += [f"r.{_q(c)}" for c in rnames]
+
+    # task_type: each distinct RAPR title classified once in Python, then joined
+    task_join = ""
+    if "title" in rcols:
+        titles = con.execute("SELECT DISTINCT title FROM rapr WHERE title IS NOT NULL").df()
+        titles["task_type"] = infer_task_types(titles["title"]).to_numpy()
+        con.register("title_task_type", titles)
+        task_join = "LEFT JOIN title_task_type tt ON tt.title = r.title"
+        select.append("COALESCE(tt.task_type, 'unknown') AS task_type")
+    else:
+        select.append("'unknown' AS task_type")
+
+    url = "CAST(pull_request_url AS VARCHAR)"
+    comment_select = ", ".join(_q(c) for c in comment_cols if c not in ("full_name", "number"))
+    with span("query_comments"):
+        con.execute(
+            f"""
+            CREATE TEMP TABLE comments AS
+            WITH k AS (
+                SELECT {comment_select},
+                       regexp_extract({url}, '{_lit(PR_URL_PATTERN)}', 1) AS full_name,
+                       TRY_CAST(regexp_extract({url}, '{_lit(PR_URL_PATTERN)}', 2) AS BIGINT) AS number,
+                       file_row_number AS __rn
+                FROM {_scan(comments_file)}
+            ),
+            c AS (
+                SELECT k.*, ip.pr_key
+                FROM k {_pr_key_join('k')}
+                WHERE k.full_name <> '' AND k.number IS NOT NULL
+                  AND ip.pr_key IN (SELECT pr_key FROM rapr)
+            )
+            SELECT {", ".join(select)}, c.__rn
+            FROM c LEFT JOIN rapr r ON r.pr_key = c.pr_key {task_join}
+            """
+        )
+    out_cols = lnames + rnames + ["task_type"]
+    store = TextStoreWriter(cfg)  # heavy text columns -> side store, as in script 02
+    with span("write"):
+        out_path, n_rows, columns = _write(
+            con, cfg, out_name, f"SELECT {', '.join(map(_q, out_cols))} FROM comments ORDER BY __rn",
+            _ts_units(comment_schema, dict(zip(left, lnames))),
+            _batch_size(cfg), transform=store.externalize,
+        )
+        print("✅ Wrote:", store.close())
+    print("Text store:", store.summary())
+    print("Review comments on RAPRs:", n_rows)
+    task_counts = pd.Series(dict(con.execute(
+        "SELECT task_type, count(*) AS n FROM comments GROUP BY ALL ORDER BY n DESC, task_type"
+    ).fetchall()), dtype="int64", name="count")
+    con.close()
+    return out_path, n_rows, columns, task_counts
+
+
+def build_commented_raprs(cfg: dict, comments_name: str, pr_name: str, out_name: str) -> tuple:
+    """Step 03. Returns (path, rows, task_type_majority counts)."""
+    comments_path, pr_path = derived_path(cfg, comments_name), derived_path(cfg, pr_name)
+    comment_schema, pr_schema = pq.read_schema(comments_path), pq.read_schema(pr_path)
+    ccols, pr_cols = comment_schema.names, pr_schema.names
+    body_col = "body_comment_ref" if "body_comment_ref" in ccols else "body_comment"
+    missing = [c for c in ["pr_key", "task_type", "created_at_comment", "user_comment", body_col] if c not in ccols]
+    if missing:
+        raise ValueError(f"Comments dataset missing {missing}. Columns: {ccols}")
+    if "pr_key" not in pr_cols:
+        raise ValueError(f"PR dataset missing pr_key. Columns: {pr_cols}")
+    con = connect(cfg)
+
+    # Same aggregates as script 03
+    aggs = {
+        "n_comments": f"count({_q(body_col)})",
+        "n_unique_commenters": f"count(DISTINCT {_q('user_comment')})",
+        "first_comment_at": f"min({_q('created_at_comment')})",
+        "last_comment_at": f"max({_q('created_at_comment')})",
+    }
+    # Majority task type: most frequent, ties to the value seen first in the comments file
+    majority = """
+        maj AS (
+            SELECT pr_key, task_type AS task_type_majority FROM (
+                SELECT pr_key, task_type, count(*) AS n, min(file_row_number) AS first_rn
+                FROM c WHERE task_type IS NOT NULL GROUP BY ALL
+            ) QUALIFY row_number() OVER (PARTITION BY pr_key ORDER BY n DESC, first_rn) = 1
+        )"""
+    maj_col, maj_join = "maj.task_type_majority", "LEFT JOIN maj USING (pr_key)"
+
+    per_pr = ["pr_key"] + list(aggs) + ["task_type_majority"]
+    lnames, rcols, rnames = _suffixed(per_pr, pr_cols, ("", "_pr"), on="pr_key")
+    lead = ["pr_key", "full_name", "number"]
+    names = lnames + rnames
+    exprs = dict(zip(lnames, ["a.pr_key"] + [f"a.{_q(n)}" for n in list(aggs)] + [maj_col]))
+    exprs.update({n: f"p.{_q(c)}" for c, n in zip(rcols, rnames)})
+    out_cols = lead + [c for c in names if c not in lead]
+
+    with span("aggregate"):
+        con.execute(
+            f"""
+            CREATE TEMP TABLE raprs AS
+            WITH c AS (SELECT * FROM {_scan(comments_path)}),
+            a AS (
+                SELECT pr_key, {", ".join(f"{e} AS {_q(n)}" for n, e in aggs.items())}
+                FROM c WHERE pr_key IS NOT NULL GROUP BY pr_key
+            ),
+            p AS (SELECT * FROM read_parquet('{_lit(pr_path)}') WHERE pr_outcome = 'REJECTED'),
+            {majority}
+            SELECT {", ".join(f"{exprs[c]} AS {_q(c)}" for c in out_cols)}
+            FROM a {maj_join} LEFT JOIN p ON p.pr_key = a.pr_key
+            """
+        )
+    # Row order as in script 03: groupby (pr_key) order, then a stable sort by (full_name, number)
+    with span("write"):
+        out_path, n_rows, _ = _write(
+            con, cfg, out_name,
+            "SELECT * FROM raprs ORDER BY full_name NULLS LAST, number NULLS LAST, pr_key",
+            {
+                **_ts_units(comment_schema, {"created_at_comment": "first_comment_at"}),
+                **_ts_units(comment_schema, {"created_at_comment": "last_comment_at"}),
+                **_ts_units(pr_schema, dict(zip(rcols, rnames))),
+            },
+            _batch_size(cfg),
+        )
+    majority_counts = pd.Series(dict(con.execute(
+        "SELECT task_type_majority, count(*) AS n FROM raprs GROUP BY ALL ORDER BY n DESC, task_type_majority"
+    ).fetchall()), dtype="int64", name="count")
+    con.close()
+    return out_path, n_rows, majority_counts
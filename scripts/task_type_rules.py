@@ -1,4 +1,6 @@
 import re
+import numpy as np
+import pandas as pd
 
 RULES = [
     ("feature",  r"\b(feat|feature)\b"),
@@ -14,6 +16,15 @@ RULES = [
     ("revert",   r"\b(revert)\b"),
 ]
 
+# All RULES as one regex. Each alternative is a lookahead anchored at the start
+# of the title, so alternatives are tried in RULES order and the first rule that
+# matches anywhere wins (a plain alternation would pick the leftmost match
+# instead, e.g. "bug" before "feature" in "bug: add feature").
+COMBINED_RE = re.compile(
+    "|".join(f"^(?=.*?(?P<{label}>{pat}))" for label, pat in RULES),
+    flags=re.DOTALL,
+)
+
 def infer_task_type(title: str) -> str:
     if not isinstance(title, str) or not title.strip():
         return "unknown"
@@ -22,3 +33,24 @@ def infer_task_type(title: str) -> str:
         if re.search(pat, t):
             return label
     return "other"
+
+def infer_task_types(titles: pd.Series) -> pd.Series:
+    """
+    Batched infer_task_type: same labels, but each distinct title is classified
+    once with COMBINED_RE over the whole column.
+    """
+    codes, uniques = pd.factorize(titles)  # missing titles get code -1
+    uniq = pd.Series(np.asarray(uniques, dtype=object), dtype=object)
+
+    is_str = uniq.map(type).eq(str).to_numpy()
+    text = uniq.where(is_str, "")
+    blank = text.str.strip().eq("").to_numpy()
+
+    # object dtype keeps Python `re` semantics (\b, lookaheads) on every pandas version
+    matches = text.str.lower().str.extract(COMBINED_RE)[[label for label, _ in RULES]].notna().to_numpy()
+    first = matches.argmax(axis=1)
+    labels = np.where(matches.any(axis=1), np.array([label for label, _ in RULES], dtype=object)[first], "other")
+    labels = np.where(blank, "unknown", labels)
+
+    out = np.where(codes >= 0, labels[codes] if len(labels) else "unknown", "unknown")
+    return pd.Series(out, index=titles.index, name="task_type", dtype=object)
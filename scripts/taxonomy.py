@@ -0,0 +1,256 @@
+"""
+Rejection taxonomy and classification prompt (from Pr_taxonomy_classification_pipeline.ipynb).
+"""
+import json
+
+SYSTEM_PROMPT = "You are an expert software engineering researcher. Respond ONLY with valid JSON."
+
+TAXONOMY = {
+    "SPEC_MISMATCH": {
+        "name": "Specification/Intent Mismatch",
+        "definition": "The PR misunderstands or partially addresses the issue requirement. The solution doesn't match what was asked for, solves the wrong problem, or addresses only part of the requirement.",
+        "examples": [
+            "PR fixes symptom but not root cause",
+            "Feature implemented doesn't match issue description",
+            "PR scope doesn't align with ticket requirements",
+            "Misinterpretation of user story or feature request"
+        ],
+        "keywords": ["wrong problem", "not what was asked", "misunderstood", "not the issue", "scope mismatch"]
+    },
+
+    "LOGIC_DEFECT": {
+        "name": "Logic/Semantic Defects",
+        "definition": "The implementation contains logical errors, violates invariants, has incorrect business logic, or fails to handle edge cases. Code may compile but produces wrong results.",
+        "examples": [
+            "Off-by-one errors",
+            "Incorrect conditional logic",
+            "Edge case not handled (null, empty, boundary values)",
+            "Algorithm produces incorrect output",
+            "Race conditions or concurrency bugs"
+        ],
+        "keywords": ["bug", "wrong", "incorrect", "fails", "error", "edge case", "logic error"]
+    },
+
+    "BUILD_CI_FAILURE": {
+        "name": "Build/CI/Environment Failures",
+        "definition": "PR fails CI checks, has build errors, dependency issues, platform incompatibilities, or environment configuration problems. Cannot be validated in the project's CI matrix.",
+        "examples": [
+            "Failing CI pipeline",
+            "Dependency version conflicts",
+            "Build errors in specific environments",
+            "Platform-specific failures",
+            "Docker/container configuration issues"
+        ],
+        "keywords": ["CI fail", "build", "dependency", "environment", "platform", "compilation error"]
+    },
+
+    "STYLE_CONVENTION": {
+        "name": "Style/Convention Violations",
+        "definition": "Code doesn't follow project formatting standards, naming conventions, code organization, or linting rules. Violates established style guides.",
+        "examples": [
+            "Formatting doesn't match project style",
+            "Naming conventions violated",
+            "Linter errors",
+            "Missing or incorrect code comments",
+            "File organization doesn't follow project structure"
+        ],
+        "keywords": ["lint", "style", "format", "convention", "naming", "whitespace"]
+    },
+
+    "TEST_INADEQUACY": {
+        "name": "Testing Inadequacy",
+        "definition": "Missing tests, weak test coverage, incorrect tests, or tests that don't adequately validate the changes. May pass existing tests but lacks proper validation.",
+        "examples": [
+            "No tests provided for new functionality",
+            "Test coverage below threshold",
+            "Tests don't actually test the changes",
+            "Weak assertions or test quality",
+            "Missing edge case tests"
+        ],
+        "keywords": ["test", "coverage", "untested", "no tests", "test quality"]
+    },
+
+    "DESIGN_MISFIT": {
+        "name": "Architectural/Design Misfit",
+        "definition": "Solution violates architectural principles, degrades maintainability, has poor design choices, introduces tight coupling, or doesn't fit the codebase architecture.",
+        "examples": [
+            "Violates separation of concerns",
+            "Introduces tight coupling",
+            "Performance degradation",
+            "Not maintainable or extensible",
+            "Doesn't follow existing patterns",
+            "Overly complex solution"
+        ],
+        "keywords": ["design", "architecture", "maintainability", "complexity", "coupling", "pattern"]
+    },
+
+    "POLICY_VIOLATION": {
+        "name": "Process/Policy Violations",
+        "definition": "Violates project governance, contribution policies, or procedural requirements. Missing required documentation, CLA/DCO, changelog, or doesn't follow contribution guidelines.",
+        "examples": [
+            "Missing CLA/DCO sign-off",
+            "No changelog entry",
+            "Missing or inadequate documentation",
+            "Doesn't follow contribution guidelines",
+            "Security policy violations"
+        ],
+        "keywords": ["documentation", "docs", "CLA", "DCO", "policy", "guideline", "changelog"]
+    },
+
+    "TOOL_ERROR": {
+        "name": "Tool-Use/Automation Errors",
+        "definition": "Misuse of repository-specific tooling, incorrect command flags, code generation errors, or automation script failures.",
+        "examples": [
+            "Code generator misused",
+            "Build script errors",
+            "Incorrect tool configuration",
+            "Automation pipeline failures"
+        ],
+        "keywords": ["tool", "script", "generator", "automation", "command"]
+    },
+
+    "ALTERNATIVE_SOLUTION": {
+        "name": "Alternative/Better Solution Exists",
+        "definition": "A better solution already exists, is being worked on, or was chosen instead. PR is redundant or superseded by another approach.",
+        "examples": [
+            "Duplicate PR",
+            "Better solution already merged",
+            "Maintainer chose different approach",
+            "Obsolete due to other changes"
+        ],
+        "keywords": ["duplicate", "already", "alternative", "obsolete", "superseded"]
+    },
+
+    "PR_TOO_LARGE": {
+        "name": "PR Scope Too Large",
+        "definition": "PR is too large, touches too many files, mixes multiple concerns, or should be split into smaller PRs for easier review.",
+        "examples": [
+            "Too many files changed",
+            "Multiple unrelated changes",
+            "Should be split into smaller PRs",
+            "Difficult to review due to size"
+        ],
+        "keywords": ["too large", "too big", "split", "too many changes", "scope"]
+    },
+
+    "MERGE_CONFLICT": {
+        "name": "Merge Conflicts/Outdated",
+        "definition": "PR has merge conflicts with main branch, is based on outdated code, or needs rebasing.",
+        "examples": [
+            "Merge conflicts",
+            "Needs rebase",
+            "Based on old commit",
+            "Conflicts with recent changes"
+        ],
+        "keywords": ["conflict", "merge", "rebase", "outdated", "stale"]
+    },
+
+    "LACK_OF_CONFIDENCE": {
+        "name": "Lack of Confidence in AI-Generated Code",
+        "definition": "Reviewers express distrust or lack of confidence specifically because code is AI-generated. Concerns about AI limitations or reliability.",
+        "examples": [
+            "'AI-generated, needs human review'",
+            "Distrust of automated solution",
+            "Concerns about AI understanding context"
+        ],
+        "keywords": ["AI", "automated", "bot", "generated", "trust"]
+    },
+
+    "NOT_COMMUNITY_INTEREST": {
+        "name": "Not in Community Interest",
+        "definition": "Change is not wanted by the project maintainers or community. Outside project roadmap or doesn't align with project goals.",
+        "examples": [
+            "Feature not wanted",
+            "Outside project scope",
+            "Not aligned with roadmap",
+            "Maintainers declined the change"
+        ],
+        "keywords": ["not needed", "won't fix", "out of scope", "not interested"]
+    },
+
+    "OTHER": {
+        "name": "Other/Unclear",
+        "definition": "Rejection reason doesn't fit other categories or is unclear from available information.",
+        "examples": ["No clear reason stated", "Insufficient information"],
+        "keywords": []
+    }
+}
+
+
+# Taxonomy section of the prompt, built once instead of on every call
+TAXONOMY_TEXT = "".join(
+    f"\n### {code}: {info['name']}\n"
+    f"**Definition:** {info['definition']}\n"
+    f"**Examples:** {', '.join(info['examples'][:3])}\n"
+    for code, info in TAXONOMY.items()
+)
+
+
+def create_classification_prompt(pr_body, review_comments):
+    """
+    Creates a structured prompt for the LLM to classify PR rejection reason.
+
+    Args:
+        pr_body: The PR description/body text
+        review_comments: The review comments from maintainers
+
+    Returns:
+        Structured prompt string
+    """
+
+    taxonomy_text = TAXONOMY_TEXT
+
+    prompt = f"""You are an expert software engineering researcher analyzing rejected pull requests (PRs) from autonomous coding agents. Your task is to classify the PRIMARY reason why this PR was rejected based on the reviewer comments and PR context.
+
+# CLASSIFICATION TAXONOMY
+
+Choose the SINGLE MOST IMPORTANT category that best explains the rejection. Here are the categories:
+{taxonomy_text}
+
+# PR INFORMATION TO ANALYZE
+
+## PR Description:
+```
+{pr_body if pr_body else "[No PR description provided]"}
+```
+
+## Reviewer Comments:
+```
+{review_comments if review_comments else "[No reviewer comments available]"}
+```
+
+# INSTRUCTIONS
+
+1. Read the PR description and reviewer comments carefully
+2. Identify the PRIMARY reason for rejection (the most critical issue)
+3. Select the SINGLE category code that best matches this reason
+4. Provide a brief explanation (1-2 sentences) of why you chose this category
+
+# OUTPUT FORMAT
+
+Respond with ONLY valid JSON in this exact format:
+{{
+    "category": "CATEGORY_CODE",
+    "confidence": "high|medium|low",
+    "explanation": "Brief explanation of why this category was chosen",
+    "secondary_category": "CATEGORY_CODE or null"
+}}
+
+CRITICAL RULES:
+- Output ONLY the JSON object, no other text
+- Use exact category codes from the taxonomy above
+- If no clear reason is evident, use "OTHER"
+- Be decisive - choose the MOST important reason
+"""
+
+    return prompt
+
+
+def parse_classification(text: str) -> dict:
+    """Parse the model's JSON answer; unknown categories map to OTHER (as in the notebook)."""
+    result = json.loads(text)
+    if not isinstance(result, dict) or "category" not in result:
+        raise ValueError("Missing 'category' in response")
+    if result["category"] not in TAXONOMY:
+        result["category"] = "OTHER"
+    return result
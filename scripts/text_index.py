@@ -0,0 +1,296 @@
+"""
+On-disk inverted index with positional postings over review comments and PR
+titles/bodies, for phrase and boolean queries filtered by agent_type,
+task_type and pr_outcome.
+
+Postings are kept per distinct text, not per document: every text is
+identified by its 64-bit content hash (the `*_ref` of the text store), so a
+bot message repeated on thousands of PRs is tokenized and stored once. The
+index is one SQLite file:
+
+    texts(text_id, hash)                 every text indexed so far
+    postings(term, segment, n, data)     zlib'd (text_id gaps, positions) per term
+    docs(text_id, pr_key, field)         comment / title / body -> text
+    prs(pr_key, full_name, number, ...)  filter columns
+
+Each build (script 11) only tokenizes texts whose hash is not indexed yet
+and appends their postings as new segments; docs and prs (integers and
+labels) are replaced on every run. Segments are merged once there are more than
+`text_index.max_segments`.
+
+    index = TextIndex(path)
+    hits = index.search('"not what was asked" OR "scope mismatch"', agent_type=["Devin"])
+"""
+import os
+import re
+import sqlite3
+import zlib
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from text_store import text_hash
+
+INDEX_FILE = "aidev_pop_ge500_text_index.sqlite"
+FIELDS = {"comment": 0, "title": 1, "body": 2}
+TOKEN = re.compile(r"\w+")
+QUERY_TOKEN = re.compile(r'"[^"]*"|\(|\)|[^\s()"]+')
+FILTER_COLS = ["agent_type", "task_type", "pr_outcome"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS texts (text_id INTEGER PRIMARY KEY, hash INTEGER UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL, segment INTEGER NOT NULL, n INTEGER NOT NULL, data BLOB NOT NULL,
+    PRIMARY KEY (term, segment)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS docs (text_id INTEGER NOT NULL, pr_key INTEGER NOT NULL, field INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS docs_text ON docs (text_id, pr_key, field);
+CREATE TABLE IF NOT EXISTS prs (
+    pr_key INTEGER PRIMARY KEY, full_name TEXT, number INTEGER,
+    agent_type TEXT, task_type TEXT, pr_outcome TEXT
+);
+"""
+
+
+def index_path(cfg: dict) -> str:
+    return os.path.join(cfg["paths"]["derived_dir"], INDEX_FILE)
+
+
+def tokenize(text: str) -> list:
+    return TOKEN.findall(text.lower())
+
+
+def encode(text_ids: np.ndarray, positions: np.ndarray) -> bytes:
+    gaps = np.diff(text_ids, prepend=0)
+    return zlib.compress(np.concatenate([gaps, positions]).astype("<u4").tobytes(), 1)
+
+
+def decode(blob: bytes) -> tuple:
+    a = np.frombuffer(zlib.decompress(blob), dtype="<u4")
+    n = len(a) // 2
+    return np.cumsum(a[:n], dtype=np.int64), a[n:].astype(np.int64)
+
+
+def postings_rows(text_ids: np.ndarray, texts: list, segment: int):
+    """(term, segment, n_texts, blob) rows for a batch of new texts."""
+    tokens = [tokenize(t) for t in texts]
+    lens = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+    if not lens.sum():
+        return []
+    codes, terms = pd.factorize(pd.Series(list(chain.from_iterable(tokens)), dtype=object))
+    occ_text = np.repeat(text_ids, lens)
+    pos = np.arange(len(codes)) - np.repeat(np.cumsum(lens) - lens, lens)
+    order = np.lexsort((pos, occ_text, codes))
+    codes, occ_text, pos = codes[order], occ_text[order], pos[order]
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    rows = []
+    for lo, hi in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(codes)]])):
+        t = occ_text[lo:hi]
+        rows.append((terms[codes[lo]], segment, int(len(np.unique(t))), encode(t, pos[lo:hi])))
+    return rows
+
+
+def parse(query: str):
+    """
+    Query syntax: words, "quoted phrases", AND / OR / NOT (upper case) and
+    parentheses. Adjacent operands are ANDed. Operands match within one
+    document (a comment, a PR title or a PR body).
+    """
+    toks = QUERY_TOKEN.findall(query)
+    pos = 0
+
+    def peek():
+        return toks[pos] if pos < len(toks) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return toks[pos - 1]
+
+    def expr():
+        node = conj()
+        while peek() == "OR":
+            take()
+            node = ("or", node, conj())
+        return node
+
+    def conj():
+        node = neg()
+        while peek() not in (None, "OR", ")"):
+            if peek() == "AND":
+                take()
+            node = ("and", node, neg())
+        return node
+
+    def neg():
+        if peek() == "NOT":
+            take()
+            return ("not", neg())
+        return atom()
+
+    def atom():
+        tok = take() if peek() is not None else None
+        if tok is None:
+            raise ValueError(f"Unexpected end of query: {query!r}")
+        if tok == "(":
+            node = expr()
+            if peek() != ")":
+                raise ValueError(f"Missing ')' in query: {query!r}")
+            take()
+            return node
+        if tok == ")":
+            raise ValueError(f"Unexpected ')' in query: {query!r}")
+        words = tokenize(tok.strip('"'))
+        return ("phrase", words) if len(words) != 1 else ("term", words[0])
+
+    node = expr()
+    if pos != len(toks):
+        raise ValueError(f"Could not parse query near {toks[pos]!r}: {query!r}")
+    return node
+
+
+class TextIndex:
+    def __init__(self, path: str, create: bool = False):
+        if not create and not os.path.exists(path):
+            raise FileNotFoundError(f"Missing text index {path}. Run script 11 first.")
+        self.path = path
+        self.con = sqlite3.connect(path)
+        self.con.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.con.close()
+
+    # --- Build ---
+
+    def text_ids(self) -> pd.Series:
+        """hash -> text_id for every indexed text."""
+        rows = self.con.execute("SELECT hash, text_id FROM texts").fetchall()
+        return pd.Series([r[1] for r in rows], index=pd.Index([r[0] for r in rows], dtype="int64"), dtype="int64")
+
+    def add_texts(self, hashes: np.ndarray, texts: list, batch_texts: int) -> int:
+        """Index texts not seen before (by hash), one segment per batch. Returns the number added."""
+        known = self.text_ids()
+        new = ~pd.Index(hashes).isin(known.index)
+        hashes, texts = hashes[new], [t for t, n in zip(texts, new) if n]
+        segment = (self.con.execute("SELECT MAX(segment) FROM postings").fetchone()[0] or 0) + 1
+        next_id = (self.con.execute("SELECT MAX(text_id) FROM texts").fetchone()[0] or 0) + 1
+        for lo in range(0, len(hashes), batch_texts):
+            ids = np.arange(next_id + lo, next_id + min(lo + batch_texts, len(hashes)), dtype=np.int64)
+            with self.con:
+                self.con.executemany("INSERT INTO texts VALUES (?, ?)",
+                                     zip(ids.tolist(), hashes[lo:lo + batch_texts].tolist()))
+                self.con.executemany("INSERT INTO postings VALUES (?, ?, ?, ?)",
+                                     postings_rows(ids, texts[lo:lo + batch_texts], segment))
+            segment += 1
+        return len(hashes)
+
+    def replace_docs(self, docs: pd.DataFrame, prs: pd.DataFrame) -> None:
+        """docs: hash, pr_key, field code; prs: pr_key + full_name, number and the filter columns."""
+        ids = self.text_ids()
+        docs = docs.assign(text_id=ids.reindex(docs["hash"].to_numpy()).to_numpy())
+        docs = docs.dropna(subset=["text_id"]).astype({"text_id": "int64"})
+        prs = prs.astype(object).where(prs.notna(), None)
+        with self.con:
+            self.con.execute("DELETE FROM docs")
+            self.con.execute("DELETE FROM prs")
+            self.con.executemany("INSERT INTO docs VALUES (?, ?, ?)",
+                                 docs[["text_id", "pr_key", "field"]].itertuples(index=False, name=None))
+            self.con.executemany("INSERT INTO prs VALUES (?, ?, ?, ?, ?, ?)",
+                                 prs[["pr_key", "full_name", "number"] + FILTER_COLS].itertuples(index=False, name=None))
+
+    def segments(self) -> int:
+        return self.con.execute("SELECT COUNT(DISTINCT segment) FROM postings").fetchone()[0]
+
+    def compact(self) -> None:
+        """Merge all segments into one (segment order is text_id order, so postings stay sorted)."""
+        cur = self.con.execute("SELECT term, data FROM postings ORDER BY term, segment")
+        merged, term, parts = [], None, []
+
+        def flush():
+            t = np.concatenate([p[0] for p in parts])
+            merged.append((term, 1, int(len(np.unique(t))), encode(t, np.concatenate([p[1] for p in parts]))))
+
+        for t, blob in cur:
+            if t != term and parts:
+                flush()
+                parts = []
+            term = t
+            parts.append(decode(blob))
+        if parts:
+            flush()
+        with self.con:
+            self.con.execute("DELETE FROM postings")
+            self.con.executemany("INSERT INTO postings VALUES (?, ?, ?, ?)", merged)
+        self.con.execute("VACUUM")
+
+    # --- Query ---
+
+    def _postings(self, term: str, memo: dict) -> tuple:
+        if term not in memo:
+            blobs = [decode(r[0]) for r in self.con.execute(
+                "SELECT data FROM postings WHERE term = ? ORDER BY segment", (term,))]
+            empty = np.empty(0, dtype=np.int64)
+            memo[term] = (np.concatenate([b[0] for b in blobs]) if blobs else empty,
+                          np.concatenate([b[1] for b in blobs]) if blobs else empty)
+        return memo[term]
+
+    def _eval(self, node, memo: dict) -> np.ndarray:
+        """Sorted unique text_ids matching node."""
+        kind = node[0]
+        if kind == "term":
+            return np.unique(self._postings(node[1], memo)[0])
+        if kind == "phrase":
+            if not node[1]:
+                return np.empty(0, dtype=np.int64)
+            keys = None
+            for i, word in enumerate(node[1]):
+                t, p = self._postings(word, memo)
+                ok = p >= i
+                k = (t[ok] << 32) + (p[ok] - i)  # (text, start position) of a candidate phrase
+                keys = k if keys is None else np.intersect1d(keys, k)
+            return np.unique(keys >> 32)
+        if kind == "not":
+            n = self.con.execute("SELECT MAX(text_id) FROM texts").fetchone()[0] or 0
+            return np.setdiff1d(np.arange(1, n + 1, dtype=np.int64), self._eval(node[1], memo), assume_unique=True)
+        if kind == "and" and node[2][0] == "not":
+            return np.setdiff1d(self._eval(node[1], memo), self._eval(node[2][1], memo), assume_unique=True)
+        left, right = self._eval(node[1], memo), self._eval(node[2], memo)
+        return np.intersect1d(left, right, assume_unique=True) if kind == "and" else np.union1d(left, right)
+
+    def search(self, query: str, agent_type=None, task_type=None, pr_outcome=None, field=None) -> pd.DataFrame:
+        """
+        PRs with at least one matching document, most matching documents first.
+        Filters take a value or a list of values; `field` limits the documents
+        searched to "comment", "title" and/or "body".
+        """
+        text_ids = self._eval(parse(query), {})
+        where, params = [], []
+        for col, value in [("p.agent_type", agent_type), ("p.task_type", task_type), ("p.pr_outcome", pr_outcome),
+                           ("d.field", field)]:
+            if value is None:
+                continue
+            values = [value] if isinstance(value, (str, int)) else list(value)
+            if col == "d.field":
+                values = [FIELDS[v] for v in values]
+            where.append(f"{col} IN ({', '.join('?' * len(values))})")
+            params += values
+
+        self.con.execute("CREATE TEMP TABLE IF NOT EXISTS hits (text_id INTEGER PRIMARY KEY)")
+        self.con.execute("DELETE FROM hits")
+        self.con.executemany("INSERT INTO hits VALUES (?)", ((int(i),) for i in text_ids))
+        # CROSS JOIN keeps SQLite's join order: matching texts -> their docs -> PRs (never a docs scan)
+        sql = f"""
+            SELECT p.full_name, p.number, p.agent_type, p.task_type, p.pr_outcome, COUNT(*) AS n_docs
+            FROM hits h CROSS JOIN docs d ON d.text_id = h.text_id CROSS JOIN prs p ON p.pr_key = d.pr_key
+            {"WHERE " + " AND ".join(where) if where else ""}
+            GROUP BY p.pr_key ORDER BY n_docs DESC, p.full_name, p.number
+        """
+        return pd.read_sql_query(sql, self.con, params=params)
+
+
+def hash_texts(texts: pd.Series) -> np.ndarray:
+    """text_hash per row (nulls -> 0), each distinct text hashed once."""
+    codes, uniq = pd.factorize(texts)
+    hashes = np.fromiter((text_hash(str(t)) for t in uniq), dtype="int64", count=len(uniq))
+    return np.where(codes >= 0, hashes[codes] if len(hashes) else 0, 0)
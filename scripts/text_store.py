@@ -0,0 +1,188 @@
+"""
+Side store for heavy review-comment text (comment bodies, diff hunks).
+
+Step 02 moves the `text_store.columns` of the comment table into one
+zstd-compressed Parquet file in which every distinct text is stored once
+(identical diff hunks and bot boilerplate included). The comment table keeps
+a `<column>_ref` int64 reference instead: a 64-bit BLAKE2b hash of the text,
+null where the text is null. Because references are content hashes, they stay
+valid in any table derived from the comment table (step 06 output, ...).
+
+    df = writer.externalize(df)                  # step 02: text columns -> *_ref
+    df = attach_text(cfg, df, ["body_comment"])  # readers: *_ref -> text, lazily
+
+Readers load the hash column once and then decode only the row groups that
+hold the requested texts, so e.g. the final 200 comments of step 07 do not
+read the whole store.
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from derived_io import TEXT_DTYPE
+
+STORE_FILE = "aidev_pop_ge500_review_comment_text.parquet"
+REF_SUFFIX = "_ref"
+DEFAULT_COLUMNS = ["body_comment", "diff_hunk"]
+DEFAULT_ROW_GROUP_SIZE = 1024
+
+
+def _options(cfg: dict) -> dict:
+    opts = dict(cfg.get("text_store") or {})
+    opts.setdefault("enabled", True)
+    opts["columns"] = list(opts.get("columns") or DEFAULT_COLUMNS)
+    opts["row_group_size"] = int(opts.get("row_group_size") or DEFAULT_ROW_GROUP_SIZE)
+    return opts
+
+
+def store_path(cfg: dict) -> str:
+    return os.path.join(cfg["paths"]["derived_dir"], STORE_FILE)
+
+
+def text_hash(text: str) -> int:
+    """Signed 64-bit BLAKE2b digest of the UTF-8 text (the stored reference)."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def stored_columns(columns) -> dict:
+    """Text column -> reference column, for the `*_ref` columns in `columns`."""
+    return {c[: -len(REF_SUFFIX)]: c for c in columns if c.endswith(REF_SUFFIX)}
+
+
+class TextStoreWriter:
+    """
+    Build the store while a producer writes the comment table (in one piece or
+    batch by batch). Texts are appended in row-major order of first occurrence,
+    so the file does not depend on how the rows were batched.
+    """
+
+    def __init__(self, cfg: dict, append: bool = False):
+        self.opts = _options(cfg)
+        self.path = store_path(cfg)
+        self.tmp = self.path + ".tmp"
+        self.seen = set()
+        self.rows = 0
+        self.refs = 0
+        self.chars = 0
+        self.writer = None
+        # append: texts of the existing store are kept (copied over only if new texts arrive)
+        self.base = None
+        self.base_hashes = np.array([], dtype="int64")
+        if append and os.path.exists(self.path):
+            import pyarrow.parquet as pq
+            self.base = pq.ParquetFile(self.path)
+            self.base_hashes = self.base.read(columns=["hash"]).column("hash").to_numpy()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def externalize(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Replace the configured text columns of df with `*_ref` columns and store new texts."""
+        cols = [c for c in self.opts["columns"] if c in df.columns] if self.opts["enabled"] else []
+        if not cols:
+            return df
+
+        values = df[cols].to_numpy(dtype=object)
+        present = pd.notna(values)
+        flat = values[present]  # row-major, so first occurrences do not depend on batching
+        codes, uniq = pd.factorize(pd.Series(flat, dtype=object).astype(str), sort=False)
+        hashes = np.fromiter((text_hash(t) for t in uniq), dtype="int64", count=len(uniq))
+        refs = np.zeros(values.shape, dtype="int64")
+        refs[present] = hashes[codes]
+        self.refs += len(flat)
+        self.chars += int((np.bincount(codes, minlength=len(uniq)) * uniq.str.len().to_numpy()).sum())
+
+        stored = np.isin(hashes, self.base_hashes)
+        new = [i for i, h in enumerate(hashes) if not stored[i] and h not in self.seen]
+        self.seen.update(hashes[new].tolist())
+        self._append(hashes[new].tolist(), [uniq[i] for i in new])
+
+        out = df.copy()
+        for j, c in enumerate(cols):
+            ref = pd.Series(refs[:, j], index=df.index, dtype="Int64").mask(~present[:, j])
+            out.insert(out.columns.get_loc(c), c + REF_SUFFIX, ref)
+            out = out.drop(columns=[c])
+        return out
+
+    def _append(self, hashes: list, texts: list) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([("hash", pa.int64()), ("text", pa.large_string())])
+        if self.writer is None:
+            if self.base is not None and not hashes:
+                return  # nothing new: the existing store stays as it is
+            self.writer = pq.ParquetWriter(self.tmp, schema, compression="zstd")
+            if self.base is not None:
+                for i in range(self.base.num_row_groups):
+                    self.writer.write_table(self.base.read_row_group(i).cast(schema))
+        if hashes:
+            table = pa.table([pa.array(hashes, pa.int64()), pa.array(texts, pa.large_string())], schema=schema)
+            self.writer.write_table(table, row_group_size=self.opts["row_group_size"])
+            self.rows += len(hashes)
+
+    def close(self) -> str:
+        """Finish the store (an empty one if nothing was externalized) and return its path."""
+        if self.writer is None:
+            self._append([], [])
+            if self.writer is None:  # appending without new texts
+                return self.path
+        self.writer.close()
+        os.replace(self.tmp, self.path)
+        return self.path
+
+    def summary(self) -> str:
+        kept = f", {len(self.base_hashes)} kept" if self.base is not None else ""
+        return f"{self.refs} texts -> {self.rows} distinct{kept} ({self.chars / 1e6:.1f}M characters before dedup)"
+
+
+class TextStore:
+    """Read side: fetch texts by reference, decoding only the row groups that hold them."""
+
+    def __init__(self, path: str):
+        import pyarrow.parquet as pq
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Missing text store {path}. Run script 02 first.")
+        self.path = path
+        self.file = pq.ParquetFile(path)
+        meta = self.file.metadata
+        self.group_starts = np.cumsum([0] + [meta.row_group(i).num_rows for i in range(meta.num_row_groups)])
+        self.index = pd.Index(self.file.read(columns=["hash"]).column("hash").to_numpy())
+
+    def fetch(self, refs: pd.Series) -> pd.Series:
+        """Texts for `refs`, aligned with it (null refs give NaN)."""
+        refs = pd.Series(refs)
+        wanted = pd.unique(refs.dropna().astype("int64").to_numpy())
+        lookup = pd.Series([], dtype=TEXT_DTYPE)
+        if len(wanted):
+            pos = self.index.get_indexer(wanted)
+            if (pos < 0).any():
+                raise KeyError(f"{int((pos < 0).sum())} text reference(s) not found in {self.path}")
+            group_of = np.searchsorted(self.group_starts, pos, side="right") - 1
+            groups = np.unique(group_of)
+            # Offsets of the selected row groups once read back to back
+            sizes = self.group_starts[groups + 1] - self.group_starts[groups]
+            offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+            local = pos - self.group_starts[group_of] + offsets[np.searchsorted(groups, group_of)]
+            texts = self.file.read_row_groups(groups.tolist(), columns=["text"]).column("text")
+            lookup = pd.Series(texts.take(local).to_pandas().to_numpy(), index=wanted, dtype=TEXT_DTYPE)
+        return refs.map(lookup).astype(TEXT_DTYPE)
+
+
+def attach_text(cfg: dict, df: pd.DataFrame, columns=None, store: TextStore = None) -> pd.DataFrame:
+    """
+    Replace `*_ref` columns of df with their text (all of them, or only the
+    text columns named in `columns`), in place of the reference column.
+    """
+    refs = stored_columns(df.columns)
+    if columns is not None:
+        refs = {c: r for c, r in refs.items() if c in columns}
+    if not refs:
+        return df
+    store = store or TextStore(store_path(cfg))
+    df = df.copy()
+    for c, r in refs.items():
+        df.insert(df.columns.get_loc(r), c, store.fetch(df[r]))
+        df = df.drop(columns=[r])
+    return df
@@ -0,0 +1,24 @@
+import functools
+import yaml
+
+CONFIG_PATH = "config/config.yaml"
+
+@functools.lru_cache(maxsize=None)
+def load_config(path: str = CONFIG_PATH) -> dict:
+    """
+    Load the pipeline config once per process.
+
+    Scripts run standalone still read the file on start; when several steps run
+    in one process (run_pipeline.py) they share the parsed config.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+def config_value(cfg: dict, dotted_key: str):
+    """Look up e.g. "tables.pull_request"; returns None when any part is missing."""
+    node = cfg
+    for part in dotted_key.split("."):
+        if not isinstance(node, dict) or part not in node:
+            return None
+        node = node[part]
+    return node
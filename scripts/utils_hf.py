@@ -1,12 +1,74 @@
+import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-def read_parquet_hf(dataset_path: str, table_name: str) -> pd.DataFrame:
+def _table_uri(dataset_path: str, table_name: str) -> str:
+    if os.path.isdir(dataset_path):
+        return os.path.join(dataset_path, table_name)
+    return f"hf://datasets/{dataset_path}/{table_name}"
+
+def read_parquet_hf(dataset_path: str, table_name: str, cache=None, columns=None, filters=None) -> pd.DataFrame:
     """
     Read a Parquet table from Hugging Face using pandas.
     Expected URI format: hf://datasets/<dataset_path>/<table_name>
 
+    If `cache` (a hf_cache.ParquetCache) is given, the table is served from the
+    local cache and only downloaded when missing or stale.
+    `dataset_path` may also be a local directory holding the Parquet files.
+
+    `columns` and `filters` (pyarrow DNF, e.g. [("stars", ">=", 500)]) are pushed
+    down to the Parquet reader: only the requested columns are decoded and row
+    groups whose statistics cannot match are skipped.
+
     Note: If the dataset stores files in subfolders, adjust the URI here ONCE,
     and all scripts will work.
     """
-    uri = f"hf://datasets/{dataset_path}/{table_name}"
-    return pd.read_parquet(uri)
+    if cache is not None:
+        uri = cache.path_for(dataset_path, table_name)
+    else:
+        uri = _table_uri(dataset_path, table_name)
+    return pd.read_parquet(uri, columns=columns, filters=filters)
+
+def read_parquet_metadata_hf(dataset_path: str, table_name: str, cache=None) -> pq.FileMetaData:
+    """
+    Schema-only read: return the Parquet footer metadata (schema, row count,
+    row-group statistics) without decoding any data.
+
+    Uses the cached copy when there is one; otherwise only the footer bytes are
+    fetched from the Hub (nothing is added to the cache).
+    """
+    path = cache.lookup(dataset_path, table_name) if cache is not None else None
+    if path is not None:
+        return pq.read_metadata(path)
+    if cache is not None and cache.offline:
+        raise FileNotFoundError(f"Offline mode: {table_name} is not in the local cache ({cache.root}).")
+    if cache is not None and not os.path.isdir(dataset_path):
+        return pq.read_metadata(pa.BufferReader(cache.read_footer(dataset_path, table_name)))
+
+    uri = _table_uri(dataset_path, table_name)
+    if os.path.exists(uri):
+        return pq.read_metadata(uri)
+
+    import fsspec
+
+    with fsspec.open(uri, "rb") as f:
+        return pq.read_metadata(f)
+
+def iter_parquet_batches_hf(dataset_path: str, table_name: str, cache=None, columns=None, batch_size: int = 100_000):
+    """
+    Stream a table as pyarrow RecordBatches of at most `batch_size` rows, so
+    callers can process tables larger than memory.
+    """
+    if cache is not None:
+        uri = cache.path_for(dataset_path, table_name)
+    else:
+        uri = _table_uri(dataset_path, table_name)
+    if os.path.exists(uri):
+        yield from pq.ParquetFile(uri).iter_batches(batch_size=batch_size, columns=columns)
+        return
+
+    import fsspec
+
+    with fsspec.open(uri, "rb") as f:
+        yield from pq.ParquetFile(f).iter_batches(batch_size=batch_size, columns=columns)
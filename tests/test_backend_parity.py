@@ -0,0 +1,29 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("duckdb")
+
+from check_backend_parity import ENGINES, compare, prepare_workdir, run_steps
+from make_synthetic_aidev import generate
+from utils_config import load_config
+
+REPO_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "config.yaml")
+
+
+def test_duckdb_matches_pandas_for_steps_01_to_03(tmp_path, monkeypatch):
+    data_dir = tmp_path / "aidev"
+    generate(str(data_dir), scale=0.01, seed=0)
+
+    cfg = json.loads(json.dumps(load_config(REPO_CONFIG)))  # deep copy of the shared config
+    cfg["aidev_hf_dataset"] = str(data_dir)
+    cfg["paths"]["raw_dir"] = str(tmp_path / "raw")
+    cfg.setdefault("cache", {})["offline"] = False
+    monkeypatch.chdir(tmp_path)  # work dirs go under data/parity/<engine>
+
+    cfgs = {}
+    for engine in ENGINES:
+        root, cfgs[engine] = prepare_workdir(cfg, engine)
+        assert run_steps(root, engine), f"{engine} run failed; see {os.path.join(root, 'logs')}"
+    assert compare(cfgs) == []
@@ -0,0 +1,71 @@
+import os
+
+import pandas as pd
+import pytest
+
+from hf_cache import BLOB_DIR, ParquetCache
+
+
+def write_table(directory, name: str, n: int) -> None:
+    pd.DataFrame({"id": range(n), "body": ["x" * 50] * n}).to_parquet(os.path.join(directory, name), index=False)
+
+
+def blobs(root) -> set:
+    return set(os.listdir(os.path.join(root, BLOB_DIR)))
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    d = tmp_path / "aidev"
+    d.mkdir()
+    write_table(d, "a.parquet", 100)
+    write_table(d, "b.parquet", 200)
+    return str(d)
+
+
+def test_revalidation_replaces_the_superseded_blob(dataset, tmp_path):
+    cache = ParquetCache(str(tmp_path / "raw"))
+    first = cache.path_for(dataset, "a.parquet")
+    assert cache.path_for(dataset, "a.parquet") == first  # unchanged source: no new blob
+    assert blobs(cache.root) == {os.path.basename(first)}
+
+    write_table(dataset, "a.parquet", 150)  # new size -> new ETag
+    second = cache.path_for(dataset, "a.parquet")
+    assert second != first
+    assert len(pd.read_parquet(second)) == 150
+    assert blobs(cache.root) == {os.path.basename(second)}
+
+
+def test_superseded_blob_is_kept_while_another_key_uses_it(dataset, tmp_path):
+    cache = ParquetCache(str(tmp_path / "raw"))
+    first = cache.path_for(dataset, "a.parquet")
+    other = ParquetCache(cache.root, revision="v1")  # same content indexed under a second key
+    assert other.path_for(dataset, "a.parquet") == first
+
+    write_table(dataset, "a.parquet", 150)
+    second = cache.path_for(dataset, "a.parquet")
+    assert blobs(cache.root) == {os.path.basename(first), os.path.basename(second)}
+
+
+def test_least_recently_used_blob_is_evicted(dataset, tmp_path):
+    root = str(tmp_path / "raw")
+    size_a = os.path.getsize(os.path.join(dataset, "a.parquet"))
+    size_b = os.path.getsize(os.path.join(dataset, "b.parquet"))
+    cache = ParquetCache(root, max_bytes=max(size_a, size_b) + 1)
+
+    a = cache.path_for(dataset, "a.parquet")
+    b = cache.path_for(dataset, "b.parquet")
+    assert os.path.exists(b) and not os.path.exists(a)
+    assert cache.lookup(dataset, "a.parquet") is None
+    assert cache.lookup(dataset, "b.parquet") == b
+
+
+def test_offline_serves_indexed_tables_only(dataset, tmp_path):
+    root = str(tmp_path / "raw")
+    path = ParquetCache(root).path_for(dataset, "a.parquet")
+    os.remove(os.path.join(dataset, "a.parquet"))  # the source is never consulted offline
+
+    offline = ParquetCache(root, offline=True)
+    assert offline.path_for(dataset, "a.parquet") == path
+    with pytest.raises(FileNotFoundError, match="Offline mode"):
+        offline.path_for(dataset, "b.parquet")
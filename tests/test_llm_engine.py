@@ -0,0 +1,103 @@
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm_engine import ChatClient, ResponseCache, TokenBucket, run_cached
+from taxonomy import SYSTEM_PROMPT, create_classification_prompt, parse_classification
+
+# Per prompt, the fake answers in this order; the last answer repeats
+FAULTS = ["429", "500", "invalid_json", "ok"]
+
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    """Minimal /v1/chat/completions that fails each prompt in the order of FAULTS."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        assert self.path == "/v1/chat/completions"
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][-1]["content"]
+        with self.server.lock:
+            n = self.server.requests[prompt]
+            self.server.requests[prompt] += 1
+            fault = FAULTS[min(n, len(FAULTS) - 1)]
+            if fault == "ok":
+                self.server.answered[prompt] += 1
+        if fault == "429":
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+        if fault == "500":
+            self.send_response(500)
+            self.end_headers()
+            return
+        content = "not json" if fault == "invalid_json" else json.dumps(
+            {"category": "LOGIC_DEFECT", "confidence": "high", "explanation": prompt[-8:], "secondary_category": None})
+        out = json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAI)
+    srv.lock, srv.requests, srv.answered = threading.Lock(), Counter(), Counter()
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def make_jobs(bodies: list, params: dict) -> dict:
+    jobs = {}
+    for body in bodies:
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": create_classification_prompt("PR body", body)},
+        ]
+        jobs[ResponseCache.key("fake-model", messages, params)] = messages
+    return jobs
+
+
+def test_run_cached_retries_dedups_and_resumes_from_cache(server, tmp_path):
+    params = {"temperature": 0.1}
+    bodies = [f"comment {i}" for i in range(12)]
+    jobs = make_jobs(bodies + bodies[:5], params)  # duplicated prompts share one key
+    assert len(jobs) == len(bodies)
+
+    client = ChatClient(f"http://127.0.0.1:{server.server_port}/v1", "test-key", "fake-model", params=params,
+                        bucket=TokenBucket(0), max_retries=3, timeout=10, backoff=0.001)
+    cache_path = str(tmp_path / "llm_cache.sqlite")
+
+    cache = ResponseCache(cache_path)
+    try:
+        results = run_cached(client, cache, jobs, parse_classification, concurrency=4)
+    finally:
+        cache.close()
+
+    assert set(results) == set(jobs)
+    assert all("error" not in r and r["category"] == "LOGIC_DEFECT" for r in results.values())
+    # Every distinct prompt went through 429, 500 and invalid JSON, and was answered exactly once
+    assert len(server.answered) == len(bodies)
+    assert set(server.answered.values()) == {1}
+    assert set(server.requests.values()) == {len(FAULTS)}
+
+    # A second run is served from the SQLite cache without any request
+    sent = sum(server.requests.values())
+    cache = ResponseCache(cache_path)
+    try:
+        again = run_cached(client, cache, jobs, parse_classification, concurrency=4)
+    finally:
+        cache.close()
+    assert again == results
+    assert sum(server.requests.values()) == sent
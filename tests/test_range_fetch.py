@@ -0,0 +1,157 @@
+import hashlib
+import io
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import hf_cache
+import range_fetch
+from hf_cache import ParquetCache
+from range_fetch import RangeFetcher
+
+DATASET = "org/aidev"
+TABLE = "all_pull_request.parquet"
+ROWS = 300_000  # ~2.4 MB of random ints: several 1 MB chunks
+
+
+class ParquetFiles(BaseHTTPRequestHandler):
+    """
+    Serves server.files at any path ending in the file name, with ETag = SHA-256
+    and Range support (including suffix ranges). Knobs on the server: hide_size
+    (no Content-Length on HEAD), drop_after (close each body after N bytes),
+    corrupt (flip one byte of every body).
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_file(head=True)
+
+    def do_GET(self):
+        self.send_file(head=False)
+
+    def send_file(self, head: bool):
+        srv = self.server
+        data = srv.files[self.path.rsplit("/", 1)[-1]]
+        rng = self.headers.get("Range")
+        with srv.lock:
+            srv.log.append((self.command, rng))
+        start, end = 0, len(data)
+        if rng:
+            first, last = rng[len("bytes="):].split("-")
+            if first:
+                start, end = int(first), min(len(data), int(last) + 1 if last else len(data))
+            else:
+                start = max(0, len(data) - int(last))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("ETag", f'"{hashlib.sha256(data).hexdigest()}"')
+        self.send_header("Accept-Ranges", "bytes")
+        if not (head and srv.hide_size):
+            self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+        if head:
+            return
+        body = data[start:end]
+        if srv.corrupt:
+            body = bytes([body[0] ^ 0xFF]) + body[1:]
+        if srv.drop_after is not None:
+            body = body[:srv.drop_after]
+            self.close_connection = True
+        self.wfile.write(body)
+
+
+def parquet_bytes(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), buf, row_group_size=50_000)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({"id": np.arange(ROWS), "repo_id": rng.integers(0, 2**62, ROWS)})
+
+
+@pytest.fixture
+def server(frame):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), ParquetFiles)
+    srv.files = {TABLE: parquet_bytes(frame)}
+    srv.lock, srv.log = threading.Lock(), []
+    srv.hide_size, srv.drop_after, srv.corrupt = False, None, False
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def make_cache(server, root, connections: int = 4) -> ParquetCache:
+    fetcher = RangeFetcher(connections=connections, chunk_bytes=1024 ** 2, max_retries=0, timeout=10)
+    return ParquetCache(str(root), endpoint=f"http://127.0.0.1:{server.server_port}", fetcher=fetcher)
+
+
+def test_parallel_download_is_verified_and_cached(server, frame, tmp_path):
+    cache = make_cache(server, tmp_path / "raw")
+    path = cache.path_for(DATASET, TABLE)
+
+    pd.testing.assert_frame_equal(pd.read_parquet(path), frame)
+    gets = [rng for method, rng in server.log if method == "GET" and rng != "bytes=0-0"]
+    assert len(gets) == -(-len(server.files[TABLE]) // 1024 ** 2)  # one range request per chunk
+    assert not [f for f in os.listdir(os.path.dirname(path)) if ".part" in f]
+
+
+def test_interrupted_download_resumes_from_saved_progress(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(range_fetch, "SAVE_EVERY", 1)  # checkpoint after every block
+    data = server.files[TABLE]
+    url = f"http://127.0.0.1:{server.server_port}/{TABLE}"
+    dest = str(tmp_path / "table.parquet")
+    fetcher = RangeFetcher(connections=1, max_retries=0, timeout=10)
+
+    server.drop_after = 100_000
+    with pytest.raises(Exception):
+        fetcher.download(url, dest, size=len(data), key="v1")
+    assert not os.path.exists(dest) and os.path.exists(dest + ".part.json")
+
+    server.drop_after = None
+    server.log.clear()
+    fetcher.download(url, dest, size=len(data), sha256=hashlib.sha256(data).hexdigest(), key="v1")
+    with open(dest, "rb") as f:
+        assert f.read() == data
+    assert server.log == [("GET", f"bytes=100000-{len(data) - 1}")]
+    assert not os.path.exists(dest + ".part") and not os.path.exists(dest + ".part.json")
+
+
+def test_checksum_mismatch_discards_the_download(server, tmp_path):
+    server.corrupt = True
+    cache = make_cache(server, tmp_path / "raw")
+    with pytest.raises(IOError, match="Checksum mismatch"):
+        cache.path_for(DATASET, TABLE)
+    assert os.listdir(os.path.join(cache.root, hf_cache.BLOB_DIR)) == []
+    assert cache.lookup(DATASET, TABLE) is None
+
+
+@pytest.mark.parametrize("hide_size", [False, True])
+@pytest.mark.parametrize("footer_guess", [64 * 1024, 16])
+def test_read_footer_with_and_without_a_known_size(server, tmp_path, monkeypatch, hide_size, footer_guess):
+    server.hide_size = hide_size
+    monkeypatch.setattr(hf_cache, "FOOTER_GUESS", footer_guess)  # 16: the footer takes a second request
+    cache = make_cache(server, tmp_path / "raw")
+
+    meta = pq.read_metadata(pa.BufferReader(cache.read_footer(DATASET, TABLE)))
+    assert meta.num_rows == ROWS
+    assert meta.schema.to_arrow_schema().names == ["id", "repo_id"]
+    gets = [rng for method, rng in server.log if method == "GET"]
+    assert all(rng.startswith("bytes=-") for rng in gets)
+    assert len(gets) == (1 if footer_guess > 1024 else 2)
+    assert cache.lookup(DATASET, TABLE) is None  # nothing downloaded
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from task_type_rules import infer_task_type, infer_task_types
+
+TITLES = [
+    "fix: handle empty input",
+    "feat(api): add pagination",
+    "feat(ui)!: drop legacy theme",
+    "Fix typo in README",
+    "FEAT: Uppercase prefix",
+    "bug: add feature flag",          # first rule in RULES order wins, not the leftmost match
+    "Add feature to fix the bug",
+    "prefix-fix: hyphenated",
+    "fixes #12",                      # no word boundary after "fix"
+    "Refactor tests",
+    "docs: update readme",
+    "chore(deps): bump numpy",
+    "ci: cache wheels",
+    "Revert \"feat: x\"",
+    "perf: faster scan",
+    "lint only",
+    "build: pin pyarrow",
+    "Improve performance of test suite",
+    "Update dependencies",
+    "multi\nline fix",
+    "",
+    "   ",
+    None,
+    np.nan,
+    "fix: handle empty input",        # duplicates are classified once
+]
+
+
+def expected(titles: pd.Series) -> list:
+    return [infer_task_type(t if isinstance(t, str) else None) for t in titles]
+
+
+@pytest.mark.parametrize("dtype", [object, "string[pyarrow]", "category"])
+def test_infer_task_types_matches_row_by_row(dtype):
+    titles = pd.Series(TITLES, dtype=dtype, index=np.arange(len(TITLES)) * 3)
+    out = infer_task_types(titles)
+    assert out.tolist() == expected(titles.astype(object))
+    assert out.index.equals(titles.index)
+
+
+def test_infer_task_types_edge_cases():
+    out = infer_task_types(pd.Series(["fix: a", "feat(core): b", "bug: add feature", "", None], dtype=object))
+    assert out.tolist() == ["bugfix", "feature", "feature", "unknown", "unknown"]
+    assert infer_task_types(pd.Series([], dtype=object)).tolist() == []
+    assert infer_task_types(pd.Series([None, np.nan], dtype=object)).tolist() == ["unknown", "unknown"]